@@ -1,5 +1,9 @@
 # auth.py
 
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import os
@@ -9,7 +13,9 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 # --- Local Imports ---
 from app.database import get_db
@@ -23,9 +29,15 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "a_very_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# bcrypt runs at most this many hashes at once, off the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+# Authenticated users are looked up at most once per TTL; 0 disables the cache
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
 
 # --- Password Hashing ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_hash_executor = ThreadPoolExecutor(max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix="bcrypt")
 
 # --- Security Scheme ---
 security = HTTPBearer()
@@ -38,6 +50,94 @@ def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bcrypt thread pool, so the event loop keeps serving requests."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the bcrypt thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+# --- User Cache ---
+class UserCache:
+    """In-process TTL cache of UserResponse objects by user id."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: dict[int, tuple[float, UserResponse]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserResponse]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[1]
+
+    def put(self, user_id: int, user: UserResponse):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop expired entries first, then the oldest ones.
+                now = time.monotonic()
+                for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+                    del self._entries[key]
+                while len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, user)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Forgets one user, or every user when `user_id` is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+
+# Changed users are collected at flush time and dropped from the cache once the
+# transaction commits, when other sessions can see the change; a rollback drops nothing.
+# Bulk Query.update()/Query.delete() on users bypass the flush and must call
+# user_cache.invalidate() themselves.
+_CHANGED_USERS = "changed_user_ids"
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault(_CHANGED_USERS, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop(_CHANGED_USERS, ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop(_CHANGED_USERS, None)
+
+def _load_user(db: Session, user_id: int) -> Optional[UserResponse]:
+    user = db.query(User).filter(User.id == user_id).first()
+    return UserResponse.from_orm(user) if user else None
+
+async def get_user_by_id(db: Session, user_id: int) -> Optional[UserResponse]:
+    """Returns the user from the cache, loading it in the thread pool on a miss."""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await run_in_threadpool(_load_user, db, user_id)
+        if user is not None:
+            user_cache.put(user_id, user)
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a JWT access token."""
     to_encode = data.copy()
@@ -75,10 +175,10 @@ async def get_current_user(
     except (JWTError, KeyError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await get_user_by_id(db, token_data.user_id)
     if user is None:
         raise credentials_exception
-    return UserResponse.from_orm(user)
+    return user
 
 def get_current_admin_user(current_user: UserResponse = Depends(get_current_user)):
     """
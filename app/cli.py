@@ -0,0 +1,69 @@
+# app/cli.py
+
+import argparse
+import json
+import logging
+import os
+from dataclasses import asdict
+
+# --- Local Imports ---
+from app.logging_config import setup_logging
+from app.config import settings
+from app.services.bulk_processor import process_archive
+from app.services.llm_client import LlmClient
+from app.services.pipeline import shutdown_process_pools
+
+logger = logging.getLogger(__name__)
+
+
+def run_bulk(args: argparse.Namespace):
+    """Processes an .eml directory or mbox file offline and writes the results as JSONL."""
+    overrides = {}
+    if args.workers:
+        # Parsing, PDF text and OCR are the CPU-bound stages; give each a process per worker.
+        overrides = {
+            "PIPELINE_PARSE_WORKERS": args.workers,
+            "PIPELINE_PDF_WORKERS": args.workers,
+            "PIPELINE_OCR_WORKERS": args.workers,
+            "OCR_PROCESS_WORKERS": args.workers,
+        }
+    bulk_settings = settings.model_copy(update=overrides)
+    groq_client = LlmClient(bulk_settings)
+    try:
+        summary = process_archive(
+            bulk_settings, groq_client, args.archive, args.output, dry_run=args.dry_run, resume=args.resume
+        )
+    finally:
+        shutdown_process_pools()
+        groq_client.close()
+    print(json.dumps(asdict(summary), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email Processor command-line tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bulk = commands.add_parser(
+        "bulk", help="process archived messages (.eml directory or mbox file) without IMAP"
+    )
+    bulk.add_argument("archive", help="a directory of .eml files (searched recursively) or an mbox file")
+    bulk.add_argument("--output", required=True, help="JSONL file that gets one result line per message")
+    bulk.add_argument("--dry-run", action="store_true", help="find recipients but send nothing over SMTP")
+    bulk.add_argument(
+        "--resume", action="store_true",
+        help="append to --output, skipping messages already done in it (failed ones are retried) and resuming mbox "
+        "files at the last offset reached",
+    )
+    bulk.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="processes for parsing, PDF text and OCR (default: one per CPU core; 0 keeps the configured values)",
+    )
+    bulk.set_defaults(handler=run_bulk)
+
+    args = parser.parse_args()
+    setup_logging()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
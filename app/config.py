@@ -1,9 +1,7 @@
 # app/config.py
 
-import os
-import platform
 import logging
-import pytesseract
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 from typing import Optional
@@ -12,24 +10,139 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+class MailSource(BaseModel):
+    """An IMAP account and folder to process. Unset connection fields fall back to the IMAP_* settings."""
+    name: str
+    folder: str = "INBOX"
+    imap_server: Optional[str] = None
+    imap_port: Optional[int] = None
+    imap_ssl: Optional[bool] = None
+    imap_user: Optional[str] = None
+    imap_password: Optional[str] = None
+    max_concurrency: int = 1  # shards of this source processed at the same time
+
 class Settings(BaseSettings):
     # IMAP Settings
     IMAP_SERVER: str
+    IMAP_PORT: int = 993
+    IMAP_SSL: bool = True  # plain IMAP only for local test servers
     IMAP_USER: str
     IMAP_PASSWORD: str
+    IMAP_FETCH_BATCH_SIZE: int = 25
+    # Attachments larger than this (encoded) are forwarded but their text is not extracted
+    IMAP_MAX_ATTACHMENT_BYTES: int = 25 * 1024 * 1024
+    # Parts larger than this are fetched in pieces of this size
+    IMAP_PARTIAL_FETCH_BYTES: int = 1024 * 1024
+    # Part payloads above this size are spooled to a temporary file
+    MIME_SPOOL_THRESHOLD_BYTES: int = 1024 * 1024
+    # HTML bodies are cut to this size before text extraction
+    HTML_MAX_BYTES: int = 2 * 1024 * 1024
+
+    # Background IMAP IDLE worker (started with the app when enabled)
+    IMAP_IDLE_ENABLED: bool = False
+    IMAP_IDLE_TIMEOUT_SECONDS: float = 600.0
+    IMAP_IDLE_RECONNECT_SECONDS: float = 30.0
 
     # SMTP Settings
     SMTP_SERVER: str
     SMTP_PORT: int
+    SMTP_STARTTLS: bool = True  # plain SMTP only for local test servers
     SENDER_EMAIL: str
     SENDER_PASSWORD: str
 
     # Groq API Key
     GROQ_API_KEY: str
+    GROQ_BASE_URL: Optional[str] = None
+
+    # Groq client: concurrent requests (adapted down on 429s), request rate,
+    # per-call timeout and retries with jittered exponential backoff
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_REQUESTS_PER_MINUTE: float = 30.0
+    LLM_TIMEOUT_SECONDS: float = 30.0
+    LLM_MAX_RETRIES: int = 4
+    LLM_BACKOFF_BASE_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 30.0
     
     # --- ADD THIS LINE ---
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Processing ledger: known messages are skipped, or retried per these policies
+    LEDGER_ENABLED: bool = True
+    LEDGER_RETRY_FAILED_AFTER_SECONDS: float = 900.0
+    LEDGER_MAX_ATTEMPTS: int = 5
+    LEDGER_RETRY_NO_RECIPIENT_AFTER_SECONDS: Optional[float] = None
+    LEDGER_RETRY_UNCERTAIN_SENDS: bool = False
+
+    # Mailbox/folder sources (a JSON list of MailSource objects). When set, /process-emails
+    # processes these instead of INBOX, in shards of SOURCE_SHARD_SIZE UIDs spread over
+    # SOURCE_WORKER_PROCESSES worker processes
+    MAIL_SOURCES: list[MailSource] = []
+    SOURCE_WORKER_PROCESSES: int = 2
+    SOURCE_SHARD_SIZE: int = 25
+
+    # Import the PDF/OCR/Groq libraries in the background right after startup,
+    # instead of on the first processing job
+    WARM_UP_ON_STARTUP: bool = True
+
+    # Background processing jobs
+    JOB_WORKERS: int = 4
+    JOB_HISTORY_SIZE: int = 100
+    JOB_STREAM_POLL_SECONDS: float = 0.5
+
+    # Processing pipeline (workers per stage, bounded queue size between stages)
+    PIPELINE_QUEUE_SIZE: int = 16
+    PIPELINE_FETCH_WORKERS: int = 4
+    PIPELINE_PARSE_WORKERS: int = 2
+    PIPELINE_PDF_WORKERS: int = 2
+    PIPELINE_OCR_WORKERS: int = 2
+    PIPELINE_LLM_WORKERS: int = 4
+    PIPELINE_SMTP_WORKERS: int = 2
+
+    # OCR engine process pool size (0 = one process per CPU core)
+    OCR_PROCESS_WORKERS: int = 0
+    # Selective OCR: pages with at least OCR_MIN_TEXT_CHARS of text layer are
+    # skipped unless images cover OCR_IMAGE_COVERAGE_THRESHOLD of the page.
+    # Chosen pages are rendered at OCR_RENDER_DPI (capped at OCR_MAX_PAGE_PIXELS)
+    # and at most OCR_MAX_PAGES pages are OCR'd per document.
+    OCR_MIN_TEXT_CHARS: int = 200
+    OCR_IMAGE_COVERAGE_THRESHOLD: float = 0.5
+    OCR_RENDER_DPI: int = 200
+    OCR_MAX_PAGE_PIXELS: int = 20_000_000
+    OCR_MAX_PAGES: int = 10
+
+    # Text is extracted from every PDF and image (PNG/JPEG/TIFF) attachment, all of a
+    # message's attachments at once, up to ATTACHMENT_MAX_COUNT of them and
+    # ATTACHMENT_MAX_BYTES_PER_MESSAGE (encoded) in total, within
+    # ATTACHMENT_EXTRACTION_TIMEOUT_SECONDS per message. Every attachment is forwarded.
+    ATTACHMENT_MAX_COUNT: int = 10
+    ATTACHMENT_MAX_BYTES_PER_MESSAGE: int = 50 * 1024 * 1024
+    ATTACHMENT_EXTRACTION_TIMEOUT_SECONDS: float = 120.0
+
+    # Content-addressed cache for PDF text and OCR results
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_PATH: str = "cache/extraction_cache.sqlite3"
+    EXTRACTION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Local recipient extraction that skips the Groq call when confident enough
+    FAST_PATH_ENABLED: bool = True
+    FAST_PATH_CONFIDENCE_THRESHOLD: float = 0.8
+
+    # Estimated tokens of email/PDF/OCR text per LLM prompt; longer inputs are
+    # ranked and trimmed, or split into at most LLM_MAP_REDUCE_MAX_CHUNKS calls
+    LLM_PROMPT_TOKEN_BUDGET: int = 6000
+    LLM_MAP_REDUCE_MAX_CHUNKS: int = 4
+
+    # Memoized Groq results keyed by normalized prompt + model (LLM_CACHE_PATH enables on-disk backing)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_TTL_SECONDS: float = 24 * 60 * 60
+    LLM_CACHE_PATH: Optional[str] = None
+
+    # Pooled, reused SMTP sessions for outgoing forwards
+    SMTP_POOL_SIZE: int = 2
+    SMTP_NOOP_AFTER_SECONDS: float = 30.0
+
     class Config:
         env_file = ".env"
         extra = "ignore"
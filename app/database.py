@@ -8,10 +8,31 @@ import os
 # The DATABASE_URL will be read from your .env file
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- Connection Pool ---
+# Connections kept open, extra ones allowed under load, how long a request waits
+# for one, and the age after which a connection is replaced
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+# Checks each connection with a cheap round trip before handing it out
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Whether loaded objects are re-read from the database after every commit
+DB_EXPIRE_ON_COMMIT = os.getenv("DB_EXPIRE_ON_COMMIT", "true").lower() in ("1", "true", "yes")
+
+engine_options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE_SECONDS}
+if SQLALCHEMY_DATABASE_URL and not SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # SQLite's default pools take no size limits
+    engine_options.update(
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS
+    )
+
 # Remove the SQLite-specific connect_args from this call
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=DB_EXPIRE_ON_COMMIT, bind=engine
+)
 
 Base = declarative_base()
 
@@ -21,4 +42,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -1,59 +1,122 @@
 # app/main.py
 
 import logging
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import threading
+import time
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-import groq
+from starlette.concurrency import run_in_threadpool
 
 # --- Local Imports ---
 from app.logging_config import setup_logging
 from app.config import settings
+from app.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, REGISTRY
 from app.services.email_processor import process_unseen_emails
-from app.schemas.app_schemas import ProcessingReport
+from app.services.idle_worker import IdleWorker
+from app.services.jobs import JobManager, ProcessingJob
+from app.services.llm_client import LlmClient
+from app.services.pipeline import shutdown_process_pools
+from app.services.source_scheduler import process_sources
+from app.services.warmup import warm_up
+from app.schemas.app_schemas import JobResponse, ProcessingReport, SourceReport
 from app.auth import (
     get_current_user,
     get_current_admin_user,
     create_access_token,
-    verify_password,
-    get_password_hash
+    get_password_hash_async,
+    verify_password_async
 )
 from app.schemas.user_schemas import UserResponse, Token, UserCreate, UserLogin # <-- CORRECTED LINE
 from app.database import get_db, Base, engine
 from app.models.users import User
 
-# --- SETUP LOGGING & DATABASE ---
+# --- SETUP LOGGING ---
 setup_logging()
 logger = logging.getLogger(__name__)
-# This creates the database tables if they don't exist on startup
-Base.metadata.create_all(bind=engine)
-
-# --- Initialize Groq Client ---
-try:
-    logger.info("Initializing Groq client...")
-    groq_client = groq.Groq(api_key=settings.GROQ_API_KEY)
-    logger.info("Groq client initialized successfully.")
-except Exception as e:
-    logger.error(f"FATAL: Could not initialize Groq client. {e}", exc_info=True)
-    groq_client = None
+
+# Created in the lifespan, so importing the app stays cheap.
+groq_client: Optional[LlmClient] = None
+
+# --- Background Processing Jobs ---
+job_manager = JobManager(max_workers=settings.JOB_WORKERS, history_size=settings.JOB_HISTORY_SIZE)
+
+# --- Application Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates the database tables and the Groq client, and starts the IMAP IDLE worker when it is enabled."""
+    global groq_client
+    # This creates the database tables if they don't exist on startup
+    Base.metadata.create_all(bind=engine)
+
+    # --- Initialize Groq Client ---
+    try:
+        logger.info("Initializing Groq client...")
+        groq_client = LlmClient(settings)
+        logger.info("Groq client initialized successfully.")
+    except Exception as e:
+        logger.error(f"FATAL: Could not initialize Groq client. {e}", exc_info=True)
+        groq_client = None
+
+    if settings.WARM_UP_ON_STARTUP:
+        # In the background: startup does not wait for the PDF/OCR/Groq libraries.
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    idle_worker = None
+    if settings.IMAP_IDLE_ENABLED and groq_client:
+        idle_worker = IdleWorker(settings=settings, groq_client=groq_client)
+        idle_worker.start()
+    yield
+    if idle_worker:
+        idle_worker.stop()
+    job_manager.shutdown()
+    shutdown_process_pools()
+    if groq_client:
+        groq_client.close()
+
 
 # --- Create FastAPI app instance ---
 app = FastAPI(
-    title="Email Processing API with Authentication"
+    title="Email Processing API with Authentication",
+    lifespan=lifespan
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Records the latency of every request, labelled by route template rather than raw path."""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=str(response.status_code),
+    ).observe(time.perf_counter() - started)
+    return response
+
+
 # --- AUTHENTICATION ENDPOINTS ---
 @app.post("/users/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
     """
     Endpoint to register a new user.
     """
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await run_in_threadpool(_find_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     new_user = User(email=user.email, hashed_password=hashed_password)
+    return await run_in_threadpool(_add_user, db, new_user)
+
+def _find_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
+def _add_user(db: Session, new_user: User) -> User:
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
@@ -67,8 +130,8 @@ async def login_for_access_token(
     """
     Authenticates a user with email and password and returns a JWT access token.
     """
-    user = db.query(User).filter(User.email == user_credentials.email).first()
-    if not user or not verify_password(user_credentials.password, user.hashed_password):
+    user = await run_in_threadpool(_find_user_by_email, db, user_credentials.email)
+    if not user or not await verify_password_async(user_credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -86,10 +149,53 @@ async def login_for_access_token(
 
 # --- PROTECTED APPLICATION ENDPOINTS ---
 
-@app.post("/process-emails", response_model=ProcessingReport, status_code=status.HTTP_200_OK)
+def _source_reports(job: ProcessingJob) -> list[SourceReport]:
+    reports: dict[str, SourceReport] = {}
+    for result in job.results:
+        if result.source is None:
+            continue
+        report = reports.setdefault(result.source, SourceReport(source=result.source))
+        report.processed_count += 1
+        if "successfully" in result.status:
+            report.sent_count += 1
+        elif result.status.startswith("Failed"):
+            report.failed_count += 1
+    return list(reports.values())
+
+
+def _job_response(job: ProcessingJob, attached: bool = False) -> JobResponse:
+    report = None
+    if job.status == "completed":
+        report = ProcessingReport(
+            message=f"Processing complete for user {job.requested_by}.",
+            processed_count=len(job.results),
+            sent_count=job.sent_count,
+            fast_path_count=sum(1 for res in job.results if res.extraction_path == "fast_path"),
+            sources=_source_reports(job),
+            results=job.results
+        )
+    return JobResponse(
+        job_id=job.id,
+        mailbox=job.mailbox,
+        status=job.status,
+        attached=attached,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        processed_count=len(job.results),
+        sent_count=job.sent_count,
+        failed_count=job.failed_count,
+        error=job.error,
+        report=report
+    )
+
+
+@app.post("/process-emails", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
 def trigger_email_processing(current_user: UserResponse = Depends(get_current_user)):
     """
-    Triggers the email processing service. Requires user authentication.
+    Starts email processing as a background job and returns its ID right away.
+    If a job for the mailbox is already running, that job is returned instead.
+    Requires user authentication.
     """
     logger.info(f"Endpoint /process-emails called by user: {current_user.email}")
 
@@ -99,21 +205,63 @@ def trigger_email_processing(current_user: UserResponse = Depends(get_current_us
             detail="Groq client is not initialized."
         )
 
-    try:
-        results = process_unseen_emails(settings=settings, groq_client=groq_client)
-        sent_count = sum(1 for res in results if "successfully" in res.status)
-        return ProcessingReport(
-            message=f"Processing complete for user {current_user.email}.",
-            processed_count=len(results),
-            sent_count=sent_count,
-            results=results
-        )
-    except Exception as e:
-        logger.error(f"An unexpected error occurred in the main endpoint: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
+    if settings.MAIL_SOURCES:
+        # Every configured source, sharded over worker processes with Groq clients of their own.
+        mailbox = ",".join(source.name for source in settings.MAIL_SOURCES)
+        work = lambda on_result: process_sources(settings, settings.MAIL_SOURCES, on_result=on_result)
+    else:
+        mailbox = settings.IMAP_USER
+        work = lambda on_result: process_unseen_emails(settings=settings, groq_client=groq_client, on_result=on_result)
+    job, created = job_manager.submit(mailbox=mailbox, requested_by=current_user.email, work=work)
+    if not created:
+        logger.info(f"Attaching user {current_user.email} to running job {job.id}.")
+    return _job_response(job, attached=not created)
+
+
+def _get_job_or_404(job_id: str) -> ProcessingJob:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse, status_code=status.HTTP_200_OK)
+def get_job(job_id: str, current_user: UserResponse = Depends(get_current_user)):
+    """
+    Returns the status and counters of a processing job.
+    """
+    return _job_response(_get_job_or_404(job_id))
+
+
+@app.get("/jobs/{job_id}/results")
+async def stream_job_results(job_id: str, current_user: UserResponse = Depends(get_current_user)):
+    """
+    Streams each ProcessingResult of a job as NDJSON as soon as it finishes.
+    The stream ends with a final line holding the job status.
+    """
+    job = _get_job_or_404(job_id)
+
+    async def result_lines():
+        sent = 0
+        while True:
+            finished = job.finished
+            for result in job.results_since(sent):
+                sent += 1
+                yield result.model_dump_json() + "\n"
+            if finished:
+                yield _job_response(job).model_dump_json(exclude={"report"}) + "\n"
+                return
+            await asyncio.sleep(settings.JOB_STREAM_POLL_SECONDS)
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(current_user: UserResponse = Depends(get_current_user)):
+    """
+    Returns per-stage processing metrics and HTTP latencies in Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 @app.get("/admin/dashboard", status_code=status.HTTP_200_OK)
@@ -0,0 +1,269 @@
+# app/metrics.py
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Prometheus text exposition format, version 0.0.4.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def drain(self) -> dict[tuple[str, ...], object]:
+        """Returns the state of every series and resets it, so it can be merged into another process's metric."""
+        with self._lock:
+            children = list(self._children.items())
+        return {key: child.drain() for key, child in children}
+
+    def merge(self, drained: dict[tuple[str, ...], object]):
+        """Adds the state returned by `drain` (in another process) to this metric."""
+        for key, state in drained.items():
+            self.labels(**dict(zip(self.labelnames, key))).merge(state)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def drain(self) -> float:
+        with self._lock:
+            value, self.value = self.value, 0.0
+        return value
+
+    def merge(self, value: float):
+        self.inc(value)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, one series per label combination."""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def snapshot(self) -> dict[tuple[str, ...], float]:
+        """Returns the current value of each series, keyed by its label values."""
+        with self._lock:
+            return {key: child.value for key, child in self._children.items()}
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            children = list(self._children.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in children
+        ]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def drain(self) -> tuple[list[int], float]:
+        with self._lock:
+            state = (self.counts, self.sum)
+            self.counts, self.sum = [0] * (len(self.buckets) + 1), 0.0
+        return state
+
+    def merge(self, state: tuple[list[int], float]):
+        counts, total = state
+        with self._lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+            self.sum += total
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, one series per label combination."""
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def snapshot(self) -> dict[tuple[str, ...], tuple[int, float]]:
+        """Returns (count, sum) of each series, keyed by its label values."""
+        with self._lock:
+            children = list(self._children.items())
+        return {key: (sum(child.counts), child.sum) for key, child in children}
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, child in children:
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The set of metrics rendered by the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def drain(self) -> dict[str, dict]:
+        """
+        Returns what was recorded since the last drain, by metric name, and resets it.
+
+        Worker processes have a registry of their own that /metrics never
+        sees; they drain it after each task and the API process `merge`s it.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return {metric.name: state for metric in metrics if (state := metric.drain())}
+
+    def merge(self, drained: dict[str, dict]):
+        with self._lock:
+            by_name = {metric.name: metric for metric in self._metrics}
+        for name, state in drained.items():
+            if name in by_name:
+                by_name[name].merge(state)
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def observe_outcome(histogram: Histogram, outcome: Optional[str] = None, **labels: str) -> Iterator[None]:
+    """Times the block into `histogram`, labelled outcome="ok" or "error" (unless `outcome` is given)."""
+    started = time.perf_counter()
+    result = outcome or "ok"
+    try:
+        yield
+    except Exception:
+        result = "error"
+        raise
+    finally:
+        histogram.labels(outcome=result, **labels).observe(time.perf_counter() - started)
+
+
+# --- Application Metrics ---
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "email_pipeline_stage_seconds", "Time spent in each processing pipeline stage per message.", ("stage", "outcome")
+)
+EMAILS_PROCESSED = Counter(
+    "email_messages_processed_total", "Messages that finished processing, by outcome.", ("outcome",)
+)
+IMAP_OPERATION_SECONDS = Histogram(
+    "email_imap_operation_seconds", "Latency of IMAP commands.", ("operation", "outcome")
+)
+HTML_CLEANUP_SECONDS = Histogram(
+    "email_html_cleanup_seconds", "Time spent turning HTML bodies into text.", ("outcome",)
+)
+OCR_PAGE_SECONDS = Histogram(
+    "email_ocr_page_seconds", "Render and Tesseract time per OCR'd PDF page.", ("outcome",)
+)
+GROQ_REQUEST_SECONDS = Histogram(
+    "email_groq_request_seconds", "Latency of individual Groq requests.", ("outcome",)
+)
+GROQ_TOKENS = Counter("email_groq_tokens_total", "Tokens reported by Groq usage.", ("kind",))
+SMTP_SEND_SECONDS = Histogram(
+    "email_smtp_send_seconds", "SMTP send time, excluding the wait for a pooled session.", ("outcome",)
+)
+SMTP_WAIT_SECONDS = Histogram("email_smtp_pool_wait_seconds", "Time spent waiting for a pooled SMTP session.")
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
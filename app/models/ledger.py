@@ -0,0 +1,38 @@
+# app/models/ledger.py
+
+import enum
+from sqlalchemy import JSON, BigInteger, Boolean, Column, DateTime, Enum, Integer, String, Text, UniqueConstraint, func
+from app.database import Base
+
+class LedgerOutcome(str, enum.Enum):
+    """Enumeration for the last known outcome of a processed message."""
+    SENDING = "sending"  # SMTP send started; unknown whether it completed
+    SENT = "sent"
+    NO_RECIPIENT = "no_recipient"
+    FAILED = "failed"
+
+class ProcessedMessage(Base):
+    """SQLAlchemy model for the 'processing_ledger' table (one row per processed message)."""
+    __tablename__ = "processing_ledger"
+    __table_args__ = (UniqueConstraint("mailbox", "uid_validity", "uid", name="uq_ledger_mailbox_uid"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    mailbox = Column(String, nullable=False, index=True)
+    uid_validity = Column(BigInteger, nullable=False)
+    uid = Column(BigInteger, nullable=False)
+    message_id = Column(String, index=True)
+
+    outcome = Column(Enum(LedgerOutcome), nullable=False)
+    flagged = Column(Boolean, default=False, nullable=False)  # \Seen stored on the server
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text)
+
+    source_from = Column(String)
+    source_subject = Column(String)
+    recipient_email = Column(String)
+    physical_address = Column(Text)
+    extraction_path = Column(String)
+    stage_timings = Column(JSON)  # stage name -> seconds, from the last attempt
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,14 @@
+# app/models/mailbox.py
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, func
+from app.database import Base
+
+class MailboxCheckpoint(Base):
+    """SQLAlchemy model for the 'mailbox_checkpoints' table (UID watermark per mailbox)."""
+    __tablename__ = "mailbox_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    mailbox = Column(String, unique=True, index=True, nullable=False)
+    uid_validity = Column(BigInteger, nullable=False)
+    last_uid = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,16 +1,45 @@
 # app/schemas/app_schemas.py
 
+from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Optional
 
 class ProcessingResult(BaseModel):
+    source: Optional[str] = None  # name of the mail source, when several are configured
     source_from: Optional[str] = None
     source_subject: Optional[str] = None
     status: str
     details: Optional[str] = None
+    extraction_path: Optional[str] = None  # "fast_path" or "llm"
+    prompt_tokens: Optional[int] = None  # estimated tokens sent to the LLM
+    processing_seconds: Optional[float] = None  # from entering the pipeline to completion
+
+class SourceReport(BaseModel):
+    """Counters of one mail source within a processing run."""
+    source: str
+    processed_count: int = 0
+    sent_count: int = 0
+    failed_count: int = 0
 
 class ProcessingReport(BaseModel):
     message: str
     processed_count: int
     sent_count: int
-    results: List[ProcessingResult]
\ No newline at end of file
+    fast_path_count: int = 0
+    sources: List[SourceReport] = []
+    results: List[ProcessingResult]
+
+class JobResponse(BaseModel):
+    """Status and counters of a background processing job."""
+    job_id: str
+    mailbox: str
+    status: str
+    attached: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    processed_count: int = 0
+    sent_count: int = 0
+    failed_count: int = 0
+    error: Optional[str] = None
+    report: Optional[ProcessingReport] = None
\ No newline at end of file
@@ -0,0 +1,213 @@
+# app/services/attachments.py
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from app.services.extraction_cache import PDF_TEXT, ExtractionCache
+from app.services.mime_stream import FetchedMessage, FetchedPart, PartInfo, decode_to_file
+from app.services.ocr_engine import OcrEngine
+
+logger = logging.getLogger(__name__)
+
+# Attachment kinds text can be extracted from.
+PDF = "pdf"
+IMAGE = "image"
+
+_CONTENT_TYPES = {
+    "application/pdf": PDF,
+    "image/png": IMAGE,
+    "image/jpeg": IMAGE,
+    "image/pjpeg": IMAGE,
+    "image/tiff": IMAGE,
+}
+# For attachments sent as application/octet-stream.
+_EXTENSIONS = {".pdf": PDF, ".png": IMAGE, ".jpg": IMAGE, ".jpeg": IMAGE, ".tif": IMAGE, ".tiff": IMAGE}
+
+
+def attachment_kind(info: PartInfo) -> Optional[str]:
+    """Returns the extraction kind of an attachment (PDF or IMAGE), or None when it is forwarded only."""
+    kind = _CONTENT_TYPES.get(info.content_type)
+    if kind is None and info.content_type == "application/octet-stream" and info.filename:
+        kind = _EXTENSIONS.get(os.path.splitext(info.filename)[1].lower())
+    return kind
+
+
+def find_attachments(fetched: FetchedMessage) -> list[FetchedPart]:
+    """Returns every named attachment of a message, in message order."""
+    return [part for part in fetched.parts if part.info.disposition == "attachment" and part.info.filename]
+
+
+def extract_pdf_page_texts(pdf_path: str) -> list[str]:
+    """Returns the text layer of each page of a PDF file."""
+    import fitz  # loaded on first use, in the worker process
+
+    with fitz.open(pdf_path) as pdf_doc:
+        return [page.get_text() for page in pdf_doc]
+
+
+@dataclass(frozen=True)
+class AttachmentBudget:
+    """Per-message limits on attachment extraction; attachments beyond them are still forwarded."""
+    max_count: int = 10
+    max_bytes: int = 50 * 1024 * 1024  # encoded size, summed over the extracted attachments
+    max_attachment_bytes: int = 25 * 1024 * 1024  # encoded size of any one attachment
+    timeout_seconds: float = 120.0  # text layers and OCR together
+
+
+@dataclass
+class ExtractedAttachment:
+    """Text found in one attachment, and the decoded copy it was read from."""
+    part: FetchedPart
+    kind: str
+    path: Optional[str] = None
+    key: Optional[str] = None
+    page_texts: list[str] = field(default_factory=list)
+    ocr_text: str = ""
+    error: Optional[str] = None
+    task: Optional[Future] = field(default=None, repr=False)  # the text extraction or OCR reading `path`
+
+    @property
+    def filename(self) -> str:
+        return self.part.info.filename
+
+
+class AttachmentExtractor:
+    """
+    Extracts text from every supported attachment of a message concurrently.
+
+    `prepare` decodes each attachment within the message's budget and reads
+    the text layer of the PDFs; `ocr` then OCRs the pages that need it and
+    every image (each frame of a multi-frame TIFF). Attachments are handled
+    side by side on a shared thread pool that only waits on the process
+    pools doing the work, so a message takes as long as its largest
+    attachment rather than the sum of all of them. Whatever is not done by
+    the message's deadline is dropped from the analysis and noted: its OCR
+    pages still queued are cancelled, and its decoded copy is removed once
+    the task reading it has finished.
+    """
+
+    def __init__(
+        self,
+        ocr_engine: OcrEngine,
+        cache: Optional[ExtractionCache] = None,
+        budget: Optional[AttachmentBudget] = None,
+        max_workers: int = 8,
+    ):
+        self.ocr_engine = ocr_engine
+        self.cache = cache
+        self.budget = budget or AttachmentBudget()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="attachments")
+
+    def deadline(self) -> float:
+        """Returns the `time.monotonic()` by which a message starting extraction now has to be done."""
+        return time.monotonic() + self.budget.timeout_seconds
+
+    def select(self, attachments: list[FetchedPart]) -> tuple[list[ExtractedAttachment], list[str]]:
+        """Picks the attachments to extract within the count and byte budget; returns them and notes on the rest."""
+        selected, notes, total_bytes = [], [], 0
+        for part in attachments:
+            kind = attachment_kind(part.info)
+            if kind is None:
+                continue
+            if part.info.size > self.budget.max_attachment_bytes:
+                notes.append(f"'{part.info.filename}' not extracted: larger than {self.budget.max_attachment_bytes} bytes")
+                continue
+            if len(selected) >= self.budget.max_count:
+                notes.append(f"'{part.info.filename}' not extracted: more than {self.budget.max_count} attachments")
+                continue
+            if total_bytes + part.info.size > self.budget.max_bytes:
+                notes.append(f"'{part.info.filename}' not extracted: attachment byte budget of {self.budget.max_bytes} exceeded")
+                continue
+            total_bytes += part.info.size
+            selected.append(ExtractedAttachment(part=part, kind=kind))
+        return selected, notes
+
+    def prepare(self, attachments: list[ExtractedAttachment], run: Callable, deadline: float) -> list[str]:
+        """Decodes the attachments and reads the PDF text layers (in `run`'s processes); returns notes on failures."""
+        return self._run_all(
+            attachments, lambda attachment: self._prepare_one(attachment, run), deadline, "text extraction",
+            store=lambda attachment, page_texts: setattr(attachment, "page_texts", page_texts),
+        )
+
+    def ocr(self, attachments: list[ExtractedAttachment], deadline: float) -> list[str]:
+        """OCRs the attachments that were decoded; returns notes on failures."""
+        ready = [attachment for attachment in attachments if attachment.path and attachment.error is None]
+        return self._run_all(
+            ready, lambda attachment: self._ocr_one(attachment, deadline), deadline, "OCR",
+            store=lambda attachment, ocr_text: setattr(attachment, "ocr_text", ocr_text),
+        )
+
+    def release(self, attachments: list[ExtractedAttachment]):
+        """Removes the decoded copies of the attachments, each once no task is reading it any more."""
+        for attachment in attachments:
+            if attachment.task is not None and not attachment.task.done():
+                attachment.task.add_done_callback(lambda _, attachment=attachment: self.release([attachment]))
+                continue
+            if attachment.path:
+                try:
+                    os.remove(attachment.path)
+                except OSError as e:
+                    logger.warning(f"Could not remove temporary attachment {attachment.path}: {e}")
+                attachment.path = None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_all(
+        self,
+        attachments: list[ExtractedAttachment],
+        handler: Callable[[ExtractedAttachment], Any],
+        deadline: float,
+        step: str,
+        store: Callable[[ExtractedAttachment, Any], None],
+    ) -> list[str]:
+        """
+        Runs `handler` for every attachment until `deadline`.
+
+        A handler's result is only stored on its attachment (by `store`) when
+        it finished in time, so a late one cannot change what the message
+        was analyzed with.
+        """
+        futures: list[tuple[ExtractedAttachment, Future]] = []
+        for attachment in attachments:
+            attachment.task = self._executor.submit(handler, attachment)
+            futures.append((attachment, attachment.task))
+        if futures:
+            wait([future for _, future in futures], timeout=max(0.0, deadline - time.monotonic()))
+        notes = []
+        for attachment, future in futures:
+            if not future.done() or isinstance(future.exception(), TimeoutError):
+                future.cancel()
+                attachment.error = f"{step} timed out"
+                logger.warning(f"Attachment '{attachment.filename}': {step} did not finish within the time budget.")
+            elif future.exception() is not None:
+                attachment.error = f"{step} failed: {future.exception()}"
+                logger.error(f"Attachment '{attachment.filename}': {step} failed: {future.exception()}")
+            else:
+                store(attachment, future.result())
+            if attachment.error:
+                notes.append(f"'{attachment.filename}' {attachment.error}")
+        return notes
+
+    def _prepare_one(self, attachment: ExtractedAttachment, run: Callable) -> list[str]:
+        """Decodes the attachment to a file and returns the text layer of each page when it is a PDF."""
+        attachment.path, attachment.key = decode_to_file(attachment.part.payload, attachment.part.info.encoding)
+        if attachment.kind != PDF:
+            return []
+        cached = self.cache.get(PDF_TEXT, attachment.key) if self.cache else None
+        if cached is not None:
+            return json.loads(cached)
+        page_texts = run(extract_pdf_page_texts, attachment.path)
+        if self.cache:
+            self.cache.put(PDF_TEXT, attachment.key, json.dumps(page_texts))
+        return page_texts
+
+    def _ocr_one(self, attachment: ExtractedAttachment, deadline: float) -> str:
+        if attachment.kind == PDF:
+            return self.ocr_engine.ocr_pdf_file(attachment.path, attachment.key, attachment.page_texts, deadline)
+        return self.ocr_engine.ocr_image_file(attachment.path, attachment.key, deadline)
@@ -0,0 +1,298 @@
+# app/services/bulk_processor.py
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, Optional
+
+from app.config import Settings
+from app.metrics import EMAILS_PROCESSED, PIPELINE_STAGE_SECONDS
+from app.services.email_processor import (
+    EmailJob,
+    build_attachment_extractor,
+    build_ocr_engine,
+    build_stages,
+    open_extraction_cache,
+    record_failure,
+    release_job,
+)
+from app.services.llm_client import LlmClient
+from app.services.mime_stream import FetchedMessage, parse_mime_stream
+from app.services.pipeline import Pipeline
+from app.services.smtp_pool import SmtpPool
+
+logger = logging.getLogger(__name__)
+
+# mboxrd quoting: a body line ">From ..." (any number of '>') was written with one more '>'.
+_QUOTED_FROM = re.compile(rb"^>(>*From )")
+
+# Outcomes of result lines that a resumed run does not process again. Failed messages are
+# retried; a send interrupted before its outcome was known is not, since that may forward it twice.
+FINISHED_OUTCOMES = frozenset(("sent", "sending", "no_recipient", "dry_run"))
+
+
+@dataclass(frozen=True)
+class ArchivedMessage:
+    """Where one message lives in an archive: a byte range of an .eml or mbox file."""
+    path: str
+    offset: int
+    end_offset: int
+    mbox: bool = False
+
+    @property
+    def key(self) -> bytes:
+        return f"{self.path}@{self.offset}".encode()
+
+
+@dataclass
+class ArchiveProgress:
+    """What an earlier run already wrote: finished messages, and per file the offset to resume scanning at."""
+    done: set[tuple[str, int]] = field(default_factory=set)
+    resume_offsets: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class BulkSummary:
+    processed: int = 0
+    sent: int = 0
+    dry_run: int = 0
+    no_recipient: int = 0
+    failed: int = 0
+    skipped: int = 0  # already done in the output of an earlier run
+    elapsed_seconds: float = 0.0
+
+
+# --- Reading Archives ---
+
+def archive_files(path: str) -> list[str]:
+    """Returns the archive files under `path`: every .eml file of a directory (recursively), or the file itself."""
+    if not os.path.isdir(path):
+        return [os.path.abspath(path)]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend(os.path.abspath(os.path.join(root, name)) for name in sorted(names) if name.lower().endswith(".eml"))
+    return files
+
+
+def _is_mbox(path: str) -> bool:
+    if path.lower().endswith(".eml"):
+        return False
+    with open(path, "rb") as f:
+        return f.read(5) == b"From "
+
+
+def scan_archive(path: str, start: int = 0) -> Iterator[ArchivedMessage]:
+    """
+    Yields the messages of one archive file from byte offset `start` on.
+
+    An .eml file is one message. An mbox is split at "From " lines that
+    start the file (or `start`) or follow a blank line; only the boundaries
+    are read here, message bodies are streamed later.
+    """
+    size = os.path.getsize(path)
+    if not _is_mbox(path):
+        if start < size:
+            yield ArchivedMessage(path, 0, size)
+        return
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        position, offset, previous_blank = start, None, True
+        for line in f:
+            if previous_blank and line.startswith(b"From "):
+                if offset is not None:
+                    yield ArchivedMessage(path, offset, position, mbox=True)
+                offset = position
+            previous_blank = not line.strip()
+            position += len(line)
+        if offset is not None:
+            yield ArchivedMessage(path, offset, position, mbox=True)
+
+
+def message_lines(message: ArchivedMessage) -> Iterator[bytes]:
+    """Yields the lines of an archived message, without the mbox "From " line, separator and quoting."""
+    with open(message.path, "rb") as f:
+        f.seek(message.offset)
+        remaining = message.end_offset - message.offset
+        if message.mbox:
+            remaining -= len(f.readline())
+        previous: Optional[bytes] = None
+        while remaining > 0:
+            line = f.readline(remaining)
+            if not line:
+                break
+            remaining -= len(line)
+            if message.mbox:
+                line = _QUOTED_FROM.sub(rb"\1", line)
+            if previous is not None:
+                yield previous
+            previous = line
+        # In an mbox the blank line before the next "From " belongs to the separator.
+        if previous is not None and not (message.mbox and not previous.strip()):
+            yield previous
+
+
+def load_message(message: ArchivedMessage, spool_threshold: int) -> FetchedMessage:
+    """Parses an archived message into the same shape as one fetched over IMAP."""
+    fetched = parse_mime_stream(message_lines(message), spool_threshold)
+    fetched.uid = message.key
+    return fetched
+
+
+# --- Results and Resuming ---
+
+def _truncate_partial_line(output_path: str):
+    """Drops a last line left half-written by an interrupted run."""
+    with open(output_path, "rb+") as f:
+        data_end = f.seek(0, os.SEEK_END)
+        position = data_end
+        while position > 0:
+            step = min(64 * 1024, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != data_end:
+            logger.warning(f"Dropping {data_end - position} bytes of an incomplete last line in {output_path}.")
+            f.truncate(position)
+
+
+def read_progress(output_path: str) -> ArchiveProgress:
+    """
+    Reads the results of earlier runs from a JSONL output file.
+
+    A message counts as done when it has a result line with an outcome in
+    FINISHED_OUTCOMES (lines written before outcomes were recorded count
+    unless their status is a failure), so failed messages are processed
+    again. Per file, scanning resumes at the end of the unbroken run of
+    done messages from its start, since messages can finish out of order.
+    """
+    progress = ArchiveProgress()
+    spans: dict[str, dict[int, int]] = {}
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                path, offset, end_offset = record["source"], record["offset"], record["end_offset"]
+                outcome = record.get("outcome")
+                finished = outcome in FINISHED_OUTCOMES if outcome else not record["status"].startswith("Failed")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            if not finished:
+                continue
+            progress.done.add((path, offset))
+            spans.setdefault(path, {})[offset] = end_offset
+    for path, ends in spans.items():
+        offset = 0
+        while offset in ends:
+            offset = ends[offset]
+        progress.resume_offsets[path] = offset
+    return progress
+
+
+# --- Processing ---
+
+def process_archive(
+    settings: Settings,
+    groq_client: LlmClient,
+    path: str,
+    output_path: str,
+    dry_run: bool = False,
+    resume: bool = False,
+) -> BulkSummary:
+    """
+    Runs every message of an .eml directory or mbox file through the processing pipeline.
+
+    Messages are streamed from disk into the same stages as the IMAP path
+    (parsing, PDF text and OCR in worker processes, fast path or Groq) and
+    each result is appended to `output_path` as one JSON line with the
+    file and byte range of its message. With `dry_run` nothing is sent;
+    with `resume` messages already in the output are skipped (unless they
+    failed) and mbox files are scanned from where the last run got to.
+    """
+    summary = BulkSummary()
+    progress = ArchiveProgress()
+    if resume and os.path.exists(output_path):
+        _truncate_partial_line(output_path)
+        progress = read_progress(output_path)
+        logger.info(f"Resuming: {len(progress.done)} messages already done in {output_path}.")
+
+    messages: dict[bytes, ArchivedMessage] = {}
+
+    def jobs() -> Iterator[EmailJob]:
+        index = 0
+        for archive_path in archive_files(path):
+            for message in scan_archive(archive_path, progress.resume_offsets.get(archive_path, 0)):
+                if (message.path, message.offset) in progress.done:
+                    summary.skipped += 1
+                    continue
+                messages[message.key] = message
+                yield EmailJob(index=index, uid=message.key)
+                index += 1
+
+    cache = open_extraction_cache(settings)
+    ocr_engine = build_ocr_engine(settings, cache)
+    extractor = build_attachment_extractor(settings, ocr_engine, cache)
+    smtp_pool = None
+    if not dry_run:
+        smtp_pool = SmtpPool(settings, size=settings.SMTP_POOL_SIZE, noop_after_seconds=settings.SMTP_NOOP_AFTER_SECONDS)
+    stages = build_stages(
+        settings, groq_client,
+        lambda key: load_message(messages[key], settings.MIME_SPOOL_THRESHOLD_BYTES),
+        None, extractor, smtp_pool,
+    )
+    write_lock = threading.Lock()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as output:
+
+        def complete(job: EmailJob):
+            message = messages.pop(job.uid)
+            release_job(job, extractor)
+            result = job.log_entry
+            result.source = message.path
+            result.processing_seconds = round(time.perf_counter() - job.queued_at, 4)
+            outcome = job.outcome.value if job.outcome else ("dry_run" if dry_run else "unknown")
+            EMAILS_PROCESSED.labels(outcome=outcome).inc()
+            summary.processed += 1
+            if outcome in ("sent", "dry_run", "no_recipient", "failed"):
+                setattr(summary, outcome, getattr(summary, outcome) + 1)
+            record = {
+                **result.model_dump(mode="json"), "outcome": outcome,
+                "offset": message.offset, "end_offset": message.end_offset,
+            }
+            with write_lock:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+
+        def stage_done(job: EmailJob, stage_name: str, seconds: float, failed: bool):
+            job.stage_timings[stage_name] = seconds
+            PIPELINE_STAGE_SECONDS.labels(stage=stage_name, outcome="error" if failed else "ok").observe(seconds)
+
+        pipeline = Pipeline(
+            stages,
+            queue_size=settings.PIPELINE_QUEUE_SIZE,
+            on_error=record_failure,
+            on_complete=complete,
+            on_stage=stage_done,
+            keep_results=False,
+        )
+        started = time.perf_counter()
+        try:
+            pipeline.run(jobs())
+        finally:
+            summary.elapsed_seconds = round(time.perf_counter() - started, 3)
+            if smtp_pool:
+                smtp_pool.close()
+            extractor.shutdown()
+            if cache:
+                cache.close()
+
+    logger.info(f"Bulk run finished: {asdict(summary)}")
+    return summary
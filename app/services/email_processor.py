@@ -1,116 +1,323 @@
 import imaplib
-import smtplib
-import ssl
-import email
+import uuid
 from email.header import decode_header
-import fitz
+from email.parser import BytesHeaderParser
 import json
-import groq
-import io
 import logging
-from PIL import Image
-import pytesseract
-from bs4 import BeautifulSoup
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
 
 from app.config import Settings
+from app.metrics import (
+    EMAILS_PROCESSED,
+    HTML_CLEANUP_SECONDS,
+    IMAP_OPERATION_SECONDS,
+    PIPELINE_STAGE_SECONDS,
+    observe_outcome,
+)
 from app.schemas.app_schemas import ProcessingResult
+from app.services.attachments import AttachmentBudget, AttachmentExtractor, ExtractedAttachment, find_attachments
+from app.services.extraction_cache import ExtractionCache
+from app.services.html_text import decode_text, html_to_text
+from app.models.ledger import LedgerOutcome
+from app.services.imap_fetcher import (
+    BatchedFetcher,
+    ImapConnections,
+    close_imap,
+    connect_imap,
+    fetch_message_ids,
+    read_uid_validity,
+)
+from app.services.ledger import FLAG_ONLY, PROCESS, ProcessingLedger, RetryPolicy, decide
+from app.services.llm_cache import LlmResultCache, get_llm_cache, prompt_key
+from app.services.llm_client import LlmClient
+from app.services.mime_stream import FetchedMessage, FetchedPart, PartInfo, decode_transfer_encoding
+from app.services.ocr_engine import OcrEngine, OcrPolicy
+from app.services.pipeline import Pipeline, Stage
+from app.services.prompt_builder import (
+    EDGE_PAGE_BOOST,
+    EMAIL_BODY_BOOST,
+    PromptPlan,
+    Segment,
+    build_prompt_plan,
+    estimate_tokens,
+)
+from app.services.recipient_extractor import extract_recipient
+from app.services.smtp_pool import SmtpPool
 
 
 logger = logging.getLogger(__name__)
 
-def ocr_from_image_bytes(image_bytes: bytes) -> str:
-    """Extracts text from image bytes using Pytesseract."""
-    try:
-        image = Image.open(io.BytesIO(image_bytes))
-        text = pytesseract.image_to_string(image)
-        return text
-    except Exception as e:
-        logger.error(f"Pytesseract OCR Error: {e}", exc_info=True)
-        return f"[Pytesseract OCR Error: {e}]"
+GROQ_MODEL = "llama3-8b-8192"
+
+# Stands in for an attachment's payload until the message is streamed out.
+_ATTACHMENT_PLACEHOLDER = f"attachment-payload-{uuid.uuid4().hex}"
+
+_mailbox_locks: dict[str, threading.Lock] = {}
+_mailbox_locks_guard = threading.Lock()
+
+# --- Pipeline Data ---
+
+@dataclass
+class ParsedEmail:
+    """The parts of a fetched message that the later stages need."""
+    subject: str = ""
+    sender: Optional[str] = None
+    body: str = ""
+    html_cleanup_seconds: Optional[float] = None  # measured in the worker process, reported by the parent
+
+
+@dataclass
+class EmailJob:
+    """State of a single message as it moves through the pipeline."""
+    index: int
+    uid: bytes
+    message_id: Optional[str] = None
+    log_entry: ProcessingResult = field(default_factory=lambda: ProcessingResult(status="Processing started."))
+    fetched: Optional[FetchedMessage] = None
+    parsed: Optional[ParsedEmail] = None
+    attachments: list[FetchedPart] = field(default_factory=list)  # stay encoded and spooled; forwarded as-is
+    extracted: list[ExtractedAttachment] = field(default_factory=list)  # the ones text is read from
+    extraction_deadline: Optional[float] = None
+    full_text_for_analysis: str = ""
+    recipient_address: str = ""
+    physical_address: str = ""
+    sending: bool = False  # the SMTP send started; a failure from here on is not a clean "not sent"
+    sent: bool = False
+    flagged: bool = False
+    outcome: Optional[LedgerOutcome] = None
+    stage_timings: dict[str, float] = field(default_factory=dict)
+    queued_at: float = field(default_factory=time.perf_counter)
+    done: bool = False
+
+
+# --- CPU-bound helpers (run in worker processes, must stay picklable) ---
+
+def _decode_subject(raw_subject: Optional[str]) -> str:
+    subject_header = decode_header(raw_subject or "")
+    return "".join(str(s, c or 'utf-8') if isinstance(s, bytes) else s for s, c in subject_header)
+
+
+def select_text_parts(fetched: FetchedMessage) -> list[FetchedPart]:
+    """Returns the body parts to read: the text/plain ones, or the text/html ones when there is no plain text."""
+    bodies = [
+        part for part in fetched.parts
+        if part.info.disposition != "attachment" and part.info.content_type in ("text/plain", "text/html")
+    ]
+    if any(part.info.content_type == "text/plain" and part.info.size > 0 for part in bodies):
+        return [part for part in bodies if part.info.content_type == "text/plain"]
+    return bodies
+
+
+def parse_text_parts(
+    raw_headers: bytes, text_parts: list[tuple[PartInfo, bytes]], max_html_bytes: Optional[int] = None
+) -> ParsedEmail:
+    """Builds a ParsedEmail from the message headers and its (still encoded) text parts."""
+    headers = BytesHeaderParser().parsebytes(raw_headers)
+    parsed = ParsedEmail(subject=_decode_subject(headers['Subject']), sender=headers.get('From'))
+    plain_text_body, html_parts = "", []
+    for info, payload in text_parts:
+        decoded = decode_transfer_encoding(payload, info.encoding)
+        if info.content_type == "text/plain":
+            plain_text_body = decode_text(decoded, info.params.get("charset"))
+        elif info.content_type == "text/html":
+            html_parts.append((info, decoded))
+
+    html_body_cleaned = ""
+    if not plain_text_body.strip():
+        for info, decoded in html_parts:
+            started = time.perf_counter()
+            html_body_cleaned = html_to_text(decoded, info.params.get("charset"), max_html_bytes)
+            parsed.html_cleanup_seconds = time.perf_counter() - started
+    parsed.body = plain_text_body or html_body_cleaned
+    return parsed
 
-def process_unseen_emails(settings: Settings, groq_client: groq.Groq) -> list[ProcessingResult]:
+
+# --- Pipeline Stages ---
+
+def build_stages(
+    settings: Settings,
+    groq_client: LlmClient,
+    fetch_message: Callable[[bytes], FetchedMessage],
+    mark_seen: Optional[Callable[[bytes], None]],
+    extractor: AttachmentExtractor,
+    smtp_pool: Optional[SmtpPool],
+    ledger: Optional[ProcessingLedger] = None,
+) -> list[Stage]:
     """
-    Connects to an IMAP server, processes unseen emails, and forwards them based on AI analysis.
+    Builds the processing stages.
+
+    `fetch_message` loads a job's message by its UID and `mark_seen`, when
+    given, flags it once it has been forwarded. Without an `smtp_pool`
+    nothing is sent: jobs whose recipient was found end as a dry run.
     """
-    results_log = []
-    try:
-        logger.info(f"Connecting to IMAP server: {settings.IMAP_SERVER}")
-        imap = imaplib.IMAP4_SSL(settings.IMAP_SERVER)
-        imap.login(settings.IMAP_USER, settings.IMAP_PASSWORD)
-        imap.select("INBOX")
-        logger.info("IMAP connection successful. Searching for unseen emails.")
-        status, messages = imap.search(None, 'UNSEEN')
-        
-        email_ids = messages[0].split()
-        logger.info(f"Found {len(email_ids)} unseen emails.")
-        if not email_ids:
-            results_log.append(ProcessingResult(status="No unseen emails found."))
-            return results_log
-    except Exception as e:
-        logger.error(f"Failed to connect to IMAP server or search for emails: {e}", exc_info=True)
-        results_log.append(ProcessingResult(status="Failed to connect to IMAP server.", details=str(e)))
-        return results_log
+    llm_cache = None
+    if settings.LLM_CACHE_ENABLED:
+        llm_cache = get_llm_cache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL_SECONDS, settings.LLM_CACHE_PATH)
+    own_addresses = _own_addresses(settings)
+
+    def fetch(job: EmailJob, run):
+        job.fetched = fetch_message(job.uid)
+
+    def parse(job: EmailJob, run):
+        # Only the text parts cross into the worker process; attachments stay spooled here.
+        text_parts = [(part.info, part.payload.getvalue()) for part in select_text_parts(job.fetched)]
+        parsed = run(parse_text_parts, job.fetched.headers, text_parts, settings.HTML_MAX_BYTES)
+        if parsed.html_cleanup_seconds is not None:
+            HTML_CLEANUP_SECONDS.labels(outcome="ok").observe(parsed.html_cleanup_seconds)
+        job.parsed = parsed
+        job.attachments = find_attachments(job.fetched)
+        job.log_entry.source_from, job.log_entry.source_subject = parsed.sender, parsed.subject
+        logger.info(f"Processing email UID {job.uid.decode()}: From='{parsed.sender}', Subject='{parsed.subject}'")
+        if job.attachments:
+            logger.info(f"Found attachments: {', '.join(part.info.filename for part in job.attachments)}")
+        job.full_text_for_analysis = f"Email Subject: {parsed.subject}\n\n"
+        job.full_text_for_analysis += f"Email Body:\n{parsed.body}\n\n"
+
+    def pdf_text(job: EmailJob, run):
+        job.extracted, notes = extractor.select(job.attachments)
+        if not job.extracted:
+            _add_details(job.log_entry, notes)
+            return
+        # One deadline covers text layers and OCR of all of the message's attachments.
+        job.extraction_deadline = extractor.deadline()
+        notes += extractor.prepare(job.extracted, run, job.extraction_deadline)
+        _add_details(job.log_entry, notes)
+        for attachment in job.extracted:
+            if attachment.page_texts and attachment.error is None:
+                text = "".join(attachment.page_texts)
+                job.full_text_for_analysis += f"--- Text from PDF '{attachment.filename}' ---\n{text}\n"
+
+    def ocr(job: EmailJob, run):
+        if not job.extracted:
+            return
+        logger.info(f"Checking which of {len(job.extracted)} attachment(s) need OCR.")
+        _add_details(job.log_entry, extractor.ocr(job.extracted, job.extraction_deadline))
+        for attachment in job.extracted:
+            if attachment.ocr_text and attachment.error is None:
+                logger.info(f"Found text via OCR in '{attachment.filename}' for email UID {job.uid.decode()}.")
+                job.full_text_for_analysis += f"--- OCR Text from '{attachment.filename}' ---{attachment.ocr_text}\n"
+        extractor.release(job.extracted)
+
+    def analyze(job: EmailJob, run):
+        if settings.FAST_PATH_ENABLED:
+            fast = extract_recipient(job.full_text_for_analysis, [job.parsed.sender, *own_addresses])
+            if fast.recipient_email and fast.confidence >= settings.FAST_PATH_CONFIDENCE_THRESHOLD:
+                job.recipient_address = fast.recipient_email
+                job.physical_address = fast.physical_address or "Not Found"
+                job.log_entry.extraction_path = "fast_path"
+                logger.info(
+                    f"Fast-path result (confidence {fast.confidence}): recipient_email='{job.recipient_address}', "
+                    f"physical_address='{job.physical_address}'. Skipping Groq."
+                )
+                return
 
-    for email_id in email_ids:
-        log_entry = ProcessingResult(status="Processing started.")
-        try:
-            _, msg_data = imap.fetch(email_id, "(RFC822)")
-            original_message = email.message_from_bytes(msg_data[0][1])
-
-            subject_header = decode_header(original_message['Subject'])
-            original_subject = "".join(str(s, c or 'utf-8') if isinstance(s, bytes) else s for s, c in subject_header)
-            sender = original_message.get('From')
-            log_entry.source_from, log_entry.source_subject = sender, original_subject
-            logger.info(f"Processing email ID {email_id.decode()}: From='{sender}', Subject='{original_subject}'")
-
-            # --- A. Extract Content ---
-            logger.info("Extracting email body and attachments.")
-            full_text_for_analysis = f"Email Subject: {original_subject}\n\n"
-            email_body_for_sending = ""
-            pdf_to_attach_bytes, pdf_to_attach_filename = None, None
-            plain_text_body, html_body_cleaned = "", ""
-
-            for part in original_message.walk():
-                content_disposition = str(part.get("Content-Disposition"))
-                if "attachment" in content_disposition:
-                    if part.get_content_type() == "application/pdf" and part.get_filename():
-                        pdf_to_attach_bytes = part.get_payload(decode=True)
-                        pdf_to_attach_filename = part.get_filename()
-                        logger.info(f"Found PDF attachment: {pdf_to_attach_filename}")
-                else:
-                    if part.get_content_type() == "text/plain":
-                        plain_text_body = part.get_payload(decode=True).decode('utf-8', 'ignore')
-                    elif part.get_content_type() == "text/html":
-                        html_source = part.get_payload(decode=True).decode('utf-8', 'ignore')
-                        soup = BeautifulSoup(html_source, "html.parser")
-                        html_body_cleaned = soup.get_text(separator='\n', strip=True)
-
-            email_body_for_sending = plain_text_body or html_body_cleaned
-            full_text_for_analysis += f"Email Body:\n{email_body_for_sending}\n\n"
-
-            if pdf_to_attach_bytes:
-                with fitz.open(stream=pdf_to_attach_bytes, filetype="pdf") as pdf_doc:
-                    pdf_text = "".join(page.get_text() for page in pdf_doc)
-                    full_text_for_analysis += f"--- Text from PDF '{pdf_to_attach_filename}' ---\n{pdf_text}\n"
-
-                    logger.info("Searching for images within PDF for OCR.")
-                    image_ocr_text = ""
-                    for page in pdf_doc:
-                        for img_index, img in enumerate(page.get_images(full=True)):
-                            base_image = pdf_doc.extract_image(img[0])
-                            ocr_result = ocr_from_image_bytes(base_image["image"])
-                            if ocr_result.strip():
-                                logger.info(f"Found text in image on page {page.page_number + 1} via OCR.")
-                                image_ocr_text += f"\n--- OCR Text from Image on Page {page.page_number + 1} ---\n{ocr_result}\n"
-                    if image_ocr_text:
-                        full_text_for_analysis += image_ocr_text
-
-            # --- B. Analyze with Groq ---
-            logger.info("Sending extracted text to Groq for analysis.")
-            prompt = f"""
+        plan = build_prompt_plan(
+            job.full_text_for_analysis, _prompt_segments(job),
+            token_budget=settings.LLM_PROMPT_TOKEN_BUDGET,
+            max_chunks=settings.LLM_MAP_REDUCE_MAX_CHUNKS,
+        )
+        logger.info(
+            f"Sending extracted text to Groq for analysis ({plan.mode}: {plan.input_tokens} input tokens "
+            f"-> {len(plan.chunks)} prompt(s) of {plan.chunk_tokens} tokens)."
+        )
+        if plan.dropped_tokens:
+            _add_details(job.log_entry, [f"Analysis incomplete: {plan.dropped_tokens} tokens of relevant text did not fit into the prompts"])
+        job.log_entry.extraction_path = "llm"
+        job.recipient_address, job.physical_address, job.log_entry.prompt_tokens = analyze_with_plan(
+            groq_client, plan, llm_cache
+        )
+        logger.info(f"Groq analysis result: recipient_email='{job.recipient_address}', physical_address='{job.physical_address}'")
+        if not job.recipient_address or job.recipient_address == "not found":
+            logger.warning(f"Recipient email not found by AI for email UID {job.uid.decode()}. No action taken.")
+            job.log_entry.status = "Recipient email not found by AI. No action taken."
+            job.outcome = LedgerOutcome.NO_RECIPIENT
+            job.done = True
+
+    def send(job: EmailJob, run):
+        if smtp_pool is None:
+            logger.info(f"Dry run: email {job.uid.decode()} would be forwarded to {job.recipient_address}.")
+            job.log_entry.status = f"Dry run: would forward to {job.recipient_address}."
+            job.done = True
+            return
+        logger.info(f"Recipient found. Composing and sending email to {job.recipient_address}.")
+        new_email = compose_forward(settings, job)
+        if ledger:
+            # Written before and after SMTP so a crash in between is never retried blindly; the
+            # claim also keeps a run in another process from sending the same message.
+            if not ledger.claim(job.uid, message_id=job.message_id, recipient_email=job.recipient_address):
+                logger.info(f"Email UID {job.uid.decode()} is already being forwarded by another run; skipping it.")
+                job.log_entry.status = "Already forwarded by another run."
+                job.done = True
+                return
+        job.sending = True
+        timing = smtp_pool.send(
+            settings.SENDER_EMAIL, [job.recipient_address], lambda: forward_chunks(new_email, job.attachments)
+        )
+        logger.info(f"SMTP send to {job.recipient_address} took {timing.send_seconds:.3f}s (waited {timing.wait_seconds:.3f}s).")
+        job.sent = True
+        if ledger:
+            ledger.record(job.uid, LedgerOutcome.SENT, flagged=False)
+
+    def flag(job: EmailJob, run):
+        if mark_seen:
+            mark_seen(job.uid)
+            job.flagged = True
+            logger.info(f"Email sent successfully and original email UID {job.uid.decode()} marked as Seen.")
+        job.outcome = LedgerOutcome.SENT
+        job.log_entry.status = f"Email sent successfully to {job.recipient_address}."
+
+    stages = [
+        Stage("fetch", fetch, workers=settings.PIPELINE_FETCH_WORKERS),
+        Stage("parse", parse, workers=settings.PIPELINE_PARSE_WORKERS, kind="process"),
+        Stage("pdf_text", pdf_text, workers=settings.PIPELINE_PDF_WORKERS, kind="process"),
+        # The OCR engine owns its own process pool; these threads only feed it.
+        Stage("ocr", ocr, workers=settings.PIPELINE_OCR_WORKERS),
+        Stage("analyze", analyze, workers=settings.PIPELINE_LLM_WORKERS),
+        Stage("send", send, workers=settings.PIPELINE_SMTP_WORKERS),
+        Stage("flag", flag, workers=1),
+    ]
+    return stages
+
+
+def _own_addresses(settings: Settings) -> list[str]:
+    """Returns our own addresses (the sender and every processed mailbox), which are never the recipient."""
+    addresses = [settings.SENDER_EMAIL, settings.IMAP_USER]
+    addresses.extend(source.imap_user for source in settings.MAIL_SOURCES if source.imap_user)
+    return addresses
+
+
+def _prompt_segments(job: EmailJob) -> list[Segment]:
+    """Splits a job's text into the segments the prompt builder ranks."""
+    segments = [Segment(
+        heading="",
+        text=f"Email Subject: {job.parsed.subject}\n\nEmail Body:\n{job.parsed.body}",
+        boost=EMAIL_BODY_BOOST,
+    )]
+    for attachment in job.extracted:
+        if attachment.error is not None:
+            continue
+        page_texts = attachment.page_texts
+        for index, page_text in enumerate(page_texts):
+            segments.append(Segment(
+                heading=f"--- Text from PDF '{attachment.filename}' (page {index + 1} of {len(page_texts)}) ---",
+                text=page_text,
+                boost=EDGE_PAGE_BOOST if index in (0, len(page_texts) - 1) else 0.0,
+            ))
+        if attachment.ocr_text:
+            segments.append(Segment(heading=f"--- OCR Text from '{attachment.filename}' ---", text=attachment.ocr_text))
+    return segments
+
+
+def build_extraction_prompt(full_text_for_analysis: str) -> str:
+    return f"""
             You are an expert information extraction system. From the text below, which includes content from an email body, PDF text, and OCR from images inside the PDF, extract the recipient's email address and their full physical mailing address.
             Return a single, valid JSON object with two keys: "recipient_email" and "physical_address".
             If a value is not found, use the string "Not Found".
@@ -122,61 +329,390 @@ def process_unseen_emails(settings: Settings, groq_client: groq.Groq) -> list[Pr
 
             JSON Response:
             """
-            chat_completion = groq_client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama3-8b-8192",
-                temperature=0,
-                response_format={"type": "json_object"},
-            )
-            extracted_data = json.loads(chat_completion.choices[0].message.content)
-            recipient_address = extracted_data.get("recipient_email", "Not Found").strip().lower()
-            physical_address = extracted_data.get("physical_address", "Not Found").strip()
-            
-            logger.info(f"Groq analysis result: recipient_email='{recipient_address}', physical_address='{physical_address}'")
-            
-            # --- C. Compose and Send New Email ---
-            if recipient_address and recipient_address != "not found":
-                logger.info(f"Recipient found. Composing and sending email to {recipient_address}.")
-                new_email = MIMEMultipart()
-                new_email['From'] = settings.SENDER_EMAIL
-                new_email['To'] = recipient_address
-                new_email['Subject'] = original_subject
-
-                # ** START: MODIFICATION **
-                final_email_body = email_body_for_sending
-                if physical_address and physical_address.lower() != "not found":
-                    logger.info("Appending extracted physical address to the email body.")
-                    final_email_body += f"\n\n---\nAddress:\n{physical_address}"
-                
-                new_email.attach(MIMEText(final_email_body, 'plain'))
-                # ** END: MODIFICATION **
-
-                if pdf_to_attach_bytes and pdf_to_attach_filename:
-                    pdf_part = MIMEApplication(pdf_to_attach_bytes, Name=pdf_to_attach_filename)
-                    pdf_part['Content-Disposition'] = f'attachment; filename="{pdf_to_attach_filename}"'
-                    new_email.attach(pdf_part)
-
-                context = ssl.create_default_context()
-                with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-                    server.starttls(context=context)
-                    server.login(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
-                    server.sendmail(settings.SENDER_EMAIL, [recipient_address], new_email.as_string())
-
-                imap.store(email_id, '+FLAGS', '\\Seen')
-                logger.info(f"Email sent successfully and original email ID {email_id.decode()} marked as Seen.")
-                log_entry.status = f"Email sent successfully to {recipient_address}."
+
+
+def analyze_with_groq(
+    groq_client: LlmClient, full_text_for_analysis: str, cache: Optional[LlmResultCache] = None
+) -> tuple[str, str]:
+    """Asks Groq for the recipient email and physical address found in the text."""
+    prompt = build_extraction_prompt(full_text_for_analysis)
+
+    def complete() -> dict:
+        chat_completion = groq_client.complete(
+            messages=[{"role": "user", "content": prompt}],
+            model=GROQ_MODEL,
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        usage = getattr(chat_completion, "usage", None)
+        if usage is not None:
+            logger.info(f"Groq usage: {usage.prompt_tokens} prompt tokens, {usage.completion_tokens} completion tokens.")
+        return json.loads(chat_completion.choices[0].message.content)
+
+    if cache:
+        extracted_data = cache.get_or_compute(prompt_key(prompt, GROQ_MODEL), complete)
+    else:
+        extracted_data = complete()
+    recipient_address = extracted_data.get("recipient_email", "Not Found").strip().lower()
+    physical_address = extracted_data.get("physical_address", "Not Found").strip()
+    return recipient_address, physical_address
+
+
+def analyze_with_plan(
+    groq_client: LlmClient, plan: PromptPlan, cache: Optional[LlmResultCache] = None
+) -> tuple[str, str, int]:
+    """
+    Runs the extraction for every chunk of a prompt plan and merges the answers.
+
+    With several chunks (map-reduce), the recipient is the address found in
+    the most chunks, ties going to the higher-ranked chunk, and the physical
+    address comes from the first chunk that found both. Returns the
+    recipient, the address and the estimated prompt tokens sent.
+    """
+    prompt_tokens = sum(estimate_tokens(build_extraction_prompt(chunk)) for chunk in plan.chunks)
+    answers = [analyze_with_groq(groq_client, chunk, cache) for chunk in plan.chunks]
+    if len(answers) == 1:
+        return answers[0][0], answers[0][1], prompt_tokens
+
+    found = [answer for answer in answers if answer[0] and answer[0] != "not found"]
+    if not found:
+        return "not found", "Not Found", prompt_tokens
+    counts = Counter(recipient for recipient, _ in found)
+    # most_common keeps first-seen order among ties, i.e. the higher-ranked chunk wins.
+    recipient = counts.most_common(1)[0][0]
+    physical_address = next(
+        (address for r, address in found if r == recipient and address.lower() != "not found"), "Not Found"
+    )
+    logger.info(f"Map-reduce over {len(answers)} chunks: {dict(counts)} -> '{recipient}'.")
+    return recipient, physical_address, prompt_tokens
+
+
+def compose_forward(settings: Settings, job: EmailJob) -> MIMEMultipart:
+    """
+    Builds the forwarded message for a job whose recipient has been found.
+
+    Attachment parts only carry their headers and a placeholder;
+    `forward_chunks` puts the original encoded payloads in their place
+    while sending.
+    """
+    new_email = MIMEMultipart()
+    new_email['From'] = settings.SENDER_EMAIL
+    new_email['To'] = job.recipient_address
+    new_email['Subject'] = job.parsed.subject
+
+    final_email_body = job.parsed.body
+    if job.physical_address and job.physical_address.lower() != "not found":
+        logger.info("Appending extracted physical address to the email body.")
+        final_email_body += f"\n\n---\nAddress:\n{job.physical_address}"
+
+    new_email.attach(MIMEText(final_email_body, 'plain'))
+
+    for index, attachment in enumerate(job.attachments):
+        filename = attachment.info.filename
+        main_type, sub_type = attachment.info.content_type.split("/", 1)
+        forwarded_part = MIMEBase(main_type, sub_type, name=filename)
+        forwarded_part['Content-Transfer-Encoding'] = attachment.info.encoding
+        forwarded_part.add_header('Content-Disposition', 'attachment', filename=filename)
+        forwarded_part.set_payload(_attachment_placeholder(index))
+        new_email.attach(forwarded_part)
+    return new_email
+
+
+def _attachment_placeholder(index: int) -> str:
+    return f"{_ATTACHMENT_PLACEHOLDER}-{index}"
+
+
+def forward_chunks(new_email: MIMEMultipart, attachments: list[FetchedPart]) -> Iterator[bytes]:
+    """Yields the forwarded message, streaming each attachment's original encoded bytes from its spool."""
+    rest = new_email.as_bytes()
+    for index, attachment in enumerate(attachments):
+        prefix, rest = rest.split(_attachment_placeholder(index).encode(), 1)
+        yield prefix
+        yield from attachment.payload.chunks()
+    yield rest
+
+
+def release_job(job: EmailJob, extractor: AttachmentExtractor):
+    """Closes a finished job's spooled parts and removes its decoded attachment copies."""
+    if job.fetched:
+        job.fetched.close()
+        job.fetched = None
+    extractor.release(job.extracted)
+
+
+def _add_details(entry: ProcessingResult, notes: list[str]):
+    if notes:
+        entry.details = "; ".join(([entry.details] if entry.details else []) + notes)
+
+
+def record_failure(job: EmailJob, stage_name: str, error: Exception):
+    logger.error(f"Failed to process email UID {job.uid.decode()} in stage '{stage_name}': {error}")
+    job.log_entry.status = "Failed to process email."
+    job.log_entry.details = str(error)
+    if job.sent:
+        # A forwarded message stays "sent" even if flagging it failed; the next run only flags it.
+        job.log_entry.status = f"Email sent successfully to {job.recipient_address}; marking it as Seen failed."
+        job.outcome = LedgerOutcome.SENT
+    elif job.sending:
+        # The server may have accepted it anyway: leave it "sending" so it is only retried
+        # when LEDGER_RETRY_UNCERTAIN_SENDS allows it, instead of on the FAILED schedule.
+        job.log_entry.status = "Failed while sending; the email may have been delivered."
+        job.outcome = LedgerOutcome.SENDING
+    else:
+        job.outcome = LedgerOutcome.FAILED
+
+
+def _record_outcome(ledger: ProcessingLedger, job: EmailJob):
+    if job.outcome is None:
+        return
+    entry = job.log_entry
+    ledger.record(
+        job.uid, job.outcome, count_attempt=True,
+        message_id=job.message_id,
+        flagged=job.flagged,
+        error=entry.details if job.outcome in (LedgerOutcome.FAILED, LedgerOutcome.SENDING) else None,
+        source_from=entry.source_from,
+        source_subject=entry.source_subject,
+        recipient_email=job.recipient_address or None,
+        physical_address=job.physical_address or None,
+        extraction_path=entry.extraction_path,
+        stage_timings={name: round(seconds, 4) for name, seconds in job.stage_timings.items()},
+    )
+
+
+def _apply_ledger(
+    imap: imaplib.IMAP4,
+    ledger: ProcessingLedger,
+    uids: list[bytes],
+    report: Callable[[int, ProcessingResult], None],
+) -> tuple[list[bytes], dict[bytes, Optional[str]]]:
+    """
+    Settles the messages the ledger already knows and returns the UIDs left to process.
+
+    Messages forwarded earlier but never flagged are only marked as seen;
+    the others are skipped or retried according to the retry policy.
+    Also returns the Message-ID of every UID.
+    """
+    message_ids = fetch_message_ids(imap, uids)
+    entries = ledger.load(uids, message_ids)
+    now = datetime.now(timezone.utc)
+    to_process = []
+    for index, uid in enumerate(uids):
+        entry = entries.get(uid)
+        action = decide(entry, ledger.policy, now)
+        if action == PROCESS:
+            to_process.append(uid)
+            continue
+        if not entry.matched_by_uid:
+            ledger.adopt(uid, entry)
+        if action == FLAG_ONLY:
+            with observe_outcome(IMAP_OPERATION_SECONDS, operation="store"):
+                imap.uid("STORE", uid, '+FLAGS', '\\Seen')
+            ledger.record(uid, LedgerOutcome.SENT, flagged=True)
+            EMAILS_PROCESSED.labels(outcome="flag_only").inc()
+            status = f"Already forwarded to {entry.recipient_email}; marked as Seen."
+        else:
+            EMAILS_PROCESSED.labels(outcome="skipped").inc()
+            status = f"Skipped: already processed ({entry.outcome.value}, {entry.attempts} attempt(s))."
+        report(index, ProcessingResult(
+            source_from=entry.source_from,
+            source_subject=entry.source_subject,
+            status=status,
+            extraction_path=entry.extraction_path,
+        ))
+
+    if len(to_process) < len(uids):
+        logger.info(f"Ledger: {len(uids) - len(to_process)} of {len(uids)} messages already processed; {len(to_process)} to process.")
+    return to_process, message_ids
+
+
+def open_extraction_cache(settings: Settings) -> Optional[ExtractionCache]:
+    """Returns the extraction cache, or None when it is disabled."""
+    if not settings.EXTRACTION_CACHE_ENABLED:
+        return None
+    return ExtractionCache(settings.EXTRACTION_CACHE_PATH, settings.EXTRACTION_CACHE_MAX_BYTES)
+
+
+def build_attachment_extractor(settings: Settings, ocr_engine: OcrEngine, cache: Optional[ExtractionCache]) -> AttachmentExtractor:
+    """Returns the attachment extractor with the configured per-message budget."""
+    budget = AttachmentBudget(
+        max_count=settings.ATTACHMENT_MAX_COUNT,
+        max_bytes=settings.ATTACHMENT_MAX_BYTES_PER_MESSAGE,
+        max_attachment_bytes=settings.IMAP_MAX_ATTACHMENT_BYTES,
+        timeout_seconds=settings.ATTACHMENT_EXTRACTION_TIMEOUT_SECONDS,
+    )
+    # Enough threads for every attachment of every message in the PDF text and OCR stages at once.
+    workers = (settings.PIPELINE_PDF_WORKERS + settings.PIPELINE_OCR_WORKERS) * settings.ATTACHMENT_MAX_COUNT
+    return AttachmentExtractor(ocr_engine, cache=cache, budget=budget, max_workers=workers)
+
+
+def build_ocr_engine(settings: Settings, cache: Optional[ExtractionCache], max_workers: Optional[int] = None) -> OcrEngine:
+    """Returns an OCR engine with the configured page-selection policy (OCR_PROCESS_WORKERS unless `max_workers`)."""
+    policy = OcrPolicy(
+        min_text_chars=settings.OCR_MIN_TEXT_CHARS,
+        image_coverage_threshold=settings.OCR_IMAGE_COVERAGE_THRESHOLD,
+        dpi=settings.OCR_RENDER_DPI,
+        max_page_pixels=settings.OCR_MAX_PAGE_PIXELS,
+        max_pages=settings.OCR_MAX_PAGES,
+    )
+    workers = settings.OCR_PROCESS_WORKERS if max_workers is None else max_workers
+    return OcrEngine(max_workers=workers, cache=cache, policy=policy)
+
+
+def mailbox_key(settings: Settings, mailbox: str) -> str:
+    """Returns the name of a folder of the account `settings` connects to, as used by the ledger and locks."""
+    return f"{settings.IMAP_USER}@{settings.IMAP_SERVER}/{mailbox}"
+
+
+def mailbox_lock(key: str) -> threading.Lock:
+    """
+    Returns the lock that serializes processing runs against one mailbox (by `mailbox_key`).
+
+    The lock only holds within this process: the shards that SourceScheduler
+    runs in worker processes do not take it. Across processes, the ledger's
+    claim before each send keeps two runs from forwarding the same message.
+    """
+    with _mailbox_locks_guard:
+        return _mailbox_locks.setdefault(key, threading.Lock())
+
+
+def process_uids(
+    settings: Settings,
+    groq_client: LlmClient,
+    imap: imaplib.IMAP4,
+    uids: list[bytes],
+    on_result: Optional[Callable[[ProcessingResult], None]] = None,
+    mailbox: str = "INBOX",
+    extractor: Optional[AttachmentExtractor] = None,
+) -> list[ProcessingResult]:
+    """
+    Runs the given message UIDs through the processing pipeline.
+
+    `imap` must have `mailbox` selected; it is used to flag forwarded
+    messages as seen, while fetches use connections of their own.
+    `on_result` is called with each result as soon as its message is done.
+    Messages flow through a staged pipeline (fetch, parse, PDF text, OCR,
+    Groq, SMTP send, flag store) so the batch is limited by its slowest stage
+    rather than by the sum of all of them. With the ledger enabled, messages
+    it already knows are settled first and never enter the pipeline.
+    A caller that runs many batches can pass its own `extractor` (with its
+    OCR engine and extraction cache); it is reused and left open.
+    """
+    results: list[Optional[ProcessingResult]] = [None] * len(uids)
+
+    def report(index: int, result: ProcessingResult):
+        results[index] = result
+        if on_result:
+            on_result(result)
+
+    ledger = None
+    message_ids: dict[bytes, Optional[str]] = {}
+    pending = list(enumerate(uids))
+    if settings.LEDGER_ENABLED:
+        policy = RetryPolicy(
+            failed_retry_seconds=settings.LEDGER_RETRY_FAILED_AFTER_SECONDS,
+            max_attempts=settings.LEDGER_MAX_ATTEMPTS,
+            no_recipient_retry_seconds=settings.LEDGER_RETRY_NO_RECIPIENT_AFTER_SECONDS,
+            retry_uncertain_sends=settings.LEDGER_RETRY_UNCERTAIN_SENDS,
+        )
+        ledger = ProcessingLedger(mailbox_key(settings, mailbox), read_uid_validity(imap, mailbox), policy)
+        to_process, message_ids = _apply_ledger(imap, ledger, uids, report)
+        wanted = set(to_process)
+        pending = [(index, uid) for index, uid in pending if uid in wanted]
+        if not pending:
+            return results
+
+    owns_extractor = extractor is None
+    if owns_extractor:
+        cache = open_extraction_cache(settings)
+        extractor = build_attachment_extractor(settings, build_ocr_engine(settings, cache), cache)
+    smtp_pool = SmtpPool(settings, size=settings.SMTP_POOL_SIZE, noop_after_seconds=settings.SMTP_NOOP_AFTER_SECONDS)
+    fetch_connections = ImapConnections(settings, mailbox)
+    fetcher = BatchedFetcher(
+        [uid for _, uid in pending], fetch_connections,
+        batch_size=settings.IMAP_FETCH_BATCH_SIZE,
+        chunk_bytes=settings.IMAP_PARTIAL_FETCH_BYTES,
+        spool_threshold=settings.MIME_SPOOL_THRESHOLD_BYTES,
+    )
+
+    def mark_seen(uid: bytes):
+        # The flag stage has a single worker: this reuses the connection that ran the search.
+        with observe_outcome(IMAP_OPERATION_SECONDS, operation="store"):
+            imap.uid("STORE", uid, '+FLAGS', '\\Seen')
+
+    stages = build_stages(settings, groq_client, fetcher.fetch, mark_seen, extractor, smtp_pool, ledger)
+
+    def complete(job: EmailJob):
+        release_job(job, extractor)
+        job.log_entry.processing_seconds = round(time.perf_counter() - job.queued_at, 4)
+        EMAILS_PROCESSED.labels(outcome=job.outcome.value if job.outcome else "unknown").inc()
+        if ledger:
+            _record_outcome(ledger, job)
+        report(job.index, job.log_entry)
+
+    def stage_done(job: EmailJob, stage_name: str, seconds: float, failed: bool):
+        job.stage_timings[stage_name] = seconds
+        PIPELINE_STAGE_SECONDS.labels(stage=stage_name, outcome="error" if failed else "ok").observe(seconds)
+
+    pipeline = Pipeline(
+        stages,
+        queue_size=settings.PIPELINE_QUEUE_SIZE,
+        on_error=record_failure,
+        on_complete=complete,
+        on_stage=stage_done,
+    )
+    try:
+        pipeline.run(EmailJob(index=i, uid=uid, message_id=message_ids.get(uid)) for i, uid in pending)
+    finally:
+        fetch_connections.close_all()
+        smtp_pool.close()
+        if owns_extractor:
+            extractor.shutdown()
+            if extractor.cache:
+                logger.info(f"Extraction cache stats: {extractor.cache.stats()}")
+                extractor.cache.close()
+
+    return results
+
+
+def process_unseen_emails(
+    settings: Settings,
+    groq_client: LlmClient,
+    on_result: Optional[Callable[[ProcessingResult], None]] = None,
+) -> list[ProcessingResult]:
+    """
+    Connects to an IMAP server, processes unseen emails, and forwards them based on AI analysis.
+    """
+    results_log = []
+
+    def report(result: ProcessingResult):
+        results_log.append(result)
+        if on_result:
+            on_result(result)
+
+    try:
+        logger.info(f"Connecting to IMAP server: {settings.IMAP_SERVER}")
+        imap = connect_imap(settings)
+    except Exception as e:
+        logger.error(f"Failed to connect to IMAP server or search for emails: {e}", exc_info=True)
+        report(ProcessingResult(status="Failed to connect to IMAP server.", details=str(e)))
+        return results_log
+
+    try:
+        with mailbox_lock(mailbox_key(settings, "INBOX")):
+            logger.info("IMAP connection successful. Searching for unseen emails.")
+            with observe_outcome(IMAP_OPERATION_SECONDS, operation="search"):
+                status, messages = imap.uid("SEARCH", None, 'UNSEEN')
+            uids = messages[0].split()
+            logger.info(f"Found {len(uids)} unseen emails.")
+            if not uids:
+                report(ProcessingResult(status="No unseen emails found."))
             else:
-                logger.warning(f"Recipient email not found by AI for email ID {email_id.decode()}. No action taken.")
-                log_entry.status = "Recipient email not found by AI. No action taken."
-
-        except Exception as e:
-            logger.error(f"Failed to process email ID {email_id.decode()}: {e}", exc_info=True)
-            log_entry.status = "Failed to process email."
-            log_entry.details = str(e)
-        finally:
-            results_log.append(log_entry)
-
-    logger.info("Closing IMAP connection.")
-    imap.close()
-    imap.logout()
-    return results_log
\ No newline at end of file
+                results_log.extend(process_uids(settings, groq_client, imap, uids, on_result=on_result))
+    except Exception as e:
+        logger.error(f"Failed to connect to IMAP server or search for emails: {e}", exc_info=True)
+        report(ProcessingResult(status="Failed to connect to IMAP server.", details=str(e)))
+    finally:
+        logger.info("Closing IMAP connection.")
+        close_imap(imap)
+    return results_log
@@ -0,0 +1,151 @@
+# app/services/extraction_cache.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Kinds of cached values, all keyed by the SHA-256 of the decoded attachment.
+# PDF_TEXT is a PDF's text layer; PDF_OCR and IMAGE_OCR are the joined OCR
+# text of a PDF or image attachment, plus the OCR policy they were made with;
+# PAGE_OCR is one rendered PDF page or image frame, plus its index and the
+# render settings (DPI, pixel budget).
+PDF_TEXT = "pdf_text"
+PDF_OCR = "pdf_ocr"
+IMAGE_OCR = "image_ocr"
+PAGE_OCR = "page_ocr"
+
+
+# A hit refreshes an entry's LRU position at most this often, so repeated
+# hits do not each take the write lock.
+TOUCH_INTERVAL_SECONDS = 60.0
+
+
+class ExtractionCache:
+    """
+    Persistent, content-addressed store for extracted PDF text and OCR text.
+
+    Entries live in a local SQLite file and are evicted least-recently-used
+    first once their combined size exceeds `max_bytes`. The file is shared
+    by every process that opens it (the source workers each do), so it runs
+    in WAL mode with a busy timeout, and the size is taken from the table
+    rather than counted per process. A cache that cannot be read or written
+    (still locked after the timeout, disk full) is logged and treated as a
+    miss. Hit and miss counts are kept per kind for the lifetime of the
+    instance.
+    """
+
+    def __init__(self, path: str, max_bytes: int, busy_timeout: float = 10.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit, so writes can take the write lock up front with BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        """Returns the cached value, refreshing its LRU position, or None on a miss."""
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value, last_access FROM entries WHERE kind = ? AND key = ?", (kind, key)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction cache read failed: {e}")
+                row = None
+            if row is None:
+                self.misses[kind] += 1
+                return None
+            self.hits[kind] += 1
+            value, last_access = row
+            now = time.time()
+            if now - last_access >= TOUCH_INTERVAL_SECONDS:
+                try:
+                    self._conn.execute(
+                        "UPDATE entries SET last_access = ? WHERE kind = ? AND key = ?", (now, kind, key)
+                    )
+                except sqlite3.Error as e:
+                    logger.debug(f"Extraction cache could not refresh an entry: {e}")
+            return value
+
+    def put(self, kind: str, key: str, value: str):
+        """Stores a value and evicts the least recently used entries if over the size cap."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (kind, key, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                        (kind, key, value, size, time.time()),
+                    )
+                    self._evict()
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction cache write failed: {e}")
+
+    def _evict(self):
+        # Keeps the most recently used entries that fit in `max_bytes` together.
+        if self._size() <= self.max_bytes:
+            return
+        self._conn.execute(
+            """
+            DELETE FROM entries WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, SUM(size) OVER (ORDER BY last_access DESC, rowid DESC) AS kept FROM entries
+                ) WHERE kept > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def _size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters per kind plus the current size on disk."""
+        kinds = sorted(set(self.hits) | set(self.misses))
+        with self._lock:
+            try:
+                size = self._size()
+            except sqlite3.Error:
+                size = None
+        return {
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            **{kind: {"hits": self.hits[kind], "misses": self.misses[kind]} for kind in kinds},
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,109 @@
+# app/services/html_text.py
+
+import codecs
+import logging
+import re
+from typing import Optional
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Never visible: dropped with their whole subtree before the text is collected.
+SKIPPED_TAGS = ("script", "style", "head", "title", "noscript", "template", "svg", "object", "iframe")
+
+# Elements that start and end a line, so address blocks keep their shape.
+BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "body", "br", "caption", "center", "dd", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr",
+    "html", "li", "main", "nav", "ol", "p", "pre", "section", "table", "tbody", "td", "tfoot", "th", "thead",
+    "tr", "ul",
+))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def known_charset(charset: Optional[str]) -> Optional[str]:
+    """Returns `charset` if Python knows it, else None."""
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset.strip().strip('"')).name
+    except LookupError:
+        logger.warning(f"Unknown charset '{charset}'; falling back to UTF-8.")
+        return None
+
+
+def decode_text(payload: bytes, charset: Optional[str]) -> str:
+    """Decodes a text part with its declared charset, UTF-8 when it has none (or an unknown one)."""
+    return payload.decode(known_charset(charset) or "utf-8", "ignore")
+
+
+def _parse(source: bytes, charset: Optional[str]) -> Optional[etree._Element]:
+    encoding = known_charset(charset)
+    if encoding is None:
+        # Undeclared: UTF-8 if it decodes, otherwise let libxml2 go by the <meta> charset.
+        try:
+            source.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            pass
+    parser = etree.HTMLParser(
+        encoding=encoding, remove_comments=True, remove_pis=True, no_network=True, recover=True
+    )
+    return etree.fromstring(source, parser)
+
+
+def _cut(source: bytes, max_bytes: int, charset: Optional[str]) -> bytes:
+    """Cuts `source` to `max_bytes`, backing off so a UTF-8 character is not split in half."""
+    cut = source[:max_bytes]
+    if known_charset(charset) not in (None, "utf-8"):
+        return cut
+    # The bytes of a trailing, incomplete character are what the decoder keeps buffered.
+    decoder = codecs.getincrementaldecoder("utf-8")("ignore")
+    decoder.decode(cut, final=False)
+    pending, _ = decoder.getstate()
+    return cut[:len(cut) - len(pending)]
+
+
+def html_to_text(source: bytes, charset: Optional[str] = None, max_bytes: Optional[int] = None) -> str:
+    """
+    Returns the visible text of an HTML document, one line per block.
+
+    Script, style and head content is dropped. Block elements and <br>
+    start new lines while inline markup is joined into its line, and runs of
+    whitespace inside a line collapse to one space, so an address split
+    over <br>s or table rows comes out one line per row. Input beyond
+    `max_bytes` is cut off before parsing, at a character boundary.
+    """
+    if max_bytes is not None and len(source) > max_bytes:
+        logger.warning(f"HTML body of {len(source)} bytes cut to {max_bytes} bytes before text extraction.")
+        source = _cut(source, max_bytes, charset)
+    if not source.strip():
+        return ""
+    root = _parse(source, charset)
+    if root is None:
+        return ""
+    etree.strip_elements(root, *SKIPPED_TAGS, with_tail=False)
+
+    pieces: list[str] = []
+    preformatted = 0
+    for event, element in etree.iterwalk(root, events=("start", "end")):
+        tag = element.tag if isinstance(element.tag, str) else ""
+        if event == "start":
+            if tag in BLOCK_TAGS:
+                pieces.append("\n")
+            if tag == "pre":
+                preformatted += 1
+            if element.text:
+                pieces.append(element.text if preformatted else _WHITESPACE.sub(" ", element.text))
+        else:
+            if tag == "pre":
+                preformatted -= 1
+            if tag in BLOCK_TAGS:
+                pieces.append("\n")
+            if element.tail:
+                pieces.append(element.tail if preformatted else _WHITESPACE.sub(" ", element.tail))
+
+    lines = (" ".join(line.split()) for line in "".join(pieces).split("\n"))
+    return "\n".join(line for line in lines if line)
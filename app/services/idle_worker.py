@@ -0,0 +1,239 @@
+# app/services/idle_worker.py
+
+import imaplib
+import itertools
+import logging
+import re
+import socket
+import threading
+import time
+from typing import Optional
+
+from app.config import Settings
+from app.database import SessionLocal
+from app.metrics import IMAP_OPERATION_SECONDS, observe_outcome
+from app.models.mailbox import MailboxCheckpoint
+from app.services.email_processor import mailbox_key, mailbox_lock, process_uids
+from app.services.imap_fetcher import close_imap, connect_imap, read_uid_validity
+from app.services.llm_client import LlmClient
+
+logger = logging.getLogger(__name__)
+
+_EXISTS = re.compile(rb"^\* \d+ EXISTS")
+
+# While idling the socket is read with this timeout, so `stop` is noticed quickly.
+_IDLE_POLL_SECONDS = 1.0
+# How long the server gets to answer IDLE and DONE.
+_IDLE_RESPONSE_TIMEOUT_SECONDS = 30.0
+
+# Tags of the hand-driven IDLE commands; any tag that imaplib does not use will do.
+_idle_tags = itertools.count(1)
+
+
+# --- Checkpoints ---
+
+def load_checkpoint(mailbox: str) -> Optional[tuple[int, int]]:
+    """Returns the stored (UIDVALIDITY, last processed UID) for a mailbox."""
+    db = SessionLocal()
+    try:
+        row = db.query(MailboxCheckpoint).filter(MailboxCheckpoint.mailbox == mailbox).first()
+        return (row.uid_validity, row.last_uid) if row else None
+    finally:
+        db.close()
+
+
+def save_checkpoint(mailbox: str, uid_validity: int, last_uid: int):
+    db = SessionLocal()
+    try:
+        row = db.query(MailboxCheckpoint).filter(MailboxCheckpoint.mailbox == mailbox).first()
+        if row is None:
+            row = MailboxCheckpoint(mailbox=mailbox)
+            db.add(row)
+        row.uid_validity, row.last_uid = uid_validity, last_uid
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- IDLE ---
+
+class _SocketLines:
+    """Reads response lines straight from a socket whose reads time out."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = b""
+
+    def readline(self) -> Optional[bytes]:
+        """Returns the next line, or None when none arrived before the socket timeout."""
+        while b"\n" not in self.buffer:
+            try:
+                data = self.sock.recv(4096)
+            except TimeoutError:
+                return None
+            if not data:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE.")
+            self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+    def readline_within(self, seconds: float) -> bytes:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            line = self.readline()
+            if line is not None:
+                return line
+        raise imaplib.IMAP4.abort("Timed out waiting for the server during IDLE.")
+
+
+def idle_until_exists(imap: imaplib.IMAP4, timeout: float, stop: threading.Event) -> bool:
+    """
+    Sends IDLE and waits until the server reports EXISTS, `timeout` passes or `stop` is set.
+
+    imaplib has no IDLE support before Python 3.14, so the command is driven
+    by hand. Responses are read from the socket itself with a short timeout
+    rather than through imaplib's buffered file, whose buffer would hide an
+    EXISTS line that arrived together with the continuation. Returns True
+    when new messages were announced.
+    """
+    tag = f"IDLE{next(_idle_tags)}".encode()
+    sock = imap.socket()
+    lines = _SocketLines(sock)
+    previous_timeout = sock.gettimeout()
+    sock.settimeout(_IDLE_POLL_SECONDS)
+    try:
+        announced = False
+        imap.send(tag + b" IDLE\r\n")
+        while True:
+            line = lines.readline_within(_IDLE_RESPONSE_TIMEOUT_SECONDS)
+            if line.startswith(b"+"):
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+            announced = announced or bool(_EXISTS.match(line))
+
+        deadline = time.monotonic() + timeout
+        while not announced and not stop.is_set() and time.monotonic() < deadline:
+            line = lines.readline()
+            if line is not None:
+                announced = bool(_EXISTS.match(line))
+
+        imap.send(b"DONE\r\n")
+        while True:
+            line = lines.readline_within(_IDLE_RESPONSE_TIMEOUT_SECONDS)
+            if line.startswith(tag):
+                break
+            announced = announced or bool(_EXISTS.match(line))
+        # Untagged lines that came in the same packet as the tagged one are not left half-read.
+        while lines.buffer:
+            line = lines.readline_within(_IDLE_RESPONSE_TIMEOUT_SECONDS)
+            announced = announced or bool(_EXISTS.match(line))
+    finally:
+        sock.settimeout(previous_timeout)
+    return announced
+
+
+def take_exists(imap: imaplib.IMAP4) -> bool:
+    """
+    Returns whether the server announced new mail outside IDLE, and forgets the announcement.
+
+    Servers also send EXISTS with other commands (the NOOP after an IDLE
+    timeout, the UID STORE of a processing run on this connection); imaplib
+    files it in `untagged_responses` and the server does not repeat it.
+    """
+    return imap.untagged_responses.pop("EXISTS", None) is not None
+
+
+# --- Worker ---
+
+class IdleWorker:
+    """
+    Background thread that keeps one IMAP connection in IDLE and processes new mail.
+
+    On start it resumes from the stored UID watermark for the mailbox; if
+    there is none, or UIDVALIDITY changed, it processes the current UNSEEN
+    messages once and starts the watermark from there. After that, every
+    EXISTS notification, in IDLE or with any other command on the
+    connection, triggers a `UID SEARCH UID <last+1>:*` and only the new
+    UIDs go through the pipeline.
+    """
+
+    def __init__(self, settings: Settings, groq_client: LlmClient, mailbox: str = "INBOX"):
+        self.settings = settings
+        self.groq_client = groq_client
+        self.mailbox = mailbox
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"imap-idle-{self.mailbox}", daemon=True)
+        self._thread.start()
+        logger.info(f"IMAP IDLE worker started for mailbox '{self.mailbox}'.")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info(f"IMAP IDLE worker stopped for mailbox '{self.mailbox}'.")
+
+    def _run(self):
+        while not self._stop.is_set():
+            imap = None
+            try:
+                imap = connect_imap(self.settings, self.mailbox)
+                self._serve(imap)
+            except Exception as e:
+                logger.error(f"IMAP IDLE worker error: {e}. Reconnecting in {self.settings.IMAP_IDLE_RECONNECT_SECONDS}s.", exc_info=True)
+                self._stop.wait(self.settings.IMAP_IDLE_RECONNECT_SECONDS)
+            finally:
+                if imap is not None:
+                    close_imap(imap)
+
+    def _serve(self, imap: imaplib.IMAP4):
+        uid_validity = read_uid_validity(imap, self.mailbox)
+        checkpoint = load_checkpoint(self.mailbox)
+        if checkpoint is None or checkpoint[0] != uid_validity:
+            logger.info(f"No usable checkpoint for '{self.mailbox}' (UIDVALIDITY {uid_validity}); catching up on UNSEEN.")
+            last_uid = self._catch_up(imap, uid_validity)
+        else:
+            last_uid = checkpoint[1]
+            last_uid = self._process_new(imap, uid_validity, last_uid)
+
+        while not self._stop.is_set():
+            if take_exists(imap) or idle_until_exists(imap, self.settings.IMAP_IDLE_TIMEOUT_SECONDS, self._stop):
+                last_uid = self._process_new(imap, uid_validity, last_uid)
+            else:
+                imap.noop()
+
+    def _catch_up(self, imap: imaplib.IMAP4, uid_validity: int) -> int:
+        with mailbox_lock(mailbox_key(self.settings, self.mailbox)):
+            # Fix the watermark first so mail arriving during the catch-up is picked up by IDLE.
+            take_exists(imap)
+            with observe_outcome(IMAP_OPERATION_SECONDS, operation="search"):
+                _, data = imap.uid("SEARCH", None, "ALL")
+            last_uid = max((int(uid) for uid in data[0].split()), default=0)
+            if last_uid:
+                with observe_outcome(IMAP_OPERATION_SECONDS, operation="search"):
+                    _, data = imap.uid("SEARCH", None, f"UID 1:{last_uid} UNSEEN")
+                uids = [uid for uid in data[0].split() if int(uid) <= last_uid]
+                if uids:
+                    process_uids(self.settings, self.groq_client, imap, uids, mailbox=self.mailbox)
+        save_checkpoint(self.mailbox, uid_validity, last_uid)
+        return last_uid
+
+    def _process_new(self, imap: imaplib.IMAP4, uid_validity: int, last_uid: int) -> int:
+        with mailbox_lock(mailbox_key(self.settings, self.mailbox)):
+            take_exists(imap)  # the search covers whatever was announced so far
+            with observe_outcome(IMAP_OPERATION_SECONDS, operation="search"):
+                _, data = imap.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+            # "n:*" always matches the highest UID, even when it is below n.
+            uids = [uid for uid in data[0].split() if int(uid) > last_uid]
+            if not uids:
+                return last_uid
+            logger.info(f"IDLE: {len(uids)} new message(s) in '{self.mailbox}'.")
+            results = process_uids(self.settings, self.groq_client, imap, uids, mailbox=self.mailbox)
+        sent = sum(1 for result in results if "successfully" in result.status)
+        last_uid = max(int(uid) for uid in uids)
+        save_checkpoint(self.mailbox, uid_validity, last_uid)
+        logger.info(f"IDLE: processed {len(uids)} message(s), {sent} forwarded; watermark now UID {last_uid}.")
+        return last_uid
@@ -0,0 +1,370 @@
+# app/services/imap_fetcher.py
+
+import imaplib
+import logging
+import re
+import threading
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from itertools import takewhile
+from typing import Any, Optional
+
+from app.config import Settings
+from app.metrics import IMAP_OPERATION_SECONDS, observe_outcome
+from app.services.mime_stream import FetchedMessage, FetchedPart, PartInfo, SpooledPayload
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]"
+
+_LITERAL_SUFFIX = re.compile(rb"\{(\d+)\}$")
+
+
+# --- Connections ---
+
+def connect_imap(settings: Settings, mailbox: str = "INBOX") -> imaplib.IMAP4:
+    """Opens an authenticated IMAP connection with `mailbox` selected."""
+    with observe_outcome(IMAP_OPERATION_SECONDS, operation="login"):
+        if settings.IMAP_SSL:
+            imap = imaplib.IMAP4_SSL(settings.IMAP_SERVER, settings.IMAP_PORT)
+        else:
+            imap = imaplib.IMAP4(settings.IMAP_SERVER, settings.IMAP_PORT)
+        imap.login(settings.IMAP_USER, settings.IMAP_PASSWORD)
+    imap.select(mailbox)
+    return imap
+
+
+def close_imap(imap: imaplib.IMAP4):
+    try:
+        imap.close()
+        imap.logout()
+    except Exception as e:
+        logger.warning(f"Error while closing IMAP connection: {e}")
+
+
+class ImapConnections:
+    """Hands each worker thread its own IMAP connection (imaplib is not thread-safe)."""
+
+    def __init__(self, settings: Settings, mailbox: str = "INBOX"):
+        self.settings = settings
+        self.mailbox = mailbox
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[imaplib.IMAP4] = []
+
+    def get(self) -> imaplib.IMAP4:
+        imap = getattr(self._local, "imap", None)
+        if imap is None:
+            imap = connect_imap(self.settings, self.mailbox)
+            self._local.imap = imap
+            with self._lock:
+                self._all.append(imap)
+        return imap
+
+    def close_all(self):
+        for imap in self._all:
+            close_imap(imap)
+
+
+# --- Fetch Response Parsing ---
+
+def _tokenize(data: list) -> list:
+    """
+    Turns an imaplib FETCH response into a flat token list.
+
+    Tokens are "(" / ")", None for NIL, and bytes for atoms, quoted strings
+    and literals. imaplib hands literals back as (prefix, literal) tuples
+    where the prefix ends in "{n}".
+    """
+    tokens: list = []
+    for piece in data:
+        if piece is None:
+            continue
+        if isinstance(piece, tuple):
+            head, literal = piece
+            match = _LITERAL_SUFFIX.search(head)
+            _tokenize_bytes(head[:match.start()] if match else head, tokens)
+            tokens.append(literal)
+        else:
+            _tokenize_bytes(piece, tokens)
+    return tokens
+
+
+def _tokenize_bytes(text: bytes, tokens: list):
+    i, length = 0, len(text)
+    while i < length:
+        char = text[i:i + 1]
+        if char in (b" ", b"\r", b"\n"):
+            i += 1
+        elif char in (b"(", b")"):
+            tokens.append(char.decode())
+            i += 1
+        elif char == b'"':
+            i += 1
+            value = bytearray()
+            while i < length and text[i:i + 1] != b'"':
+                if text[i:i + 1] == b"\\":
+                    i += 1
+                value += text[i:i + 1]
+                i += 1
+            tokens.append(bytes(value))
+            i += 1
+        else:
+            start = i
+            depth = 0
+            while i < length:
+                char = text[i:i + 1]
+                if char == b"[":
+                    depth += 1
+                elif char == b"]":
+                    depth -= 1
+                elif depth == 0 and char in (b" ", b"(", b")"):
+                    break
+                i += 1
+            atom = text[start:i]
+            tokens.append(None if atom.upper() == b"NIL" else atom)
+
+
+def _build(tokens: list, position: int) -> tuple[Any, int]:
+    token = tokens[position]
+    if token == "(":
+        items = []
+        position += 1
+        while tokens[position] != ")":
+            item, position = _build(tokens, position)
+            items.append(item)
+        return items, position + 1
+    return token, position + 1
+
+
+def parse_fetch_response(data: list) -> list[dict[str, Any]]:
+    """Parses a FETCH response into one {ITEM NAME: value} dict per message."""
+    tokens = _tokenize(data)
+    messages, position = [], 0
+    while position < len(tokens):
+        position += 1  # message sequence number
+        items, position = _build(tokens, position)
+        messages.append({
+            items[i].decode().upper(): items[i + 1] for i in range(0, len(items) - 1, 2)
+        })
+    return messages
+
+
+# --- BODYSTRUCTURE ---
+
+def _text(value) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else ""
+
+
+def _pairs(values) -> dict[str, str]:
+    if not isinstance(values, list):
+        return {}
+    return {_text(values[i]).lower(): _text(values[i + 1]) for i in range(0, len(values) - 1, 2)}
+
+
+def _decode_filename(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def parse_bodystructure(body: list, section: str = "") -> list[PartInfo]:
+    """Flattens a parsed BODYSTRUCTURE into its leaf parts with IMAP section numbers."""
+    if isinstance(body[0], list):
+        # Multipart: child bodies come first, followed by the subtype and extension data.
+        parts = []
+        for index, child in enumerate(takewhile(lambda item: isinstance(item, list), body)):
+            parts.extend(parse_bodystructure(child, f"{section}.{index + 1}" if section else str(index + 1)))
+        return parts
+
+    main_type, sub_type = _text(body[0]).lower(), _text(body[1]).lower()
+    content_type = f"{main_type}/{sub_type}"
+    params = _pairs(body[2])
+    if main_type == "text":
+        extension_start = 8
+    elif content_type == "message/rfc822":
+        extension_start = 10
+    else:
+        extension_start = 7
+
+    disposition, disposition_params = None, {}
+    if len(body) > extension_start + 1 and isinstance(body[extension_start + 1], list):
+        disposition = _text(body[extension_start + 1][0]).lower()
+        disposition_params = _pairs(body[extension_start + 1][1])
+
+    filename = disposition_params.get("filename") or disposition_params.get("filename*") or params.get("name")
+    return [PartInfo(
+        section=section or "1",
+        content_type=content_type,
+        params=params,
+        encoding=_text(body[5]).lower() or "7bit",
+        size=int(body[6] or 0),
+        disposition=disposition,
+        filename=_decode_filename(filename),
+    )]
+
+
+def is_needed_part(part: PartInfo) -> bool:
+    """Text bodies are read, and every named attachment is extracted or forwarded."""
+    if part.disposition == "attachment":
+        return bool(part.filename)
+    return part.content_type in ("text/plain", "text/html")
+
+
+def message_set(uids: list[bytes]) -> str:
+    """Compresses UIDs into an IMAP message set such as "3:7,9,12:13"."""
+    numbers = sorted(int(uid) for uid in uids)
+    ranges: list[str] = []
+    start = previous = numbers[0]
+    for number in numbers[1:] + [None]:
+        if number is not None and number == previous + 1:
+            previous = number
+            continue
+        ranges.append(str(start) if start == previous else f"{start}:{previous}")
+        if number is not None:
+            start = previous = number
+    return ",".join(ranges)
+
+
+# --- Batched Fetching ---
+
+def read_uid_validity(imap: imaplib.IMAP4, mailbox: str) -> int:
+    """Returns the UIDVALIDITY of the selected mailbox."""
+    _, data = imap.response("UIDVALIDITY")
+    if not data or data[0] is None:
+        _, data = imap.status(mailbox, "(UIDVALIDITY)")
+        match = re.search(rb"UIDVALIDITY (\d+)", data[0])
+        return int(match.group(1))
+    return int(data[0])
+
+
+def fetch_message_ids(imap: imaplib.IMAP4, uids: list[bytes]) -> dict[bytes, Optional[str]]:
+    """Returns the Message-ID header of each UID, with a single FETCH."""
+    status, data = imap.uid("FETCH", message_set(uids), "(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH of Message-IDs failed: {data}")
+    message_ids: dict[bytes, Optional[str]] = {}
+    for item in parse_fetch_response(data):
+        if "UID" not in item:
+            continue
+        headers = next((value for key, value in item.items() if key.startswith("BODY[HEADER")), b"") or b""
+        message_id = BytesHeaderParser().parsebytes(headers).get("Message-ID")
+        message_ids[item["UID"]] = message_id.strip() if message_id else None
+    return message_ids
+
+
+class BatchedFetcher:
+    """
+    Fetches messages in UID batches, downloading only the parts that are used.
+
+    The first worker that asks for a UID fetches its whole batch in two kinds
+    of round trips: one UID FETCH for BODYSTRUCTURE and the key headers of the
+    batch, then one UID FETCH of BODY.PEEK[<section>] per distinct section
+    layout. PEEK keeps the messages unseen until processing succeeds. Every
+    attachment is fetched, however large, since every one is forwarded.
+
+    Parts larger than `chunk_bytes` are left out of the batched FETCH and
+    pulled with partial fetches (BODY.PEEK[<section>]<offset.length>) straight
+    into a SpooledPayload, so a large attachment is never held in memory whole.
+    """
+
+    def __init__(
+        self,
+        uids: list[bytes],
+        connections: ImapConnections,
+        batch_size: int,
+        chunk_bytes: int = 1024 * 1024,
+        spool_threshold: int = 1024 * 1024,
+    ):
+        self.connections = connections
+        self.chunk_bytes = max(1, chunk_bytes)
+        self.spool_threshold = spool_threshold
+        batch_size = max(1, batch_size)
+        self._batches = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+        self._batch_of = {uid: index for index, batch in enumerate(self._batches) for uid in batch}
+        self._locks = [threading.Lock() for _ in self._batches]
+        self._fetched: dict[int, dict[bytes, FetchedMessage]] = {}
+
+    def fetch(self, uid: bytes) -> FetchedMessage:
+        """Returns the message for `uid`, fetching its batch on first use."""
+        index = self._batch_of[uid]
+        with self._locks[index]:
+            if index not in self._fetched:
+                with observe_outcome(IMAP_OPERATION_SECONDS, operation="fetch"):
+                    self._fetched[index] = self._fetch_batch(self._batches[index])
+            batch = self._fetched[index]
+            message = batch.pop(uid, None)
+            if not batch:
+                del self._fetched[index]
+        if message is None:
+            raise LookupError(f"Message UID {uid.decode()} was not returned by the server.")
+        return message
+
+    def _fetch_batch(self, uids: list[bytes]) -> dict[bytes, FetchedMessage]:
+        imap = self.connections.get()
+        status, data = imap.uid("FETCH", message_set(uids), f"(UID BODYSTRUCTURE {HEADER_FIELDS})")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH BODYSTRUCTURE failed: {data}")
+
+        messages: dict[bytes, FetchedMessage] = {}
+        wanted: dict[bytes, list[PartInfo]] = {}
+        for item in parse_fetch_response(data):
+            if "UID" not in item or "BODYSTRUCTURE" not in item:
+                continue
+            uid = item["UID"]
+            headers = next((value for key, value in item.items() if key.startswith("BODY[HEADER")), b"") or b""
+            message = FetchedMessage(uid=uid, headers=headers)
+            messages[uid] = message
+            wanted[uid] = [part for part in parse_bodystructure(item["BODYSTRUCTURE"]) if is_needed_part(part)]
+
+        # Messages with the same section layout share a single FETCH; large parts are streamed.
+        payloads: dict[bytes, dict[str, SpooledPayload]] = {uid: {} for uid in wanted}
+        layouts: dict[tuple[str, ...], list[bytes]] = {}
+        for uid, parts in wanted.items():
+            small = tuple(part.section for part in parts if part.size <= self.chunk_bytes)
+            if small:
+                layouts.setdefault(small, []).append(uid)
+            for part in parts:
+                if part.size > self.chunk_bytes:
+                    payloads[uid][part.section] = self._fetch_in_chunks(imap, uid, part.section)
+
+        for sections, layout_uids in layouts.items():
+            items = " ".join(f"BODY.PEEK[{section}]" for section in sections)
+            status, data = imap.uid("FETCH", message_set(layout_uids), f"(UID {items})")
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"UID FETCH of body sections failed: {data}")
+            for item in parse_fetch_response(data):
+                uid = item.get("UID")
+                if uid not in payloads:
+                    continue
+                for section in sections:
+                    payloads[uid][section] = SpooledPayload.from_bytes(
+                        item.get(f"BODY[{section}]") or b"", self.spool_threshold
+                    )
+
+        for uid, parts in wanted.items():
+            messages[uid].parts = [
+                FetchedPart(info=part, payload=payloads[uid][part.section])
+                for part in parts if part.section in payloads[uid]
+            ]
+        return messages
+
+    def _fetch_in_chunks(self, imap: imaplib.IMAP4, uid: bytes, section: str) -> SpooledPayload:
+        payload = SpooledPayload(self.spool_threshold)
+        offset = 0
+        while True:
+            status, data = imap.uid(
+                "FETCH", uid.decode(), f"(UID BODY.PEEK[{section}]<{offset}.{self.chunk_bytes}>)"
+            )
+            if status != "OK":
+                payload.close()
+                raise imaplib.IMAP4.error(f"Partial UID FETCH of section {section} failed: {data}")
+            item = next((item for item in parse_fetch_response(data) if item.get("UID") == uid), {})
+            chunk = next((value for key, value in item.items() if key.startswith(f"BODY[{section}]")), None) or b""
+            payload.write(chunk)
+            offset += len(chunk)
+            if len(chunk) < self.chunk_bytes:
+                return payload
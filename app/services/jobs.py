@@ -0,0 +1,116 @@
+# app/services/jobs.py
+
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from app.schemas.app_schemas import ProcessingResult
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingJob:
+    """A background processing run and the results it has produced so far."""
+
+    def __init__(self, mailbox: str, requested_by: str):
+        self.id = uuid.uuid4().hex
+        self.mailbox = mailbox
+        self.requested_by = requested_by
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.results: list[ProcessingResult] = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    @property
+    def sent_count(self) -> int:
+        return sum(1 for result in self.results if "successfully" in result.status)
+
+    @property
+    def failed_count(self) -> int:
+        return sum(1 for result in self.results if result.status.startswith("Failed"))
+
+    def add_result(self, result: ProcessingResult):
+        with self._lock:
+            self.results.append(result)
+
+    def results_since(self, index: int) -> list[ProcessingResult]:
+        with self._lock:
+            return self.results[index:]
+
+
+class JobManager:
+    """
+    Runs processing jobs on a background executor, at most one per mailbox.
+
+    Submitting work for a mailbox that already has a queued or running job
+    returns that job instead of starting a duplicate run. Finished jobs are
+    kept for lookup until `history_size` newer jobs have been created.
+    """
+
+    def __init__(self, max_workers: int, history_size: int = 100):
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="processing-job")
+        self._jobs: OrderedDict[str, ProcessingJob] = OrderedDict()
+        self._active: dict[str, ProcessingJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, mailbox: str, requested_by: str, work: Callable[[Callable[[ProcessingResult], None]], None]
+    ) -> tuple[ProcessingJob, bool]:
+        """
+        Starts `work(on_result)` for `mailbox` unless a job is already active there.
+
+        Returns the job and whether it was newly created.
+        """
+        with self._lock:
+            active = self._active.get(mailbox)
+            if active is not None and not active.finished:
+                return active, False
+
+            job = ProcessingJob(mailbox=mailbox, requested_by=requested_by)
+            self._jobs[job.id] = job
+            self._active[mailbox] = job
+            while len(self._jobs) > self.history_size:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.finished:
+                    break
+                del self._jobs[oldest_id]
+
+        self._executor.submit(self._run, job, work)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ProcessingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ProcessingJob, work: Callable[[Callable[[ProcessingResult], None]], None]):
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        logger.info(f"Processing job {job.id} started for mailbox '{job.mailbox}'.")
+        try:
+            work(job.add_result)
+            job.status = "completed"
+        except Exception as e:
+            logger.error(f"Processing job {job.id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            with self._lock:
+                if self._active.get(job.mailbox) is job:
+                    del self._active[job.mailbox]
+            logger.info(f"Processing job {job.id} {job.status}: {len(job.results)} results, {job.sent_count} sent.")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,215 @@
+# app/services/ledger.py
+
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import and_, not_
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models.ledger import LedgerOutcome, ProcessedMessage
+
+logger = logging.getLogger(__name__)
+
+# What to do with a message, given its ledger entry.
+PROCESS = "process"
+SKIP = "skip"
+FLAG_ONLY = "flag_only"  # already forwarded; only \Seen is missing
+
+_ENTRY_FIELDS = (
+    "message_id", "outcome", "flagged", "attempts", "error", "source_from", "source_subject",
+    "recipient_email", "physical_address", "extraction_path", "updated_at",
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When messages with a known outcome are processed again.
+
+    Failed messages are retried after `failed_retry_seconds`, doubling with
+    every attempt, until `max_attempts`. Messages without a recipient are
+    retried after `no_recipient_retry_seconds` (never when None). Sends
+    interrupted before their outcome was known are only retried when
+    `retry_uncertain_sends` is set, since that may forward them twice.
+    """
+    failed_retry_seconds: float = 900.0
+    max_attempts: int = 5
+    no_recipient_retry_seconds: Optional[float] = None
+    retry_uncertain_sends: bool = False
+
+
+@dataclass
+class LedgerEntry:
+    """Detached copy of a ledger row."""
+    outcome: LedgerOutcome
+    flagged: bool = False
+    attempts: int = 0
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+    source_from: Optional[str] = None
+    source_subject: Optional[str] = None
+    recipient_email: Optional[str] = None
+    physical_address: Optional[str] = None
+    extraction_path: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    matched_by_uid: bool = True  # False when found through the Message-ID only
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timestamps back without a timezone.
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def decide(entry: Optional[LedgerEntry], policy: RetryPolicy, now: datetime) -> str:
+    """Returns PROCESS, SKIP or FLAG_ONLY for a message with the given ledger entry."""
+    if entry is None:
+        return PROCESS
+    if entry.outcome == LedgerOutcome.SENT:
+        return SKIP if entry.flagged else FLAG_ONLY
+    if entry.outcome == LedgerOutcome.SENDING:
+        return PROCESS if policy.retry_uncertain_sends else SKIP
+
+    if entry.outcome == LedgerOutcome.FAILED:
+        if entry.attempts >= policy.max_attempts:
+            return SKIP
+        retry_after = policy.failed_retry_seconds * 2 ** max(0, entry.attempts - 1)
+    else:
+        retry_after = policy.no_recipient_retry_seconds
+    if retry_after is None:
+        return SKIP
+    updated_at = _as_utc(entry.updated_at)
+    if updated_at is None or (now - updated_at).total_seconds() >= retry_after:
+        return PROCESS
+    return SKIP
+
+
+class ProcessingLedger:
+    """
+    Persistent record of what happened to each message of one mailbox.
+
+    Rows are keyed by mailbox, UIDVALIDITY and UID; the Message-ID is kept
+    as well so a message is still recognised after the mailbox has been
+    renumbered. `mailbox` names the account as well as the folder (see
+    `mailbox_key`), so every run against the same folder shares its rows.
+    Writes come from several pipeline threads and are serialized here.
+    """
+
+    def __init__(self, mailbox: str, uid_validity: int, policy: RetryPolicy, session_factory=SessionLocal):
+        self.mailbox = mailbox
+        self.uid_validity = uid_validity
+        self.policy = policy
+        self.opened_at = datetime.now(timezone.utc)
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+
+    def load(self, uids: list[bytes], message_ids: dict[bytes, Optional[str]]) -> dict[bytes, LedgerEntry]:
+        """Returns the known entries for `uids`, by UID first and by Message-ID otherwise."""
+        db = self._session_factory()
+        try:
+            rows = db.query(ProcessedMessage).filter(
+                ProcessedMessage.mailbox == self.mailbox,
+                ProcessedMessage.uid_validity == self.uid_validity,
+                ProcessedMessage.uid.in_([int(uid) for uid in uids]),
+            ).all()
+            entries = {str(row.uid).encode(): self._entry(row) for row in rows}
+
+            by_message_id = {message_ids[uid]: uid for uid in uids if uid not in entries and message_ids.get(uid)}
+            if by_message_id:
+                rows = db.query(ProcessedMessage).filter(
+                    ProcessedMessage.mailbox == self.mailbox,
+                    ProcessedMessage.message_id.in_(list(by_message_id)),
+                ).order_by(ProcessedMessage.updated_at).all()
+                for row in rows:
+                    entry = self._entry(row)
+                    entry.matched_by_uid = False
+                    entries[by_message_id[row.message_id]] = entry  # the most recent row wins
+            return entries
+        finally:
+            db.close()
+
+    @staticmethod
+    def _entry(row: ProcessedMessage) -> LedgerEntry:
+        return LedgerEntry(**{name: getattr(row, name) for name in _ENTRY_FIELDS})
+
+    def record(self, uid: bytes, outcome: LedgerOutcome, count_attempt: bool = False, **fields: Any):
+        """
+        Creates or updates the row for `uid` with `outcome` and any other column in `fields`.
+
+        `count_attempt` adds one to the row's attempt counter.
+        """
+        with self._lock:
+            db = self._session_factory()
+            try:
+                row = db.query(ProcessedMessage).filter(
+                    ProcessedMessage.mailbox == self.mailbox,
+                    ProcessedMessage.uid_validity == self.uid_validity,
+                    ProcessedMessage.uid == int(uid),
+                ).first()
+                if row is None:
+                    row = ProcessedMessage(
+                        mailbox=self.mailbox, uid_validity=self.uid_validity, uid=int(uid), attempts=0, flagged=False
+                    )
+                    db.add(row)
+                row.outcome = outcome
+                row.updated_at = datetime.now(timezone.utc)
+                for name, value in fields.items():
+                    setattr(row, name, value)
+                if count_attempt:
+                    row.attempts = (row.attempts or 0) + 1
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Could not update the processing ledger for UID {uid.decode()}: {e}", exc_info=True)
+            finally:
+                db.close()
+
+    def claim(self, uid: bytes, **fields: Any) -> bool:
+        """
+        Marks `uid` as SENDING unless another run got there first; returns whether this run may send it.
+
+        Runs in other processes (source shards, the IDLE worker) can pick up
+        the same message. The check and the write are one conditional UPDATE
+        (or the INSERT of a new row), so only one of them wins: the message
+        is refused when it was sent, or when another run started sending it
+        after this ledger was opened.
+        """
+        row_filter = (
+            ProcessedMessage.mailbox == self.mailbox,
+            ProcessedMessage.uid_validity == self.uid_validity,
+            ProcessedMessage.uid == int(uid),
+        )
+        values = {"outcome": LedgerOutcome.SENDING, "updated_at": datetime.now(timezone.utc), **fields}
+        with self._lock:
+            db = self._session_factory()
+            try:
+                claimed = db.query(ProcessedMessage).filter(
+                    *row_filter,
+                    ProcessedMessage.outcome != LedgerOutcome.SENT,
+                    not_(and_(
+                        ProcessedMessage.outcome == LedgerOutcome.SENDING,
+                        ProcessedMessage.updated_at >= self.opened_at,
+                    )),
+                ).update(values, synchronize_session=False)
+                if not claimed and db.query(ProcessedMessage.id).filter(*row_filter).first() is None:
+                    db.add(ProcessedMessage(
+                        mailbox=self.mailbox, uid_validity=self.uid_validity, uid=int(uid), attempts=0, flagged=False,
+                        **values,
+                    ))
+                    claimed = 1
+                db.commit()
+                return bool(claimed)
+            except IntegrityError:
+                db.rollback()  # another run inserted the row first
+                return False
+            finally:
+                db.close()
+
+    def adopt(self, uid: bytes, entry: LedgerEntry):
+        """Stores an entry found through its Message-ID under the message's current UID."""
+        self.record(uid, entry.outcome, **{name: getattr(entry, name) for name in _ENTRY_FIELDS if name != "outcome"})
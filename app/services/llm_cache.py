@@ -0,0 +1,153 @@
+# app/services/llm_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_QUOTE_MARKERS = re.compile(r"^(\s*>)+", re.MULTILINE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalizes a prompt so replies and resends of the same content share a key."""
+    text = unicodedata.normalize("NFKC", prompt)
+    text = _QUOTE_MARKERS.sub("", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_key(prompt: str, model: str) -> str:
+    """Returns the cache key for a prompt sent to `model`."""
+    return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class LlmResultCache:
+    """
+    TTL + LRU cache for LLM extraction results, with optional SQLite backing.
+
+    `get_or_compute` also coalesces in-flight duplicates: while one thread is
+    waiting on the API for a key, other callers with the same key wait for
+    that call instead of issuing their own. Values must be JSON-serializable.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.counters: Counter = Counter()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM llm_results WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns a live cached value or None."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._put_locked(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Returns the cached value for `key`, computing it at most once across concurrent callers."""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.counters["hits"] += 1
+                return value
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _get_locked(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= now:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+
+        if self._conn is not None:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_results WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                return value
+        return None
+
+    def _put_locked(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, value)
+        if self._conn is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_results WHERE key NOT IN (SELECT key FROM llm_results ORDER BY expires_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), **self.counters}
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache(max_entries: int, ttl_seconds: float, path: Optional[str] = None) -> LlmResultCache:
+    """Returns the process-wide cache for the given configuration, so results outlive a single run."""
+    return LlmResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds, path=path)
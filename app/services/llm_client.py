@@ -0,0 +1,263 @@
+# app/services/llm_client.py
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Mapping, Optional
+
+from app.config import Settings
+from app.metrics import GROQ_REQUEST_SECONDS, GROQ_TOKENS
+
+logger = logging.getLogger(__name__)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parses Groq's reset headers ("7.66s", "2m59.56s", "120ms") or a plain number of seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """
+    Request-rate limiter: `rate` requests per second with bursts of up to `capacity`.
+
+    `pause(seconds)` holds every caller back (after a 429 or an exhausted
+    rate-limit window) and `set_rate` lets response headers slow it down.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: float):
+        self.rate = min(self.max_rate, max(rate, self.max_rate / 100))
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    Caps requests in flight, additive-increase / multiplicative-decrease.
+
+    The limit starts at `maximum`, is halved on every 429 (down to
+    `minimum`) and grows by one after a full window of successes.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = self.maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
+
+
+# --- Client ---
+
+class LlmClient:
+    """
+    Groq chat-completion client built on AsyncGroq, shared by all pipeline workers.
+
+    The async client runs on its own event loop thread; synchronous callers
+    use `complete()`, which blocks the calling thread only. Every call goes
+    through a token bucket (LLM_REQUESTS_PER_MINUTE, slowed down by the
+    x-ratelimit-* response headers) and an adaptive concurrency limit,
+    is cut off after LLM_TIMEOUT_SECONDS, and is retried on 429s, timeouts,
+    connection errors and 5xx responses with jittered exponential backoff
+    (honouring retry-after when the server sends it).
+
+    The groq SDK is imported and the AsyncGroq client created on the first
+    request, so constructing this client costs next to nothing.
+    """
+
+    def __init__(self, settings: Settings):
+        self.timeout_seconds = settings.LLM_TIMEOUT_SECONDS
+        self.max_retries = settings.LLM_MAX_RETRIES
+        self.backoff_base_seconds = settings.LLM_BACKOFF_BASE_SECONDS
+        self.backoff_max_seconds = settings.LLM_BACKOFF_MAX_SECONDS
+        self.counters: Counter = Counter()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+        self._settings = settings
+        self._client = None
+
+        async def setup():
+            # Created on the loop that will use them.
+            self.bucket = TokenBucket(
+                rate=settings.LLM_REQUESTS_PER_MINUTE / 60, capacity=settings.LLM_MAX_CONCURRENCY
+            )
+            self.concurrency = AdaptiveConcurrency(settings.LLM_MAX_CONCURRENCY, settings.LLM_MIN_CONCURRENCY)
+
+        asyncio.run_coroutine_threadsafe(setup(), self._loop).result()
+
+    def complete(self, **kwargs: Any):
+        """Creates a chat completion (same arguments as `chat.completions.create`) and waits for it."""
+        return asyncio.run_coroutine_threadsafe(self.acomplete(**kwargs), self._loop).result()
+
+    def _connect(self):
+        """Imports the groq SDK and creates the AsyncGroq client (on the loop thread, at the first request)."""
+        import groq
+
+        self._groq = groq
+        # Failures worth another attempt; anything else (bad request, auth) is raised at once.
+        self._retryable_errors = (
+            groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError, asyncio.TimeoutError
+        )
+        self._client = groq.AsyncGroq(
+            api_key=self._settings.GROQ_API_KEY,
+            base_url=self._settings.GROQ_BASE_URL,
+            max_retries=0,
+            timeout=self._settings.LLM_TIMEOUT_SECONDS,
+        )
+
+    async def acomplete(self, **kwargs: Any):
+        if self._client is None:
+            self._connect()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            retry_after = None
+            async with self.concurrency:
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    self.counters["requests"] += 1
+                    raw = await asyncio.wait_for(
+                        self._client.chat.completions.with_raw_response.create(**kwargs), self.timeout_seconds
+                    )
+                    completion = await raw.parse()
+                    outcome = "ok"
+                except self._retryable_errors as e:
+                    error = e
+                    if isinstance(e, self._groq.RateLimitError):
+                        outcome = "throttled"
+                        self.counters["throttled"] += 1
+                        self.concurrency.on_throttle()
+                        retry_after = parse_reset_duration(e.response.headers.get("retry-after"))
+                        if retry_after:
+                            self.bucket.pause(retry_after)
+                    elif isinstance(e, asyncio.TimeoutError):
+                        outcome = "timeout"
+                        self.counters["timeouts"] += 1
+                    else:
+                        self.counters["errors"] += 1
+                else:
+                    self._observe(raw.headers)
+                    self._count_tokens(completion)
+                    self.concurrency.on_success()
+                    return completion
+                finally:
+                    GROQ_REQUEST_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+
+            if attempt == self.max_retries:
+                self.counters["failed"] += 1
+                raise error
+            delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+            delay = max(delay, retry_after or 0.0)
+            self.counters["retries"] += 1
+            logger.warning(
+                f"Groq call failed ({type(error).__name__}: {error}); retry {attempt + 1}/{self.max_retries} "
+                f"in {delay:.2f}s (concurrency limit {self.concurrency.limit})."
+            )
+            await asyncio.sleep(delay)
+
+    def _observe(self, headers: Mapping[str, str]):
+        """Slows the bucket down to what the rate-limit headers say is left in the current window."""
+        for kind in ("requests", "tokens"):
+            remaining = _header_int(headers, f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is None or not reset:
+                continue
+            if remaining <= 0:
+                self.bucket.pause(reset)
+            elif kind == "requests":
+                self.bucket.set_rate(remaining / reset)
+
+    @staticmethod
+    def _count_tokens(completion: Any):
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return
+        GROQ_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+        GROQ_TOKENS.labels(kind="completion").inc(usage.completion_tokens or 0)
+
+    def stats(self) -> dict:
+        return {**self.counters, "concurrency_limit": self.concurrency.limit, "rate_per_second": round(self.bucket.rate, 3)}
+
+    def close(self):
+        """Closes the HTTP client and stops the event loop thread."""
+        if self._client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error while closing the Groq client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        logger.info(f"LLM client stats: {self.stats()}")
@@ -0,0 +1,239 @@
+# app/services/mime_stream.py
+
+import base64
+import binascii
+import hashlib
+import os
+import quopri
+import tempfile
+from dataclasses import dataclass, field
+from email.message import Message
+from email.parser import BytesHeaderParser
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+
+CHUNK_SIZE = 64 * 1024
+
+
+class SpooledPayload:
+    """
+    A part payload, kept in memory while small and spilled to a temporary file once large.
+
+    The payload is stored exactly as it arrived (still content-transfer-
+    encoded), so it can be forwarded without being decoded and re-encoded.
+    """
+
+    def __init__(self, threshold: int):
+        self._file = tempfile.SpooledTemporaryFile(max_size=threshold)
+        self.size = 0
+
+    @classmethod
+    def from_bytes(cls, data: bytes, threshold: int) -> "SpooledPayload":
+        payload = cls(threshold)
+        payload.write(data)
+        return payload
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def lines(self) -> Iterator[bytes]:
+        self._file.seek(0)
+        yield from self._file
+
+    def getvalue(self) -> bytes:
+        """Returns the whole payload; only meant for small (text) parts."""
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+    def __getstate__(self):
+        raise TypeError("SpooledPayload stays in the process that received it; pass decoded bytes or a file path.")
+
+
+def decode_transfer_encoding(payload: bytes, encoding: str) -> bytes:
+    """Undoes a part's Content-Transfer-Encoding."""
+    if encoding == "base64":
+        return base64.b64decode(payload)
+    if encoding == "quoted-printable":
+        return quopri.decodestring(payload)
+    return payload
+
+
+def decode_to_file(payload: SpooledPayload, encoding: str) -> tuple[str, str]:
+    """
+    Streams a decoded copy of `payload` into a temporary file.
+
+    Returns the file path and the SHA-256 of the decoded bytes. The caller
+    owns the file and must remove it.
+    """
+    digest = hashlib.sha256()
+    handle = tempfile.NamedTemporaryFile(prefix="attachment-", delete=False)
+    try:
+        if encoding == "base64":
+            leftover = b""
+            for chunk in payload.chunks():
+                data = leftover + b"".join(chunk.split())
+                usable = len(data) - len(data) % 4
+                leftover = data[usable:]
+                decoded = binascii.a2b_base64(data[:usable]) if usable else b""
+                digest.update(decoded)
+                handle.write(decoded)
+            if leftover:
+                decoded = base64.b64decode(leftover + b"=" * (-len(leftover) % 4))
+                digest.update(decoded)
+                handle.write(decoded)
+        elif encoding == "quoted-printable":
+            for line in payload.lines():
+                decoded = quopri.decodestring(line)
+                digest.update(decoded)
+                handle.write(decoded)
+        else:
+            for chunk in payload.chunks():
+                digest.update(chunk)
+                handle.write(chunk)
+    except Exception:
+        handle.close()
+        os.remove(handle.name)
+        raise
+    handle.close()
+    return handle.name, digest.hexdigest()
+
+
+# --- Message Parts ---
+
+@dataclass
+class PartInfo:
+    """One leaf MIME part, as described by BODYSTRUCTURE or by the part's own headers."""
+    section: str
+    content_type: str
+    params: dict[str, str] = field(default_factory=dict)
+    encoding: str = "7bit"
+    size: int = 0
+    disposition: Optional[str] = None
+    filename: Optional[str] = None
+
+
+@dataclass
+class FetchedPart:
+    info: PartInfo
+    payload: SpooledPayload  # still content-transfer-encoded
+
+
+@dataclass
+class FetchedMessage:
+    """Headers plus the parts of a message that processing actually uses."""
+    uid: bytes
+    headers: bytes
+    parts: list[FetchedPart] = field(default_factory=list)
+
+    def close(self):
+        for part in self.parts:
+            part.payload.close()
+
+
+# --- Incremental MIME Parsing ---
+
+def _read_headers(lines: Iterator[bytes], terminators: set[bytes]) -> tuple[bytes, Optional[bytes]]:
+    header_lines = []
+    for line in lines:
+        stripped = line.rstrip()
+        if stripped in terminators:
+            return b"".join(header_lines), stripped
+        if not stripped:
+            return b"".join(header_lines), None
+        header_lines.append(line)
+    return b"".join(header_lines), None
+
+
+def _skip_until(lines: Iterator[bytes], terminators: set[bytes]) -> Optional[bytes]:
+    for line in lines:
+        stripped = line.rstrip()
+        if stripped in terminators:
+            return stripped
+    return None
+
+
+def _leaf_info(headers: Message, section: str, size: int) -> PartInfo:
+    return PartInfo(
+        section=section,
+        content_type=headers.get_content_type(),
+        params={key.lower(): str(value) for key, value in (headers.get_params() or [])[1:]},
+        encoding=str(headers.get("Content-Transfer-Encoding", "7bit")).strip().lower(),
+        size=size,
+        disposition=headers.get_content_disposition(),
+        filename=headers.get_filename(),
+    )
+
+
+def _parse_entity(
+    lines: Iterator[bytes],
+    headers: Message,
+    section: str,
+    terminators: set[bytes],
+    parts: list[FetchedPart],
+    threshold: int,
+) -> Optional[bytes]:
+    """Parses one entity body after its headers; returns the terminator line that ended it."""
+    boundary = headers.get_boundary() if headers.get_content_maintype() == "multipart" else None
+    if boundary:
+        delimiter = b"--" + boundary.encode("utf-8", "replace")
+        close_delimiter = delimiter + b"--"
+        inner = {delimiter, close_delimiter} | terminators
+        ended_by = _skip_until(lines, inner)
+        index = 0
+        while ended_by == delimiter:
+            index += 1
+            child_section = f"{section}.{index}" if section else str(index)
+            raw_headers, ended_by = _read_headers(lines, inner)
+            if ended_by is not None:
+                continue
+            child_headers = BytesHeaderParser().parsebytes(raw_headers)
+            ended_by = _parse_entity(lines, child_headers, child_section, inner, parts, threshold)
+        if ended_by == close_delimiter:
+            ended_by = _skip_until(lines, terminators)
+        return ended_by
+
+    payload = SpooledPayload(threshold)
+    previous: Optional[bytes] = None
+    ended_by = None
+    for line in lines:
+        stripped = line.rstrip()
+        if stripped in terminators:
+            ended_by = stripped
+            break
+        if previous is not None:
+            payload.write(previous)
+        previous = line
+    if previous is not None:
+        # The line break before a boundary belongs to the boundary, not the payload.
+        payload.write(previous.rstrip(b"\r\n") if ended_by is not None else previous)
+    parts.append(FetchedPart(info=_leaf_info(headers, section or "1", payload.size), payload=payload))
+    return ended_by
+
+
+def parse_mime_stream(stream: Union[BinaryIO, Iterable[bytes]], threshold: int) -> FetchedMessage:
+    """
+    Parses an RFC822 message from a binary stream (or any iterable of its
+    lines) without holding it in memory.
+
+    The message is read line by line; each leaf part's payload is spooled
+    (still encoded) into a SpooledPayload that moves to a temporary file
+    once it exceeds `threshold` bytes. The result has the same shape as a
+    message fetched part-by-part over IMAP.
+    """
+    lines = iter(stream)
+    raw_headers, _ = _read_headers(lines, set())
+    headers = BytesHeaderParser().parsebytes(raw_headers)
+    message = FetchedMessage(uid=b"", headers=raw_headers)
+    _parse_entity(lines, headers, "", set(), message.parts, threshold)
+    return message
@@ -0,0 +1,303 @@
+# app/services/ocr_engine.py
+
+import logging
+import math
+import os
+import time
+from concurrent.futures import Future, InvalidStateError, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from app.metrics import OCR_PAGE_SECONDS
+from app.services.extraction_cache import IMAGE_OCR, PAGE_OCR, PDF_OCR, ExtractionCache
+from app.services.pipeline import discard_process_pool, shared_process_pool
+
+if TYPE_CHECKING:
+    import fitz
+
+logger = logging.getLogger(__name__)
+
+# PyMuPDF, Pillow and pytesseract are imported where they are used, so importing
+# the app stays cheap; worker processes load them on their first page.
+
+# --- Page Selection ---
+
+@dataclass(frozen=True)
+class OcrPolicy:
+    """Which pages of a PDF are worth OCR'ing, and how they are rendered."""
+    min_text_chars: int = 200
+    image_coverage_threshold: float = 0.5
+    dpi: int = 200
+    max_page_pixels: int = 20_000_000
+    max_pages: int = 10
+
+    @property
+    def cache_tag(self) -> str:
+        return (
+            f"t{self.min_text_chars}-c{self.image_coverage_threshold}-d{self.dpi}"
+            f"-x{self.max_page_pixels}-p{self.max_pages}"
+        )
+
+
+def image_coverage(page: "fitz.Page") -> float:
+    """Returns the fraction of the page area covered by images (overlaps are counted twice)."""
+    import fitz
+
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for img in page.get_images(full=True):
+        for rect in page.get_image_rects(img[0]):
+            clipped = fitz.Rect(rect) & page.rect
+            if not clipped.is_empty:
+                covered += clipped.width * clipped.height
+    return min(1.0, covered / page_area)
+
+
+def needs_ocr(page: "fitz.Page", page_text: str, policy: OcrPolicy) -> bool:
+    """
+    Decides whether a page should be OCR'd.
+
+    Only pages with images qualify. Of those, a page is OCR'd when its
+    text layer is short (a scan, or a text-poor page) or when images cover
+    most of it; a page with a full text layer and a logo is left alone.
+    """
+    if not page.get_images():
+        return False
+    if len(page_text.strip()) < policy.min_text_chars:
+        return True
+    return image_coverage(page) >= policy.image_coverage_threshold
+
+
+def render_dpi(rect: "fitz.Rect", dpi: int, max_pixels: int) -> int:
+    """Lowers `dpi` as needed so a page of size `rect` (in points) renders within `max_pixels`."""
+    pixels = (rect.width * dpi / 72) * (rect.height * dpi / 72)
+    if pixels <= max_pixels:
+        return dpi
+    return max(1, int(dpi * math.sqrt(max_pixels / pixels)))
+
+
+def ocr_pdf_page(pdf_path: str, page_index: int, dpi: int, max_pixels: int) -> str:
+    """Renders one PDF page in grayscale and OCRs it (runs in a worker process)."""
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    try:
+        with fitz.open(pdf_path) as pdf_doc:
+            page = pdf_doc[page_index]
+            pix = page.get_pixmap(dpi=render_dpi(page.rect, dpi, max_pixels), colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return pytesseract.image_to_string(image)
+    except Exception as e:
+        logger.error(f"Pytesseract OCR Error: {e}", exc_info=True)
+        return f"[Pytesseract OCR Error: {e}]"
+
+
+def ocr_image_frame(image_path: str, frame_index: int, max_pixels: int) -> str:
+    """OCRs one frame of an image file (a page of a multi-frame TIFF) in grayscale (runs in a worker process)."""
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(image_path) as image:
+            image.seek(frame_index)
+            frame = ImageOps.exif_transpose(image).convert("L")
+        if frame.width * frame.height > max_pixels:
+            scale = math.sqrt(max_pixels / (frame.width * frame.height))
+            frame = frame.resize((max(1, int(frame.width * scale)), max(1, int(frame.height * scale))))
+        return pytesseract.image_to_string(frame)
+    except Exception as e:
+        logger.error(f"Pytesseract OCR Error: {e}", exc_info=True)
+        return f"[Pytesseract OCR Error: {e}]"
+
+
+def image_frame_count(image_path: str) -> int:
+    """Returns the number of frames of an image file (1 for anything but multi-frame TIFF/GIF)."""
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def timed_ocr(fn, *args) -> tuple[str, float]:
+    """Runs an OCR function and also returns the seconds it took in the worker process."""
+    started = time.perf_counter()
+    text = fn(*args)
+    return text, time.perf_counter() - started
+
+
+# --- Engine ---
+
+class OcrEngine:
+    """
+    Runs Tesseract over the pages of a PDF that need it, on a pool of worker processes.
+
+    Each page is checked against the `OcrPolicy`: pages whose text layer is
+    already complete are skipped, and image-dominated or text-poor pages are
+    rendered once at the policy's DPI and OCR'd as a whole, instead of every
+    embedded image separately. At most `max_pages` pages are OCR'd per
+    document (the ones with the least text first); their text is put back
+    together in page order.
+
+    With an `ExtractionCache`, pages and whole documents seen in earlier
+    runs are answered from the cache without rendering or calling Tesseract.
+    The worker processes are a shared pool that outlives the engine, so
+    engines built per run reuse warm workers.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cache: Optional[ExtractionCache] = None,
+        policy: Optional[OcrPolicy] = None,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = cache
+        self.policy = policy or OcrPolicy()
+        self._executor = shared_process_pool("ocr", self.max_workers)
+
+    def select_pages(self, pdf_doc: "fitz.Document", page_texts: Optional[list[str]] = None) -> list[int]:
+        """Returns the indexes of the pages to OCR, within the page budget, in page order."""
+        candidates = []
+        for page in pdf_doc:
+            page_text = page_texts[page.number] if page_texts is not None else page.get_text()
+            if needs_ocr(page, page_text, self.policy):
+                candidates.append((len(page_text.strip()), page.number))
+
+        if len(candidates) > self.policy.max_pages:
+            logger.warning(
+                f"OCR: {len(candidates)} pages need OCR; only the {self.policy.max_pages} with the least text are processed."
+            )
+            candidates = sorted(candidates)[:self.policy.max_pages]
+        selected = sorted(page_index for _, page_index in candidates)
+        logger.info(f"OCR: {len(selected)} of {len(pdf_doc)} pages selected for OCR.")
+        return selected
+
+    def ocr_pdf_file(
+        self, path: str, key: str, page_texts: Optional[list[str]] = None, deadline: Optional[float] = None
+    ) -> str:
+        """
+        Returns the OCR text of the pages of a PDF file that need it, labelled by page.
+
+        `key` is the content key of the PDF; `page_texts`, when given, is its
+        text layer per page and saves extracting it again. Pages not done by
+        `deadline` (a `time.monotonic()` value) are given up; see `_collect`.
+        """
+        import fitz
+
+        doc_key = f"{key}:{self.policy.cache_tag}"
+        if self.cache:
+            cached = self.cache.get(PDF_OCR, doc_key)
+            if cached is not None:
+                return cached
+
+        with fitz.open(path) as pdf_doc:
+            pages = self.select_pages(pdf_doc, page_texts)
+        futures = [
+            (page_index, self._submit(
+                f"{key}:{page_index}:{self.policy.dpi}:{self.policy.max_page_pixels}",
+                ocr_pdf_page, path, page_index, self.policy.dpi, self.policy.max_page_pixels,
+            ))
+            for page_index in pages
+        ]
+        return self._collect(PDF_OCR, doc_key, futures, deadline)
+
+    def ocr_image_file(self, path: str, key: str, deadline: Optional[float] = None) -> str:
+        """
+        Returns the OCR text of an image file, labelled by page.
+
+        Every frame of a multi-frame TIFF is a page and is OCR'd in parallel
+        with the others, up to the policy's page budget. Frames larger than
+        the pixel budget are scaled down first. Like `ocr_pdf_file`, gives up
+        at `deadline`.
+        """
+        doc_key = f"{key}:{self.policy.max_page_pixels}:{self.policy.max_pages}"
+        if self.cache:
+            cached = self.cache.get(IMAGE_OCR, doc_key)
+            if cached is not None:
+                return cached
+
+        frames = image_frame_count(path)
+        if frames > self.policy.max_pages:
+            logger.warning(f"OCR: image has {frames} pages; only the first {self.policy.max_pages} are processed.")
+            frames = self.policy.max_pages
+        futures = [
+            (frame_index, self._submit(
+                f"{key}:{frame_index}:image:{self.policy.max_page_pixels}",
+                ocr_image_frame, path, frame_index, self.policy.max_page_pixels,
+            ))
+            for frame_index in range(frames)
+        ]
+        return self._collect(IMAGE_OCR, doc_key, futures, deadline)
+
+    def _collect(self, kind: str, doc_key: str, futures: list[tuple[int, Future]], deadline: Optional[float]) -> str:
+        """
+        Waits for the pages' OCR and joins their text in page order.
+
+        At `deadline` the pages still queued for the pool are cancelled, so
+        they do not hold up the next document, and TimeoutError is raised.
+        Pages already being OCR'd run to the end and are still cached.
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        _, pending = wait([future for _, future in futures], timeout=timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise TimeoutError(f"OCR of {len(pending)} of {len(futures)} pages did not finish in time")
+
+        image_ocr_text = ""
+        for page_index, future in futures:
+            ocr_result = future.result()
+            if ocr_result.strip():
+                image_ocr_text += f"\n--- OCR Text from Page {page_index + 1} ---\n{ocr_result}\n"
+
+        if self.cache and "[Pytesseract OCR Error" not in image_ocr_text:
+            self.cache.put(kind, doc_key, image_ocr_text)
+        return image_ocr_text
+
+    def _submit(self, page_key: str, fn, *args) -> Future:
+        if self.cache:
+            cached = self.cache.get(PAGE_OCR, page_key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+        try:
+            timed_future = self._executor.submit(timed_ocr, fn, *args)
+        except BrokenProcessPool:
+            discard_process_pool(self._executor)
+            self._executor = shared_process_pool("ocr", self.max_workers)
+            timed_future = self._executor.submit(timed_ocr, fn, *args)
+        future = Future()
+        # Cancelling the caller's future takes the page off the pool's queue if it has not started.
+        future.add_done_callback(lambda done: timed_future.cancel() if done.cancelled() else None)
+        timed_future.add_done_callback(lambda done: self._finish(done, future, page_key))
+        return future
+
+    def _finish(self, timed: Future, future: Future, key: str):
+        """Records the page's OCR time, caches its text and resolves the caller's future with it."""
+        if timed.cancelled():
+            return
+        try:
+            if timed.exception() is not None:
+                future.set_exception(timed.exception())
+                return
+            text, seconds = timed.result()
+            failed = text.startswith("[Pytesseract OCR Error")
+            OCR_PAGE_SECONDS.labels(outcome="error" if failed else "ok").observe(seconds)
+            if self.cache and not failed:
+                self.cache.put(PAGE_OCR, key, text)
+            future.set_result(text)
+        except InvalidStateError:
+            pass  # the caller gave up on this page (cancelled it) at its deadline
+        except Exception as e:
+            # Resolve the caller's future anyway, or it would wait for its deadline and report a timeout.
+            logger.error(f"OCR: could not finish page {key}: {e}", exc_info=True)
+            try:
+                future.set_exception(e)
+            except InvalidStateError:
+                pass
@@ -0,0 +1,217 @@
+# app/services/pipeline.py
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed through the queues to tell a stage's workers to shut down.
+_STOP = object()
+
+# Process pools live as long as the process, keyed by name and size.
+_process_pools: dict[tuple[str, int], ProcessPoolExecutor] = {}
+_process_pools_guard = threading.Lock()
+
+
+def process_context() -> multiprocessing.context.BaseContext:
+    """
+    Returns the start method for worker processes.
+
+    The API process runs the server, job, IDLE and warm-up threads, so
+    forking it could copy a lock another thread holds (logging, imports)
+    into the child. Workers start from a clean forkserver (or spawn) instead.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def shared_process_pool(
+    name: str, workers: int, initializer: Optional[Callable] = None, initargs: tuple = ()
+) -> ProcessPoolExecutor:
+    """Returns the process pool `name` of `workers` processes, created on first use and kept for later runs."""
+    key = (name, max(1, workers))
+    with _process_pools_guard:
+        pool = _process_pools.get(key)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=key[1], mp_context=process_context(), initializer=initializer, initargs=initargs
+            )
+            _process_pools[key] = pool
+        return pool
+
+
+def discard_process_pool(pool: ProcessPoolExecutor):
+    """Drops a broken shared pool (a worker died), so the next run starts a fresh one."""
+    with _process_pools_guard:
+        for key, existing in list(_process_pools.items()):
+            if existing is pool:
+                del _process_pools[key]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pools():
+    """Stops every shared process pool (on application shutdown)."""
+    with _process_pools_guard:
+        pools = list(_process_pools.values())
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+
+def run_in_pool(name: str, workers: int, fn: Callable, *args: Any) -> Any:
+    """
+    Runs a function in the shared process pool `name` and waits for its result.
+
+    The pool is looked up on every call: if a worker died and the pool was
+    discarded, the next call starts a fresh one instead of failing too.
+    """
+    pool = shared_process_pool(name, workers)
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        discard_process_pool(pool)
+        raise
+
+
+def run_inline(fn: Callable, *args: Any) -> Any:
+    """Runs a function in the calling thread (runner for I/O stages)."""
+    return fn(*args)
+
+
+@dataclass
+class Stage:
+    """
+    A single step of the pipeline.
+
+    `func(item, run)` does the stage's work on one item and returns nothing.
+    `run(fn, *args)` executes `fn` inline for "thread" stages and in a process
+    pool for "process" stages, so CPU-heavy work can be handed off while the
+    item itself (and any open connections it refers to) stays in this process.
+    A process stage's pool is shared by every run with the same stage name
+    and size, so its workers are started once rather than per batch.
+    """
+    name: str
+    func: Callable[[Any, Callable], None]
+    workers: int = 1
+    kind: str = "thread"  # "thread" for I/O-bound work, "process" for CPU-bound work
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues.
+
+    Every stage has its own pool of worker threads, so a slow stage only
+    backs up its own input queue instead of stalling the whole batch.
+    Items whose `done` attribute is set skip the remaining stages, and an
+    exception raised by a stage is handed to `on_error` before the item is
+    marked done and passed along. `on_complete` is called with each item as
+    soon as it leaves the last stage, and `on_stage` with the item, stage
+    name, seconds spent and whether the stage failed after every stage that
+    ran on it. With `keep_results` off, finished items are not collected,
+    so arbitrarily long runs keep a bounded memory footprint.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        queue_size: int = 16,
+        on_error: Optional[Callable[[Any, str, Exception], None]] = None,
+        on_complete: Optional[Callable[[Any], None]] = None,
+        on_stage: Optional[Callable[[Any, str, float, bool], None]] = None,
+        keep_results: bool = True,
+    ):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.on_complete = on_complete
+        self.on_stage = on_stage
+        self.keep_results = keep_results
+
+    def run(self, items: Iterable[Any]) -> list[Any]:
+        """Feeds `items` through every stage and returns them in completion order (if kept)."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads: list[threading.Thread] = []
+        stage_threads: list[list[threading.Thread]] = []
+
+        for index, stage in enumerate(self.stages):
+            runner = run_inline
+            if stage.kind == "process":
+                shared_process_pool(f"pipeline-{stage.name}", stage.workers)  # start the workers up front
+                runner = lambda fn, *args, _name=f"pipeline-{stage.name}", _workers=stage.workers: run_in_pool(
+                    _name, _workers, fn, *args
+                )
+
+            workers = []
+            for worker_index in range(max(1, stage.workers)):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, runner, queues[index], queues[index + 1]),
+                    name=f"pipeline-{stage.name}-{worker_index}",
+                    daemon=True,
+                )
+                thread.start()
+                workers.append(thread)
+            stage_threads.append(workers)
+            threads.extend(workers)
+
+        results: list[Any] = []
+        collector = threading.Thread(
+            target=self._collect, args=(queues[-1], results), name="pipeline-collector", daemon=True
+        )
+        collector.start()
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            # Shut stages down in order: once every worker of a stage has
+            # drained its input, the next stage gets one stop signal per worker.
+            for index, workers in enumerate(stage_threads):
+                for _ in workers:
+                    queues[index].put(_STOP)
+                for thread in workers:
+                    thread.join()
+            queues[-1].put(_STOP)
+            collector.join()
+
+        return results
+
+    def _worker(self, stage: Stage, runner: Callable, inbox: queue.Queue, outbox: queue.Queue):
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                return
+            if not getattr(item, "done", False):
+                started = time.perf_counter()
+                failed = False
+                try:
+                    stage.func(item, runner)
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Pipeline stage '{stage.name}' failed: {e}", exc_info=True)
+                    if self.on_error:
+                        self.on_error(item, stage.name, e)
+                    item.done = True
+                if self.on_stage:
+                    self.on_stage(item, stage.name, time.perf_counter() - started, failed)
+            outbox.put(item)
+
+    def _collect(self, outbox: queue.Queue, results: list):
+        while True:
+            item = outbox.get()
+            if item is _STOP:
+                return
+            if self.keep_results:
+                results.append(item)
+            if self.on_complete:
+                try:
+                    self.on_complete(item)
+                except Exception as e:
+                    logger.error(f"Pipeline completion callback failed: {e}", exc_info=True)
@@ -0,0 +1,207 @@
+# app/services/prompt_builder.py
+
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.services.recipient_extractor import (
+    EMAIL_PATTERN,
+    POSTAL_LINE_PATTERN,
+    RECIPIENT_CUE_PATTERN,
+    STREET_LINE_PATTERN,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a llama3 token in characters of English/business text. There
+# is no tokenizer in the dependencies, so budgets are enforced on this estimate.
+CHARS_PER_TOKEN = 4
+
+# Lines per scoring block, and the marker put where blocks were left out.
+BLOCK_LINES = 6
+GAP_MARKER = "[...]"
+
+EMAIL_SCORE = 3.0
+CUE_SCORE = 4.0
+POSTAL_SCORE = 2.0
+EMAIL_BODY_BOOST = 2.0
+EDGE_PAGE_BOOST = 1.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of model tokens in `text`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class Segment:
+    """A piece of the input (email body, one PDF page, OCR text) with its heading and score boost."""
+    heading: str
+    text: str
+    boost: float = 0.0
+
+
+@dataclass
+class _Block:
+    segment: int
+    order: int
+    text: str
+    signal: float  # score from the block's own content
+    boost: float
+    tokens: int
+
+    @property
+    def score(self) -> float:
+        return self.signal + self.boost
+
+
+@dataclass
+class PromptPlan:
+    """
+    The text(s) to send for one message.
+
+    `mode` is "full" when everything fits, "ranked" when only the most
+    relevant blocks were kept, and "map_reduce" when the relevant text
+    needs several calls, one per chunk. `dropped_tokens` counts relevant
+    text that did not fit into `max_chunks` chunks and was not analyzed.
+    """
+    mode: str
+    chunks: list[str] = field(default_factory=list)
+    input_tokens: int = 0
+    dropped_tokens: int = 0
+
+    @property
+    def chunk_tokens(self) -> int:
+        return sum(estimate_tokens(chunk) for chunk in self.chunks)
+
+
+def score_block(text: str) -> float:
+    """Scores a block of lines by how likely it is to hold the recipient or their address."""
+    score = EMAIL_SCORE * min(len(EMAIL_PATTERN.findall(text)), 3)
+    lines = text.splitlines()
+    if any(RECIPIENT_CUE_PATTERN.search(line) for line in lines):
+        score += CUE_SCORE
+    if any(POSTAL_LINE_PATTERN.search(line) for line in lines) or any(STREET_LINE_PATTERN.match(line) for line in lines):
+        score += POSTAL_SCORE
+    return score
+
+
+def _split_blocks(segments: list[Segment], max_block_tokens: int) -> list[_Block]:
+    max_chars = max_block_tokens * CHARS_PER_TOKEN
+    blocks: list[_Block] = []
+    for seg_index, segment in enumerate(segments):
+        current: list[str] = []
+
+        def flush():
+            if current:
+                text = "\n".join(current)
+                blocks.append(_Block(seg_index, len(blocks), text, score_block(text), segment.boost, estimate_tokens(text)))
+                current.clear()
+
+        for line in segment.text.splitlines():
+            if not line.strip():
+                flush()
+                continue
+            # A single huge line (text extracted without line breaks) is cut into pieces.
+            for start in range(0, len(line), max_chars):
+                current.append(line[start:start + max_chars])
+                if len(current) >= BLOCK_LINES or estimate_tokens("\n".join(current)) >= max_block_tokens:
+                    flush()
+        flush()
+    return blocks
+
+
+def _render(segments: list[Segment], blocks: list[_Block]) -> str:
+    """Puts selected blocks back in document order under their segment headings."""
+    parts: list[str] = []
+    previous: Optional[_Block] = None
+    for block in sorted(blocks, key=lambda b: b.order):
+        if previous is None or block.segment != previous.segment:
+            heading = segments[block.segment].heading
+            if heading:
+                parts.append(heading)
+        elif block.order != previous.order + 1:
+            parts.append(GAP_MARKER)
+        parts.append(block.text)
+        previous = block
+    return "\n".join(parts) + "\n"
+
+
+class _Packer:
+    """Fills one prompt with blocks, counting the headings and gap markers they bring along."""
+
+    def __init__(self, segments: list[Segment], budget: int):
+        self.segments = segments
+        self.budget = budget
+        self.blocks: list[_Block] = []
+        self.tokens = 0
+        self._segments_used: set[int] = set()
+
+    def cost(self, block: _Block) -> int:
+        if block.segment in self._segments_used:
+            return block.tokens + estimate_tokens(GAP_MARKER) + 1
+        return block.tokens + estimate_tokens(self.segments[block.segment].heading) + 1
+
+    def add(self, block: _Block) -> bool:
+        cost = self.cost(block)
+        if self.tokens + cost > self.budget:
+            return False
+        self.blocks.append(block)
+        self.tokens += cost
+        self._segments_used.add(block.segment)
+        return True
+
+    def render(self) -> str:
+        return _render(self.segments, self.blocks)
+
+
+def build_prompt_plan(full_text: str, segments: list[Segment], token_budget: int, max_chunks: int) -> PromptPlan:
+    """
+    Fits the text of one message into `token_budget` tokens.
+
+    `full_text` is used unchanged when it fits. Otherwise the segments are
+    split into blocks of a few lines, each scored for email addresses,
+    recipient cues ("To:", "Attn:", "send to") and postal lines, with boosts
+    for the email body and the first and last PDF pages. The best blocks are
+    kept, in document order, if every block with a content signal fits;
+    if not, those blocks are packed into up to `max_chunks` budget-
+    sized chunks, best chunk first, for a map-reduce extraction.
+    """
+    input_tokens = estimate_tokens(full_text)
+    if input_tokens <= token_budget:
+        return PromptPlan(mode="full", chunks=[full_text], input_tokens=input_tokens)
+
+    blocks = _split_blocks(segments, max_block_tokens=max(1, token_budget // 4))
+    ranked = sorted(blocks, key=lambda b: (-b.score, b.order))
+    relevant = [block for block in ranked if block.signal > 0]
+
+    single = _Packer(segments, token_budget)
+    if all(single.add(block) for block in relevant):
+        for block in ranked:
+            if block.signal <= 0:
+                single.add(block)
+        return PromptPlan(mode="ranked", chunks=[single.render()], input_tokens=input_tokens)
+
+    packers = [_Packer(segments, token_budget)]
+    dropped = []
+    for block in relevant:
+        if any(packer.add(block) for packer in packers):
+            continue
+        if len(packers) < max_chunks:
+            packers.append(_Packer(segments, token_budget))
+            if packers[-1].add(block):
+                continue
+        dropped.append(block)
+    dropped_tokens = sum(block.tokens for block in dropped)
+    if dropped:
+        logger.warning(
+            f"Prompt plan: {len(dropped)} relevant blocks ({dropped_tokens} tokens) did not fit into "
+            f"{max_chunks} chunks of {token_budget} tokens and are left out of the analysis."
+        )
+    return PromptPlan(
+        mode="map_reduce",
+        chunks=[packer.render() for packer in packers],
+        input_tokens=input_tokens,
+        dropped_tokens=dropped_tokens,
+    )
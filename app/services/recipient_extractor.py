@@ -0,0 +1,138 @@
+# app/services/recipient_extractor.py
+
+import re
+from dataclasses import dataclass
+from email.utils import parseaddr
+from typing import Iterable, Optional
+
+EMAIL_PATTERN = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+
+# Lines that name the recipient ("To: ...", "Attn: ...", "please forward to ...").
+RECIPIENT_CUE_PATTERN = re.compile(
+    r"^\s*(to|attn|attention|recipient|deliver to|send to|forward to)\b|\b(send|forward|deliver|mail) (it |this )?to\b",
+    re.IGNORECASE,
+)
+
+# Header-like lines whose addresses belong to the sender side of the thread.
+SENDER_LINE_PATTERN = re.compile(r"^\s*(from|sender|reply-to|sent by|cc|bcc)\s*:", re.IGNORECASE)
+
+# "Springfield, IL 62704", "Austin TX 78701-1234", "London SW1A 1AA", "10115 Berlin".
+POSTAL_LINE_PATTERN = re.compile(
+    r"\b[A-Z]{2}\s+\d{5}(-\d{4})?\b"
+    r"|\b[A-Z]{1,2}\d[A-Z\d]?\s*\d[A-Z]{2}\b"
+    r"|^\s*\d{4,5}\s+[A-Za-z]"
+)
+STREET_LINE_PATTERN = re.compile(r"^\s*(\d+[A-Za-z]?\s+\S+|P\.?\s?O\.?\s+Box\b)", re.IGNORECASE)
+
+# Quoted text and reply headers ("On ... Carol <carol@...> wrote:") belong to earlier messages of the thread.
+QUOTED_LINE_PATTERN = re.compile(r"^\s*>")
+REPLY_HEADER_PATTERN = re.compile(r"\bwrote:\s*$|^\s*-{2,}\s*original message\s*-{2,}", re.IGNORECASE)
+
+# The "--- Text from PDF '...' ---" lines that separate the body and each attachment's text.
+SECTION_HEADER_PATTERN = re.compile(r"^\s*---.*---\s*$")
+
+BASE_CONFIDENCE = 0.6
+CUE_BONUS = 0.2
+POSTAL_BONUS = 0.2
+
+
+@dataclass
+class FastPathResult:
+    """Outcome of the local recipient extraction."""
+    recipient_email: Optional[str]
+    physical_address: Optional[str]
+    confidence: float
+
+
+def _normalize_address(address: str) -> str:
+    return parseaddr(address)[1].strip().lower()
+
+
+def _current_message_lines(text: str) -> list[str]:
+    """Returns the lines of `text` with the quoted text and reply headers of earlier messages blanked out."""
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if QUOTED_LINE_PATTERN.match(line) or REPLY_HEADER_PATTERN.search(line):
+            lines[index] = ""
+            if index and line.strip().lower() == "wrote:":
+                lines[index - 1] = ""  # a reply header wrapped before "wrote:"
+    return lines
+
+
+def _paragraph(lines: list[str], index: int) -> tuple[int, int]:
+    """Returns the range of the run of non-blank lines around `index`, section headers excluded."""
+    def blank(line: str) -> bool:
+        return not line.strip() or bool(SECTION_HEADER_PATTERN.match(line))
+
+    start = index
+    while start > 0 and not blank(lines[start - 1]):
+        start -= 1
+    end = index + 1
+    while end < len(lines) and not blank(lines[end]):
+        end += 1
+    return start, end
+
+
+def find_postal_block(lines: list[str], start: int = 0, end: Optional[int] = None) -> Optional[str]:
+    """Returns the first street + city/postcode block within `lines[start:end]`, joined with commas."""
+    for index in range(start, len(lines) if end is None else end):
+        line = lines[index]
+        if not POSTAL_LINE_PATTERN.search(line) or EMAIL_PATTERN.search(line):
+            continue
+        block = [line.strip()]
+        for previous in reversed(lines[max(start, index - 3):index]):
+            if not previous.strip() or EMAIL_PATTERN.search(previous) or SENDER_LINE_PATTERN.match(previous):
+                break
+            block.insert(0, previous.strip())
+        if len(block) > 1 and any(STREET_LINE_PATTERN.match(part) for part in block):
+            return ", ".join(block)
+    return None
+
+
+def extract_recipient(text: str, excluded_addresses: Iterable[Optional[str]]) -> FastPathResult:
+    """
+    Looks for a single unambiguous recipient address without calling the LLM.
+
+    Addresses belonging to the sender side (the original sender, our own
+    SENDER_EMAIL and mailbox addresses, and anything on From/Cc-style
+    lines) are ignored, as is quoted text of earlier messages. Exactly
+    one remaining address scores BASE_CONFIDENCE, plus a bonus when it sits
+    on a recipient cue line and another when a postal block shares its
+    paragraph; that block is taken as its physical address. An address
+    elsewhere in the text (a signature, a letterhead) is left alone.
+    """
+    excluded = {_normalize_address(address) for address in excluded_addresses if address}
+    lines = _current_message_lines(text)
+
+    candidates: dict[str, list[int]] = {}
+    on_cue_line: dict[str, bool] = {}
+    for index, line in enumerate(lines):
+        if SENDER_LINE_PATTERN.match(line):
+            continue
+        for match in EMAIL_PATTERN.finditer(line):
+            address = match.group(0).lower()
+            if address in excluded:
+                continue
+            candidates.setdefault(address, []).append(index)
+            on_cue_line[address] = on_cue_line.get(address, False) or bool(RECIPIENT_CUE_PATTERN.search(line))
+
+    if len(candidates) != 1:
+        return FastPathResult(recipient_email=None, physical_address=None, confidence=0.0)
+
+    recipient_email, indexes = next(iter(candidates.items()))
+    physical_address = None
+    for index in indexes:
+        physical_address = find_postal_block(lines, *_paragraph(lines, index))
+        if physical_address:
+            break
+
+    confidence = BASE_CONFIDENCE
+    if on_cue_line[recipient_email]:
+        confidence += CUE_BONUS
+    if physical_address:
+        confidence += POSTAL_BONUS
+    return FastPathResult(
+        recipient_email=recipient_email,
+        physical_address=physical_address,
+        confidence=round(min(confidence, 1.0), 2),
+    )
@@ -0,0 +1,270 @@
+# app/services/smtp_pool.py
+
+import logging
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Union
+
+from app.config import Settings
+from app.metrics import SMTP_SEND_SECONDS, SMTP_WAIT_SECONDS, observe_outcome
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SendTiming:
+    """Timing of a single send through the pool."""
+    recipient: str
+    wait_seconds: float
+    send_seconds: float
+    reconnected: bool
+
+
+# Outgoing DATA is written to the socket in batches of about this size.
+_DATA_BATCH_BYTES = 64 * 1024
+
+
+class SmtpDeliveryUncertain(smtplib.SMTPServerDisconnected):
+    """The connection was lost after DATA started; the server may already have accepted the message."""
+
+
+def _crlf_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Re-splits a byte stream into lines, each ending in CRLF."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r") + b"\r\n"
+    if pending:
+        yield pending.rstrip(b"\r") + b"\r\n"
+
+
+def send_data_stream(server: smtplib.SMTP, from_addr: str, to_addrs: list[str], chunks: Iterable[bytes]):
+    """
+    Sends a message whose body is produced as a stream of bytes.
+
+    Does what `SMTP.sendmail` does (MAIL, RCPT, DATA with dot-stuffing) but
+    writes the body to the socket as it is produced instead of requiring the
+    whole message as one string. Losing the connection once the server has
+    accepted DATA raises `SmtpDeliveryUncertain`: the message may have been
+    delivered, so it must not simply be sent again.
+    """
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(from_addr)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for addr in to_addrs:
+        code, resp = server.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+    if len(refused) == len(to_addrs):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    server.putcmd("data")
+    code, resp = server.getreply()
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+
+    try:
+        batch, batch_size = [], 0
+        for line in _crlf_lines(chunks):
+            if line.startswith(b"."):
+                line = b"." + line
+            batch.append(line)
+            batch_size += len(line)
+            if batch_size >= _DATA_BATCH_BYTES:
+                server.send(b"".join(batch))
+                batch, batch_size = [], 0
+        batch.append(b".\r\n")
+        server.send(b"".join(batch))
+        code, resp = server.getreply()
+    except smtplib.SMTPServerDisconnected as e:
+        server.close()
+        raise SmtpDeliveryUncertain(f"Connection lost after DATA; the message may have been delivered: {e}") from e
+    except Exception:
+        # A half-written DATA section cannot be recovered; drop the connection.
+        server.close()
+        raise
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+class _Session:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.last_used = time.monotonic()
+
+
+class SmtpPool:
+    """
+    Keeps up to `size` authenticated SMTP sessions open for the length of a run.
+
+    Sessions are created lazily and reused for many messages. A session that
+    has been idle longer than `noop_after_seconds` is checked with NOOP before
+    use, and a send whose session turns out to be disconnected before DATA
+    is retried once on a fresh connection. A disconnect after DATA is never
+    retried; it is raised as `SmtpDeliveryUncertain`.
+    """
+
+    def __init__(self, settings: Settings, size: int, noop_after_seconds: float = 30.0):
+        self.settings = settings
+        self.size = max(1, size)
+        self.noop_after_seconds = noop_after_seconds
+        self.timings: list[SendTiming] = []
+        self._idle: queue.Queue[_Session] = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> _Session:
+        server = smtplib.SMTP(self.settings.SMTP_SERVER, self.settings.SMTP_PORT)
+        try:
+            if self.settings.SMTP_STARTTLS:
+                server.starttls(context=ssl.create_default_context())
+            server.login(self.settings.SENDER_EMAIL, self.settings.SENDER_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        logger.info("Opened pooled SMTP session.")
+        return _Session(server)
+
+    def _acquire(self) -> tuple[_Session, bool]:
+        """Returns an idle session (or a new one while under `size`) and whether it was reconnected."""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect(), False
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            # Wait for a session to come back; re-check periodically in case one was discarded.
+            try:
+                session = self._idle.get(timeout=1.0)
+                break
+            except queue.Empty:
+                continue
+
+        if time.monotonic() - session.last_used > self.noop_after_seconds and not self._is_alive(session):
+            logger.info("Pooled SMTP session went stale; reconnecting.")
+            return self._reconnect(session), True
+        return session, False
+
+    def _release(self, session: _Session):
+        session.last_used = time.monotonic()
+        self._idle.put(session)
+
+    def _discard(self, session: _Session):
+        try:
+            session.server.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _reconnect(self, session: _Session) -> _Session:
+        """Replaces a dead session with a fresh one, keeping its slot in the pool."""
+        try:
+            session.server.close()
+        except Exception:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @staticmethod
+    def _is_alive(session: _Session) -> bool:
+        try:
+            return session.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(
+        self, from_addr: str, to_addrs: list[str], message: Union[str, Callable[[], Iterable[bytes]]]
+    ) -> SendTiming:
+        """
+        Sends one message on a pooled session and records how long it took.
+
+        `message` is either the whole message as a string or a callable that
+        returns the message as a stream of byte chunks; a callable is invoked
+        again if the send has to be retried on a new session.
+        """
+        def deliver(server: smtplib.SMTP):
+            chunks = message() if callable(message) else [message.encode("ascii")]
+            send_data_stream(server, from_addr, to_addrs, chunks)
+
+        started = time.monotonic()
+        session, reconnected = self._acquire()
+        acquired = time.monotonic()
+        SMTP_WAIT_SECONDS.observe(acquired - started)
+        try:
+            with observe_outcome(SMTP_SEND_SECONDS):
+                try:
+                    deliver(session.server)
+                except SmtpDeliveryUncertain:
+                    raise
+                except smtplib.SMTPServerDisconnected:
+                    logger.warning("SMTP server disconnected before DATA; retrying on a new session.")
+                    dead, session = session, None
+                    session = self._reconnect(dead)
+                    reconnected = True
+                    deliver(session.server)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            if session is not None:
+                self._discard(session)
+            raise
+        except Exception:
+            if session is not None:
+                self._release(session)
+            raise
+        self._release(session)
+
+        timing = SendTiming(
+            recipient=", ".join(to_addrs),
+            wait_seconds=acquired - started,
+            send_seconds=time.monotonic() - acquired,
+            reconnected=reconnected,
+        )
+        with self._lock:
+            self.timings.append(timing)
+        return timing
+
+    def close(self):
+        """Quits every idle session."""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                session.server.quit()
+            except Exception as e:
+                logger.warning(f"Error while closing pooled SMTP session: {e}")
+        if self.timings:
+            total = sum(t.send_seconds for t in self.timings)
+            reconnects = sum(1 for t in self.timings if t.reconnected)
+            logger.info(
+                f"SMTP pool sent {len(self.timings)} messages in {total:.2f}s of send time "
+                f"({reconnects} reconnects, {self._created} sessions)."
+            )
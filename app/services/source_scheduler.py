@@ -0,0 +1,234 @@
+# app/services/source_scheduler.py
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app.config import MailSource, Settings
+from app.metrics import REGISTRY
+from app.schemas.app_schemas import ProcessingResult
+from app.services.attachments import AttachmentExtractor
+from app.services.email_processor import (
+    build_attachment_extractor,
+    build_ocr_engine,
+    open_extraction_cache,
+    process_uids,
+)
+from app.services.imap_fetcher import close_imap, connect_imap
+from app.services.llm_client import LlmClient
+from app.services.pipeline import discard_process_pool, shared_process_pool, shutdown_process_pools
+
+logger = logging.getLogger(__name__)
+
+# Per worker process: the settings, Groq client and attachment extractor (with its OCR
+# engine and extraction cache) shared by every shard it runs.
+_worker_settings: Optional[Settings] = None
+_worker_client: Optional[LlmClient] = None
+_worker_extractor: Optional[AttachmentExtractor] = None
+
+
+def source_settings(settings: Settings, source: MailSource) -> Settings:
+    """Returns `settings` with the IMAP connection fields of `source` applied."""
+    overrides = {
+        "IMAP_SERVER": source.imap_server,
+        "IMAP_PORT": source.imap_port,
+        "IMAP_SSL": source.imap_ssl,
+        "IMAP_USER": source.imap_user,
+        "IMAP_PASSWORD": source.imap_password,
+    }
+    return settings.model_copy(update={name: value for name, value in overrides.items() if value is not None})
+
+
+def search_unseen(settings: Settings, source: MailSource) -> list[bytes]:
+    """Returns the UIDs of the unseen messages in a source's folder."""
+    imap = connect_imap(source_settings(settings, source), source.folder)
+    try:
+        status, data = imap.uid("SEARCH", None, "UNSEEN")
+        if status != "OK":
+            raise RuntimeError(f"UID SEARCH failed: {data}")
+        return data[0].split()
+    finally:
+        close_imap(imap)
+
+
+# --- Worker Processes ---
+
+def _init_worker(settings: Settings, processes: int):
+    global _worker_settings, _worker_client, _worker_extractor
+    # The Groq request rate is a per-account limit, so every process gets its share.
+    _worker_settings = settings.model_copy(
+        update={"LLM_REQUESTS_PER_MINUTE": settings.LLM_REQUESTS_PER_MINUTE / max(1, processes)}
+    )
+    _worker_client = LlmClient(_worker_settings)
+    # Likewise the cores: each process gets its share of OCR processes rather than one per core.
+    ocr_workers = max(1, (settings.OCR_PROCESS_WORKERS or os.cpu_count() or 1) // max(1, processes))
+    cache = open_extraction_cache(_worker_settings)
+    _worker_extractor = build_attachment_extractor(
+        _worker_settings, build_ocr_engine(_worker_settings, cache, max_workers=ocr_workers), cache
+    )
+    # Runs before multiprocessing joins this process's children on exit, which would otherwise
+    # wait forever on the OCR and pipeline pools started here; above the queue finalizers
+    # (priority 10) so the pools' queues can still deliver their shutdown sentinels.
+    Finalize(None, _shutdown_worker, exitpriority=100)
+
+
+def _shutdown_worker():
+    _worker_extractor.shutdown()
+    shutdown_process_pools()
+    if _worker_extractor.cache:
+        _worker_extractor.cache.close()
+    _worker_client.close()
+
+
+def process_shard(source: MailSource, uids: list[bytes]) -> tuple[list[ProcessingResult], dict]:
+    """
+    Processes one shard of a source on its own IMAP connection (runs in a worker process).
+
+    Returns the results and the metrics recorded in this process since its
+    last shard (a failed shard's go with the next one), for the API process
+    to merge into the registry that /metrics shows.
+    """
+    settings = source_settings(_worker_settings, source)
+    imap = connect_imap(settings, source.folder)
+    try:
+        results = process_uids(
+            settings, _worker_client, imap, uids, mailbox=source.folder, extractor=_worker_extractor,
+        )
+    finally:
+        close_imap(imap)
+    return results, REGISTRY.drain()
+
+
+# --- Scheduling ---
+
+@dataclass
+class _SourceState:
+    source: MailSource
+    shards: deque = field(default_factory=deque)
+    in_flight: int = 0
+
+
+class SourceScheduler:
+    """
+    Processes several mailbox/folder sources on a pool of worker processes.
+
+    Each source's unseen UIDs are split into shards of `shard_size`, and
+    every shard runs in a worker process on a connection of its own. Shards
+    are handed out round-robin across sources, with at most
+    `max_concurrency` shards of one source in flight, so a flooded mailbox
+    only queues behind itself while the others keep getting turns. The
+    worker processes are started once and kept for later runs, each with
+    its own Groq client, OCR engine and extraction cache. Shards do not take
+    `mailbox_lock`, which is per process. Their ledger rows are keyed by the
+    account and folder they read (like the IDLE worker's and a manual
+    run's), and the ledger's claim before each send keeps a shard and the
+    IDLE worker from forwarding the same message twice.
+    """
+
+    def __init__(self, settings: Settings, sources: list[MailSource], processes: int, shard_size: int):
+        self.settings = settings
+        self.sources = sources
+        self.processes = max(1, processes)
+        self.shard_size = max(1, shard_size)
+
+    def run(self, on_result: Callable[[ProcessingResult], None]):
+        states: list[_SourceState] = []
+        for source in self.sources:
+            try:
+                uids = search_unseen(self.settings, source)
+            except Exception as e:
+                logger.error(f"Could not search source '{source.name}': {e}", exc_info=True)
+                on_result(ProcessingResult(source=source.name, status="Failed to connect to IMAP server.", details=str(e)))
+                continue
+            logger.info(f"Source '{source.name}' ({source.folder}): {len(uids)} unseen emails.")
+            if not uids:
+                on_result(ProcessingResult(source=source.name, status="No unseen emails found."))
+                continue
+            state = _SourceState(source)
+            state.shards.extend(uids[i:i + self.shard_size] for i in range(0, len(uids), self.shard_size))
+            states.append(state)
+        if not states:
+            return
+
+        workers = min(self.processes, sum(len(state.shards) for state in states))
+        running: dict[Future, tuple[_SourceState, ProcessPoolExecutor]] = {}
+        turn = 0
+        while running or any(state.shards for state in states):
+            # Round-robin: each free worker goes to the next source in turn that may take one.
+            submitted = True
+            while submitted and len(running) < workers:
+                submitted = False
+                for _ in range(len(states)):
+                    if len(running) >= workers:
+                        break
+                    state = states[turn]
+                    turn = (turn + 1) % len(states)
+                    if state.shards and state.in_flight < max(1, state.source.max_concurrency):
+                        future, executor = self._submit(state.source, state.shards.popleft())
+                        running[future] = (state, executor)
+                        state.in_flight += 1
+                        submitted = True
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                state, executor = running.pop(future)
+                state.in_flight -= 1
+                if isinstance(future.exception(), BrokenProcessPool):
+                    # A worker died: every shard in flight on this pool fails with it, and the
+                    # next submit starts a fresh pool (discarding the old one again is harmless).
+                    discard_process_pool(executor)
+                self._report(state.source, future, on_result)
+
+    def _submit(self, source: MailSource, shard: list[bytes]) -> tuple[Future, ProcessPoolExecutor]:
+        """Submits a shard to the worker pool, starting a fresh pool if the current one is broken."""
+        executor = self._pool()
+        try:
+            return executor.submit(process_shard, source, shard), executor
+        except BrokenProcessPool:
+            discard_process_pool(executor)
+        executor = self._pool()
+        return executor.submit(process_shard, source, shard), executor
+
+    def _pool(self) -> ProcessPoolExecutor:
+        return shared_process_pool(
+            "sources", self.processes, initializer=_init_worker, initargs=(self.settings, self.processes)
+        )
+
+    @staticmethod
+    def _report(source: MailSource, future: Future, on_result: Callable[[ProcessingResult], None]):
+        try:
+            results, metrics = future.result()
+            REGISTRY.merge(metrics)
+        except Exception as e:
+            logger.error(f"Shard of source '{source.name}' failed: {e}", exc_info=True)
+            results = [ProcessingResult(status="Failed to process shard.", details=str(e))]
+        for result in results:
+            if result is None:
+                continue
+            result.source = source.name
+            on_result(result)
+
+
+def process_sources(
+    settings: Settings,
+    sources: list[MailSource],
+    on_result: Optional[Callable[[ProcessingResult], None]] = None,
+) -> list[ProcessingResult]:
+    """Processes the unseen emails of every source and returns the results, tagged with their source."""
+    results: list[ProcessingResult] = []
+
+    def report(result: ProcessingResult):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    scheduler = SourceScheduler(
+        settings, sources, processes=settings.SOURCE_WORKER_PROCESSES, shard_size=settings.SOURCE_SHARD_SIZE
+    )
+    scheduler.run(report)
+    return results
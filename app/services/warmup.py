@@ -0,0 +1,21 @@
+# app/services/warmup.py
+
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use by the extraction and LLM code; `warm_up` loads them ahead of time.
+HEAVY_MODULES = ("fitz", "PIL.Image", "PIL.ImageOps", "pytesseract", "groq")
+
+
+def warm_up():
+    """Imports the PDF, OCR and Groq libraries so the first processing job does not pay for them."""
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Warm-up could not import {name}: {e}")
+    logger.info(f"Warm-up imported {len(HEAVY_MODULES)} modules in {time.perf_counter() - started:.2f}s.")
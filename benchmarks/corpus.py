@@ -0,0 +1,156 @@
+# benchmarks/corpus.py
+
+import argparse
+import os
+import random
+from dataclasses import dataclass
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate
+
+import fitz
+
+RECIPIENT_DOMAIN = "dest.example"
+
+WORDS = (
+    "invoice shipment order account delivery schedule contract payment balance review "
+    "quarter report customer supplier warehouse pallet freight customs reference number "
+    "please confirm attached document regarding update following previous request summary"
+).split()
+
+_STREETS = ("Market Street", "Harbour Road", "Station Avenue", "Mill Lane", "Park Drive")
+_CITIES = (("Springfield", "IL", "62701"), ("Riverton", "WY", "82501"), ("Fairview", "TN", "37062"))
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    """
+    Shape of a synthetic corpus. The same spec and seed always produce the same messages.
+
+    Ratios are per message: an HTML instead of a plain-text body, a PDF
+    attachment, a scanned (image-only) PDF instead of one with a text layer,
+    and a PDF that repeats an earlier attachment byte for byte.
+    """
+    messages: int = 50
+    seed: int = 1
+    html_ratio: float = 0.4
+    pdf_ratio: float = 0.7
+    scanned_ratio: float = 0.3
+    duplicate_ratio: float = 0.2
+    min_pages: int = 1
+    max_pages: int = 6
+    paragraphs: int = 4
+
+
+def recipient_for(index: int) -> str:
+    """The address a message of the corpus should be forwarded to."""
+    return f"recipient{index}@{RECIPIENT_DOMAIN}"
+
+
+def _paragraph(rng: random.Random, sentences: int = 4) -> str:
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+def _address(rng: random.Random) -> str:
+    city, state, zip_code = rng.choice(_CITIES)
+    return f"{rng.randint(10, 999)} {rng.choice(_STREETS)}\n{city}, {state} {zip_code}"
+
+
+def _pdf(rng: random.Random, pages: int, scanned: bool, recipient_block: str = "") -> bytes:
+    """Builds a PDF whose first page carries `recipient_block`; scanned pages are images of text."""
+    doc = fitz.open()
+    for number in range(pages):
+        text = f"Page {number + 1}\n\n"
+        if number == 0 and recipient_block:
+            text += recipient_block + "\n\n"
+        text += "\n\n".join(_paragraph(rng) for _ in range(3))
+        page = doc.new_page()
+        area = page.rect + (50, 50, -50, -50)
+        if not scanned:
+            page.insert_textbox(area, text, fontsize=10)
+            continue
+        # Render the text on a scratch page and keep only the picture of it.
+        scratch = fitz.open()
+        scratch_page = scratch.new_page()
+        scratch_page.insert_textbox(area, text, fontsize=10)
+        pix = scratch_page.get_pixmap(dpi=100, colorspace=fitz.csGRAY, alpha=False)
+        page.insert_image(page.rect, pixmap=pix)
+        scratch.close()
+    doc.set_metadata({})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return data
+
+
+def generate_corpus(spec: CorpusSpec) -> list[bytes]:
+    """Returns the messages of the corpus as raw RFC 822 bytes."""
+    rng = random.Random(spec.seed)
+    shared: list[bytes] = []
+    messages = []
+    for index in range(spec.messages):
+        recipient = recipient_for(index)
+        recipient_block = f"Please forward to: {recipient}\nAttn: Receiving Department\n{_address(rng)}"
+        paragraphs = [_paragraph(rng) for _ in range(spec.paragraphs)]
+
+        # The recipient is either in the body or on the first page of a PDF made for this
+        # message; shared PDFs (the ones that get repeated) never name a recipient.
+        pdf, recipient_in_pdf = None, False
+        if rng.random() < spec.pdf_ratio:
+            if shared and rng.random() < spec.duplicate_ratio:
+                pdf = rng.choice(shared)
+            else:
+                pages = rng.randint(spec.min_pages, max(spec.min_pages, spec.max_pages))
+                recipient_in_pdf = rng.random() < 0.5
+                pdf = _pdf(rng, pages, rng.random() < spec.scanned_ratio, recipient_block if recipient_in_pdf else "")
+                if not recipient_in_pdf:
+                    shared.append(pdf)
+        if not recipient_in_pdf:
+            paragraphs.insert(rng.randint(0, len(paragraphs)), recipient_block)
+
+        if rng.random() < spec.html_ratio:
+            html = "".join(f"<p>{p.replace(chr(10), '<br>')}</p>" for p in paragraphs)
+            body = MIMEText(
+                f"<html><head><style>p {{margin: 0}}</style></head><body><table><tr><td>{html}</td></tr></table></body></html>",
+                "html",
+            )
+        else:
+            body = MIMEText("\n\n".join(paragraphs), "plain")
+
+        message = MIMEMultipart()
+        message["From"] = f"sender{index % 7}@source.example"
+        message["To"] = "intake@bench.example"
+        message["Subject"] = f"Benchmark message {index}"
+        message["Message-ID"] = f"<bench-{spec.seed}-{index}@bench.example>"
+        message["Date"] = formatdate(1_700_000_000 + index * 60, usegmt=True)
+        message.attach(body)
+        if pdf is not None:
+            part = MIMEApplication(pdf, "pdf")
+            part.add_header("Content-Disposition", "attachment", filename=f"document-{index}.pdf")
+            message.attach(part)
+        messages.append(message.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n"))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a synthetic mail corpus as .eml files.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--messages", type=int, default=CorpusSpec.messages)
+    parser.add_argument("--seed", type=int, default=CorpusSpec.seed)
+    parser.add_argument("--scanned-ratio", type=float, default=CorpusSpec.scanned_ratio)
+    parser.add_argument("--max-pages", type=int, default=CorpusSpec.max_pages)
+    args = parser.parse_args()
+
+    spec = CorpusSpec(messages=args.messages, seed=args.seed, scanned_ratio=args.scanned_ratio, max_pages=args.max_pages)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for index, raw in enumerate(generate_corpus(spec)):
+        with open(os.path.join(args.output_dir, f"{index:05d}.eml"), "wb") as f:
+            f.write(raw)
+    print(f"Wrote {spec.messages} messages to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
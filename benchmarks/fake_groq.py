@@ -0,0 +1,113 @@
+# benchmarks/fake_groq.py
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import RECIPIENT_DOMAIN
+
+_RECIPIENT = re.compile(r"[\w.+-]+@" + re.escape(RECIPIENT_DOMAIN))
+_ADDRESS = re.compile(r"\d+ [A-Z][a-z]+ (?:Street|Road|Avenue|Lane|Drive)\s*\n\s*[A-Za-z ]+, [A-Z]{2} \d{5}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeGroq"
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(body)
+        if self.server.throttle():
+            self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0.2"})
+            return
+        time.sleep(self.server.delay())
+
+        prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+        recipient = _RECIPIENT.search(prompt)
+        address = _ADDRESS.search(prompt)
+        content = json.dumps({
+            "recipient_email": recipient.group(0) if recipient else "Not Found",
+            "physical_address": " ".join(address.group(0).split()) if address else "Not Found",
+        })
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self._send(200, {
+            "id": f"chatcmpl-bench-{self.server.next_id()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGroq(ThreadingHTTPServer):
+    """
+    Local stand-in for the Groq chat-completions endpoint (set GROQ_BASE_URL to `base_url`).
+
+    Each call sleeps `latency_seconds` ± `jitter_seconds`, then answers with
+    the corpus recipient and postal address found in the prompt. With
+    `throttle_every` set, every n-th request gets a 429 with retry-after.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency_seconds: float = 0.2, jitter_seconds: float = 0.05, throttle_every: int = 0, seed: int = 1):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_id(self) -> int:
+        with self._lock:
+            return self.requests
+
+    def throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return bool(self.throttle_every) and self.requests % self.throttle_every == 0
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency_seconds + self._random.uniform(-self.jitter_seconds, self.jitter_seconds))
+
+    def start(self) -> "FakeGroq":
+        threading.Thread(target=self.serve_forever, name="bench-groq", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,78 @@
+# benchmarks/html_to_text.py
+
+import argparse
+import json
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from app.services.html_text import html_to_text
+from benchmarks.corpus import WORDS
+
+
+def marketing_html(target_bytes: int, seed: int = 1) -> bytes:
+    """Builds a newsletter-style document: nested layout tables, inline CSS, tracking pixels, a footer address."""
+    rng = random.Random(seed)
+    style = "font-family:Arial,Helvetica,sans-serif;font-size:14px;line-height:20px;color:#333333;padding:0 12px"
+    head = (
+        "<html><head><meta charset='utf-8'><title>Offers</title><style>"
+        + "".join(f".c{i}{{margin:0;padding:{i}px;color:#{i:06x}}}" for i in range(200))
+        + "</style><script>window.dataLayer=[];</script></head><body>"
+    )
+    footer = (
+        "<table><tr><td>Please forward to: orders@dest.example<br>Attn: Receiving<br>"
+        "12 Market Street<br>Springfield, IL 62701</td></tr></table></body></html>"
+    )
+    cells = []
+    size = len(head) + len(footer)
+    while size < target_bytes:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))
+        cell = (
+            f"<table width='100%' cellpadding='0' cellspacing='0' border='0'><tr><td style='{style}'>"
+            f"<table><tr><td class='c{rng.randint(0, 199)}'><span style='{style}'><a href='https://x.example/{rng.random()}'>"
+            f"<b>{text[:20]}</b></a> {text}</span><img src='https://t.example/p.gif' width='1' height='1'></td></tr></table>"
+            f"</td></tr></table>\n"
+        )
+        cells.append(cell)
+        size += len(cell)
+    return (head + "".join(cells) + footer).encode()
+
+
+def soup_text(source: bytes) -> str:
+    """The extraction used before html_text: html.parser plus get_text."""
+    return BeautifulSoup(source.decode("utf-8", "ignore"), "html.parser").get_text(separator="\n", strip=True)
+
+
+def best_of(fn, source: bytes, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(source)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times HTML-to-text extraction: lxml (html_text) vs BeautifulSoup html.parser.")
+    parser.add_argument("--sizes", default="10000,100000,500000", help="comma-separated document sizes in bytes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        source = marketing_html(size)
+        soup_seconds = best_of(soup_text, source, args.repeat)
+        lxml_seconds = best_of(lambda data: html_to_text(data, "utf-8"), source, args.repeat)
+        rows.append({
+            "bytes": len(source),
+            "beautifulsoup_seconds": round(soup_seconds, 5),
+            "html_text_seconds": round(lxml_seconds, 5),
+            "speedup": round(soup_seconds / lxml_seconds, 1),
+            "address_lines_kept": "12 Market Street\nSpringfield, IL 62701" in html_to_text(source, "utf-8"),
+        })
+    print(json.dumps({"repeat": args.repeat, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# benchmarks/imap_server.py
+
+import email
+import re
+import select
+import socketserver
+import threading
+from dataclasses import dataclass, field
+from email.message import Message
+from typing import Optional
+
+_TOKEN = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\S+)')
+_HEADER_FIELDS = re.compile(rb"BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]", re.IGNORECASE)
+_SECTION = re.compile(rb"BODY(\.PEEK)?\[([\d.]*)\](?:<(\d+)\.(\d+)>)?", re.IGNORECASE)
+
+
+def _quote(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"NIL"
+    return b'"' + value.encode().replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _params(pairs) -> bytes:
+    if not pairs:
+        return b"NIL"
+    return b"(" + b" ".join(_quote(key.upper()) + b" " + _quote(value) for key, value in pairs) + b")"
+
+
+def _payload_bytes(part: Message) -> bytes:
+    return part.get_payload().encode("utf-8", "surrogateescape")
+
+
+def bodystructure(part: Message) -> bytes:
+    """Renders the BODYSTRUCTURE of a parsed message (basic fields plus disposition)."""
+    if part.is_multipart():
+        children = b"".join(bodystructure(child) for child in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype().upper()) + b" NIL NIL NIL)"
+    raw = _payload_bytes(part)
+    main_type = part.get_content_maintype().upper()
+    fields = [
+        _quote(main_type),
+        _quote(part.get_content_subtype().upper()),
+        _params((part.get_params() or [])[1:]),
+        b"NIL",
+        b"NIL",
+        _quote(part.get("Content-Transfer-Encoding", "7bit").upper()),
+        str(len(raw)).encode(),
+    ]
+    if main_type == "TEXT":
+        fields.append(str(raw.count(b"\n") + 1).encode())
+    fields.append(b"NIL")  # MD5
+    disposition = part.get_content_disposition()
+    if disposition:
+        fields.append(b"(" + _quote(disposition) + b" " + _params(part.get_params(header="content-disposition")[1:]) + b")")
+    else:
+        fields.append(b"NIL")
+    fields.append(b"NIL")  # language
+    return b"(" + b" ".join(fields) + b")"
+
+
+@dataclass
+class StoredMessage:
+    uid: int
+    raw: bytes
+    bodystructure: bytes
+    sections: dict[str, bytes]
+    header_lines: list[tuple[str, bytes]]
+    flags: set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_bytes(cls, uid: int, raw: bytes) -> "StoredMessage":
+        message = email.message_from_bytes(raw)
+        sections: dict[str, bytes] = {}
+
+        def walk(part: Message, prefix: str):
+            if not part.is_multipart():
+                sections[prefix or "1"] = _payload_bytes(part)
+                return
+            for index, child in enumerate(part.get_payload()):
+                walk(child, f"{prefix}.{index + 1}" if prefix else str(index + 1))
+
+        walk(message, "")
+        header_block = raw.split(b"\r\n\r\n", 1)[0]
+        header_lines: list[tuple[str, bytes]] = []
+        for line in header_block.split(b"\r\n"):
+            if line[:1] in (b" ", b"\t") and header_lines:
+                name, value = header_lines[-1]
+                header_lines[-1] = (name, value + b"\r\n" + line)
+            else:
+                header_lines.append((line.split(b":", 1)[0].decode("ascii", "replace").upper(), line))
+        return cls(uid, raw, bodystructure(message), sections, header_lines)
+
+    def header_fields(self, names: list[str]) -> bytes:
+        wanted = {name.upper() for name in names}
+        return b"".join(line + b"\r\n" for name, line in self.header_lines if name in wanted) + b"\r\n"
+
+
+class Mailbox:
+    """Messages of one folder, numbered with UIDs from 1."""
+
+    def __init__(self, messages: list[bytes], uid_validity: int = 1):
+        self.uid_validity = uid_validity
+        self.messages = [StoredMessage.from_bytes(index + 1, raw) for index, raw in enumerate(messages)]
+        self.lock = threading.Lock()
+
+    @property
+    def uid_next(self) -> int:
+        return len(self.messages) + 1
+
+    def append(self, raw: bytes) -> int:
+        """Adds a message with the next UID and returns that UID."""
+        with self.lock:
+            message = StoredMessage.from_bytes(self.uid_next, raw)
+            self.messages.append(message)
+        return message.uid
+
+    def resolve(self, message_set: bytes) -> list[StoredMessage]:
+        """Returns the messages whose UID is in an IMAP set ("3:7,9", "12:*")."""
+        highest = len(self.messages)
+        uids: set[int] = set()
+        for item in message_set.decode().split(","):
+            start, _, end = item.partition(":")
+            first = highest if start == "*" else int(start)
+            last = first if not end else (highest if end == "*" else int(end))
+            uids.update(range(min(first, last), max(first, last) + 1))
+        return [message for message in self.messages if message.uid in uids]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "ImapServer"
+
+    def handle(self):
+        self.mailbox: Optional[Mailbox] = None
+        self.authenticated = False
+        self.reported_exists = 0
+        self._write(b"* OK [CAPABILITY IMAP4rev1 IDLE] Benchmark IMAP server ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.rstrip(b"\r\n").partition(b" ")
+            command, _, args = rest.partition(b" ")
+            command = command.upper()
+            if command == b"UID":
+                command, _, args = args.partition(b" ")
+                command = b"UID " + command.upper()
+            handler = getattr(self, "cmd_" + command.decode().replace(" ", "_").lower(), None)
+            if handler is None:
+                self._write(tag + b" BAD unknown command\r\n")
+                continue
+            try:
+                if handler(tag, args) is False:
+                    return
+            except Exception as e:
+                self._write(tag + b" BAD " + str(e).encode() + b"\r\n")
+
+    def _write(self, data: bytes):
+        self.wfile.write(data)
+
+    def _new_mail(self) -> bytes:
+        """Returns the EXISTS response for mail delivered since the last one, if any."""
+        count = len(self.mailbox.messages) if self.mailbox else self.reported_exists
+        if count == self.reported_exists:
+            return b""
+        self.reported_exists = count
+        return b"* %d EXISTS\r\n" % count
+
+    def _tokens(self, args: bytes) -> list[bytes]:
+        return [quoted if quoted else atom for quoted, atom in _TOKEN.findall(args)]
+
+    # --- Commands ---
+
+    def cmd_capability(self, tag: bytes, args: bytes):
+        self._write(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + tag + b" OK CAPABILITY completed\r\n")
+
+    def cmd_login(self, tag: bytes, args: bytes):
+        user, password = (token.decode() for token in self._tokens(args)[:2])
+        if (user, password) != (self.server.user, self.server.password):
+            self._write(tag + b" NO [AUTHENTICATIONFAILED] invalid credentials\r\n")
+            return
+        self.authenticated = True
+        self._write(tag + b" OK LOGIN completed\r\n")
+
+    def cmd_select(self, tag: bytes, args: bytes):
+        name = self._tokens(args)[0].decode()
+        mailbox = self.server.mailboxes.get(name)
+        if not self.authenticated or mailbox is None:
+            self._write(tag + b" NO no such mailbox\r\n")
+            return
+        self.mailbox = mailbox
+        self.reported_exists = len(mailbox.messages)
+        self._write(
+            b"* FLAGS (\\Seen)\r\n"
+            + b"* %d EXISTS\r\n* 0 RECENT\r\n" % len(mailbox.messages)
+            + b"* OK [UIDVALIDITY %d] UIDs valid\r\n" % mailbox.uid_validity
+            + b"* OK [UIDNEXT %d] predicted next UID\r\n" % mailbox.uid_next
+            + tag + b" OK [READ-WRITE] SELECT completed\r\n"
+        )
+
+    cmd_examine = cmd_select
+
+    def cmd_status(self, tag: bytes, args: bytes):
+        tokens = self._tokens(args)
+        mailbox = self.server.mailboxes.get(tokens[0].decode())
+        if mailbox is None:
+            self._write(tag + b" NO no such mailbox\r\n")
+            return
+        with mailbox.lock:
+            unseen = sum(1 for message in mailbox.messages if "\\Seen" not in message.flags)
+        self._write(
+            b'* STATUS "%s" (MESSAGES %d UIDNEXT %d UIDVALIDITY %d UNSEEN %d)\r\n'
+            % (tokens[0], len(mailbox.messages), mailbox.uid_next, mailbox.uid_validity, unseen)
+            + tag + b" OK STATUS completed\r\n"
+        )
+
+    def cmd_uid_search(self, tag: bytes, args: bytes):
+        tokens = [token.upper() for token in self._tokens(args)]
+        with self.mailbox.lock:
+            matches = list(self.mailbox.messages)
+            position = 0
+            while position < len(tokens):
+                token = tokens[position]
+                if token == b"UID":
+                    wanted = {message.uid for message in self.mailbox.resolve(tokens[position + 1])}
+                    matches = [message for message in matches if message.uid in wanted]
+                    position += 1
+                elif token == b"UNSEEN":
+                    matches = [message for message in matches if "\\Seen" not in message.flags]
+                elif token == b"SEEN":
+                    matches = [message for message in matches if "\\Seen" in message.flags]
+                position += 1
+        self._write(
+            b"* SEARCH" + b"".join(b" %d" % message.uid for message in matches) + b"\r\n"
+            + tag + b" OK SEARCH completed\r\n"
+        )
+
+    def cmd_uid_fetch(self, tag: bytes, args: bytes):
+        message_set, _, items = args.partition(b" ")
+        header_fields = _HEADER_FIELDS.search(items)
+        sections = [match for match in _SECTION.finditer(items)]
+        out = []
+        for message in self.mailbox.resolve(message_set):
+            fields = [b"UID %d" % message.uid]
+            if b"FLAGS" in items.upper():
+                fields.append(b"FLAGS (" + " ".join(sorted(message.flags)).encode() + b")")
+            if b"BODYSTRUCTURE" in items.upper():
+                fields.append(b"BODYSTRUCTURE " + message.bodystructure)
+            if header_fields:
+                names = header_fields.group(1).decode().split()
+                data = message.header_fields(names)
+                fields.append(b"BODY[HEADER.FIELDS (%s)] {%d}\r\n%s" % (header_fields.group(1), len(data), data))
+            for match in sections:
+                peek, section, offset, length = match.groups()
+                data = message.sections.get(section.decode(), b"") if section else message.raw
+                key = b"BODY[" + section + b"]"
+                if offset is not None:
+                    data = data[int(offset):int(offset) + int(length)]
+                    key += b"<" + offset + b">"
+                if not peek:
+                    with self.mailbox.lock:
+                        message.flags.add("\\Seen")
+                fields.append(key + b" {%d}\r\n" % len(data) + data)
+            out.append(b"* %d FETCH (" % message.uid + b" ".join(fields) + b")\r\n")
+        out.append(tag + b" OK FETCH completed\r\n")
+        self._write(b"".join(out))
+
+    def cmd_uid_store(self, tag: bytes, args: bytes):
+        tokens = self._tokens(args.replace(b"(", b" ").replace(b")", b" "))
+        message_set, mode, flags = tokens[0], tokens[1].upper(), [token.decode() for token in tokens[2:]]
+        out = []
+        with self.mailbox.lock:
+            for message in self.mailbox.resolve(message_set):
+                if mode.startswith(b"+"):
+                    message.flags.update(flags)
+                elif mode.startswith(b"-"):
+                    message.flags.difference_update(flags)
+                else:
+                    message.flags = set(flags)
+                out.append(b"* %d FETCH (UID %d FLAGS (%s))\r\n" % (message.uid, message.uid, " ".join(sorted(message.flags)).encode()))
+        self._write(b"".join(out) + self._new_mail() + tag + b" OK STORE completed\r\n")
+
+    def cmd_idle(self, tag: bytes, args: bytes):
+        # Mail that arrived since the last report is announced in the same write as the
+        # continuation, later deliveries as they happen, until the client sends DONE.
+        out = b"+ idling\r\n"
+        while True:
+            out += self._new_mail()
+            if out:
+                self._write(out)
+                out = b""
+            ready, _, _ = select.select([self.connection], [], [], 0.05)
+            if ready:
+                break
+        self.rfile.readline()  # DONE
+        self._write(tag + b" OK IDLE terminated\r\n")
+
+    def cmd_noop(self, tag: bytes, args: bytes):
+        self._write(self._new_mail() + tag + b" OK NOOP completed\r\n")
+
+    def cmd_close(self, tag: bytes, args: bytes):
+        self.mailbox = None
+        self._write(tag + b" OK CLOSE completed\r\n")
+
+    def cmd_logout(self, tag: bytes, args: bytes):
+        self._write(b"* BYE logging out\r\n" + tag + b" OK LOGOUT completed\r\n")
+        return False
+
+
+class ImapServer(socketserver.ThreadingTCPServer):
+    """
+    In-process IMAP4rev1 server over plain TCP, enough for the processing pipeline.
+
+    Supports LOGIN, SELECT, STATUS, UID SEARCH (ALL/UNSEEN/SEEN/UID sets),
+    UID FETCH (UID, FLAGS, BODYSTRUCTURE, header fields, body sections and
+    partial ranges), UID STORE, IDLE, NOOP, CLOSE and LOGOUT. Mail added with
+    `deliver` is announced with EXISTS during IDLE and with NOOP and UID STORE. `mailboxes` maps folder names to raw messages;
+    flags live in memory only.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailboxes: dict[str, list[bytes]], user: str = "bench", password: str = "bench"):
+        self.mailboxes = {name: Mailbox(messages) for name, messages in mailboxes.items()}
+        self.user = user
+        self.password = password
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "ImapServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="bench-imap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def deliver(self, raw: bytes, mailbox: str = "INBOX") -> int:
+        """Adds a message to `mailbox` (announced to clients in IDLE) and returns its UID."""
+        return self.mailboxes[mailbox].append(raw)
+
+    def seen(self, mailbox: str = "INBOX") -> list[int]:
+        """UIDs flagged \\Seen in `mailbox`."""
+        box = self.mailboxes[mailbox]
+        with box.lock:
+            return [message.uid for message in box.messages if "\\Seen" in message.flags]
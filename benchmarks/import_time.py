@@ -0,0 +1,102 @@
+# benchmarks/import_time.py
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from app.services.warmup import HEAVY_MODULES
+
+# Wall time allowed for `import app.main` (cumulative, as reported by -X importtime).
+DEFAULT_BUDGET_MS = 1500
+
+# Modules that must only load on first use or during warm-up.
+LAZY_MODULES = ("fitz", "pymupdf", "pytesseract", "PIL", "groq", "bs4")
+
+_PLACEHOLDER_SETTINGS = {
+    "IMAP_SERVER": "imap.invalid",
+    "IMAP_USER": "import-check",
+    "IMAP_PASSWORD": "import-check",
+    "SMTP_SERVER": "smtp.invalid",
+    "SMTP_PORT": "587",
+    "SENDER_EMAIL": "import-check@example.com",
+    "SENDER_PASSWORD": "import-check",
+    "GROQ_API_KEY": "import-check",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+}
+
+_PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import app.main\n"
+    "elapsed = time.perf_counter() - started\n"
+    f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """Returns (module, self µs, cumulative µs, depth) for every line of -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(workdir: str, runs: int) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**_PLACEHOLDER_SETTINGS, **os.environ}
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'import-check.sqlite3')}")
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+
+    timings, loaded, rows = [], [], []
+    for _ in range(runs):
+        # Run from a scratch directory so setup_logging's log folder stays out of the tree.
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE],
+            capture_output=True, text=True, cwd=workdir, env=env, check=True,
+        )
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(probe["seconds"])
+        loaded = probe["loaded"]
+        rows = parse_importtime(completed.stderr)
+
+    heaviest = sorted((row for row in rows if row[3] == 1), key=lambda row: row[2], reverse=True)
+    return {
+        "import_ms_best": round(min(timings) * 1000, 1),
+        "import_ms_runs": [round(seconds * 1000, 1) for seconds in timings],
+        "lazy_modules_loaded": loaded,
+        "heaviest_imports": [{"module": name, "cumulative_ms": round(total / 1000, 1)} for name, _, total, _ in heaviest[:10]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks that importing app.main stays within a time budget and leaves heavy modules unloaded."
+    )
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to time; the best run is compared")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="import-check-") as workdir:
+        report = measure(workdir, max(1, args.runs))
+    report["budget_ms"] = args.budget_ms
+    report["warm_up_modules"] = list(HEAVY_MODULES)
+    failures = []
+    if report["import_ms_best"] > args.budget_ms:
+        failures.append(f"import app.main took {report['import_ms_best']} ms (budget {args.budget_ms} ms)")
+    if report["lazy_modules_loaded"]:
+        failures.append(f"loaded at import time: {', '.join(report['lazy_modules_loaded'])}")
+    report["ok"] = not failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        sys.exit("Import check failed: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
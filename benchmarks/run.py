@@ -0,0 +1,229 @@
+# benchmarks/run.py
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Optional
+
+from benchmarks.corpus import CorpusSpec, generate_corpus, recipient_for
+from benchmarks.fake_groq import FakeGroq
+from benchmarks.imap_server import ImapServer
+from benchmarks.smtp_sink import SmtpSink
+
+IMAP_USER = "bench@bench.example"
+IMAP_PASSWORD = "bench"
+
+_SUBJECT_INDEX = re.compile(r"Benchmark message (\d+)$")
+_SENT_TO = re.compile(r"Email sent successfully to (\S+)\.$")
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size in MB (for RUSAGE_CHILDREN, of the largest waited-for child)."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _histogram_summary(histogram, label_names: tuple[str, ...]) -> list[dict]:
+    rows = []
+    for labels, (count, total) in sorted(histogram.snapshot().items()):
+        rows.append({
+            **dict(zip(label_names, labels)),
+            "count": count,
+            "total_seconds": round(total, 4),
+            "mean_seconds": round(total / count, 4) if count else None,
+        })
+    return rows
+
+
+def configure_environment(
+    workdir: str, imap: ImapServer, smtp: SmtpSink, groq: FakeGroq, overrides: dict[str, str]
+):
+    """Points the app's settings at the local stand-ins; must run before `app` is imported."""
+    os.environ.update({
+        "IMAP_SERVER": "127.0.0.1",
+        "IMAP_PORT": str(imap.port),
+        "IMAP_SSL": "false",
+        "IMAP_USER": IMAP_USER,
+        "IMAP_PASSWORD": IMAP_PASSWORD,
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_STARTTLS": "false",
+        "SENDER_EMAIL": "forwarder@bench.example",
+        "SENDER_PASSWORD": "bench",
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": groq.base_url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "EXTRACTION_CACHE_PATH": os.path.join(workdir, "extraction_cache.sqlite3"),
+        **overrides,
+    })
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    spec = CorpusSpec(
+        messages=args.messages,
+        seed=args.seed,
+        html_ratio=args.html_ratio,
+        pdf_ratio=args.pdf_ratio,
+        scanned_ratio=args.scanned_ratio,
+        duplicate_ratio=args.duplicate_ratio,
+        max_pages=args.max_pages,
+    )
+    started = time.perf_counter()
+    corpus = generate_corpus(spec)
+    corpus_seconds = time.perf_counter() - started
+
+    overrides = dict(item.split("=", 1) for item in args.set)
+    with tempfile.TemporaryDirectory(prefix="email-bench-") as workdir:
+        imap = ImapServer({"INBOX": corpus}, user=IMAP_USER, password=IMAP_PASSWORD).start()
+        smtp = SmtpSink().start()
+        groq = FakeGroq(
+            latency_seconds=args.groq_latency, jitter_seconds=args.groq_jitter,
+            throttle_every=args.throttle_every, seed=args.seed,
+        ).start()
+        configure_environment(workdir, imap, smtp, groq, overrides)
+
+        # Imported here: app.config reads the environment configured above.
+        from app.config import Settings
+        from app.database import Base, engine
+        from app.metrics import (
+            EMAILS_PROCESSED,
+            GROQ_REQUEST_SECONDS,
+            GROQ_TOKENS,
+            IMAP_OPERATION_SECONDS,
+            OCR_PAGE_SECONDS,
+            PIPELINE_STAGE_SECONDS,
+            SMTP_SEND_SECONDS,
+        )
+        from app.models import ledger, mailbox  # noqa: F401  (registers the tables)
+        from app.services.email_processor import process_unseen_emails
+        from app.services.llm_client import LlmClient
+
+        Base.metadata.create_all(bind=engine)
+        settings = Settings()
+        client = LlmClient(settings)
+        rss_before = peak_rss_mb()
+        try:
+            started = time.perf_counter()
+            results = process_unseen_emails(settings, client)
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+            imap.stop()
+            smtp.stop()
+            groq.stop()
+
+    latencies = [result.processing_seconds for result in results if result.processing_seconds is not None]
+    correct = 0
+    for result in results:
+        subject, sent = _SUBJECT_INDEX.search(result.source_subject or ""), _SENT_TO.search(result.status)
+        if subject and sent and sent.group(1) == recipient_for(int(subject.group(1))):
+            correct += 1
+
+    return {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {
+            **asdict(spec),
+            "bytes": sum(len(raw) for raw in corpus),
+            "generation_seconds": round(corpus_seconds, 3),
+        },
+        "fake_groq": {
+            "latency_seconds": args.groq_latency,
+            "jitter_seconds": args.groq_jitter,
+            "throttle_every": args.throttle_every,
+            "requests": groq.requests,
+        },
+        "overrides": overrides,
+        "results": {
+            "messages": len(latencies),
+            "elapsed_seconds": round(elapsed, 3),
+            "messages_per_second": round(len(latencies) / elapsed, 3) if elapsed else None,
+            "latency_p50_seconds": percentile(latencies, 0.50),
+            "latency_p95_seconds": percentile(latencies, 0.95),
+            "latency_max_seconds": max(latencies, default=None),
+            "forwarded": len(smtp.received),
+            "forwarded_to_expected_recipient": correct,
+            "outcomes": {labels[0]: value for labels, value in EMAILS_PROCESSED.snapshot().items()},
+            "stages": _histogram_summary(PIPELINE_STAGE_SECONDS, ("stage", "outcome")),
+            "imap": _histogram_summary(IMAP_OPERATION_SECONDS, ("operation", "outcome")),
+            "ocr_pages": _histogram_summary(OCR_PAGE_SECONDS, ("outcome",)),
+            "groq": _histogram_summary(GROQ_REQUEST_SECONDS, ("outcome",)),
+            "groq_tokens": {labels[0]: value for labels, value in GROQ_TOKENS.snapshot().items()},
+            "smtp": _histogram_summary(SMTP_SEND_SECONDS, ("outcome",)),
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_mb_before_run": rss_before,
+            "peak_rss_mb_children": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the email pipeline against a synthetic corpus and local IMAP/SMTP/Groq stand-ins."
+    )
+    parser.add_argument("--label", default="default", help="name stored with the results")
+    parser.add_argument("--messages", type=int, default=CorpusSpec.messages)
+    parser.add_argument("--seed", type=int, default=CorpusSpec.seed)
+    parser.add_argument("--html-ratio", type=float, default=CorpusSpec.html_ratio)
+    parser.add_argument("--pdf-ratio", type=float, default=CorpusSpec.pdf_ratio)
+    parser.add_argument("--scanned-ratio", type=float, default=CorpusSpec.scanned_ratio)
+    parser.add_argument("--duplicate-ratio", type=float, default=CorpusSpec.duplicate_ratio)
+    parser.add_argument("--max-pages", type=int, default=CorpusSpec.max_pages)
+    parser.add_argument("--groq-latency", type=float, default=0.2, help="seconds per fake Groq call")
+    parser.add_argument("--groq-jitter", type=float, default=0.05)
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every n-th Groq call with a 429")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="NAME=VALUE",
+        help="app setting for this run, e.g. --set FAST_PATH_ENABLED=false (repeatable)",
+    )
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
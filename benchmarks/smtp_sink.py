@@ -0,0 +1,111 @@
+# benchmarks/smtp_sink.py
+
+import socketserver
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class ReceivedMessage:
+    mail_from: str
+    recipients: list[str]
+    size: int
+    data: Optional[bytes] = None  # kept only when the sink is asked to
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "SmtpSink"
+
+    def handle(self):
+        self._reply(b"220 bench ESMTP sink ready")
+        mail_from, recipients = "", []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.rstrip(b"\r\n")
+            verb = command.split(b" ", 1)[0].upper()
+            if verb == b"EHLO":
+                self.wfile.write(b"250-bench\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 104857600\r\n")
+            elif verb == b"HELO":
+                self._reply(b"250 bench")
+            elif verb == b"AUTH":
+                self._auth(command)
+            elif verb == b"MAIL":
+                mail_from, recipients = command.split(b":", 1)[1].strip(b" <>").decode(), []
+                self._reply(b"250 OK")
+            elif verb == b"RCPT":
+                recipients.append(command.split(b":", 1)[1].strip(b" <>").decode())
+                self._reply(b"250 OK")
+            elif verb == b"DATA":
+                self._reply(b"354 End data with <CR><LF>.<CR><LF>")
+                self.server.deliver(mail_from, recipients, self._read_data())
+                self._reply(b"250 OK queued")
+            elif verb in (b"RSET", b"NOOP"):
+                self._reply(b"250 OK")
+            elif verb == b"QUIT":
+                self._reply(b"221 Bye")
+                return
+            else:
+                self._reply(b"502 Command not implemented")
+
+    def _reply(self, line: bytes):
+        self.wfile.write(line + b"\r\n")
+
+    def _auth(self, command: bytes):
+        # Any credentials are accepted; only the exchange itself is played out.
+        parts = command.split()
+        mechanism = parts[1].upper() if len(parts) > 1 else b""
+        if mechanism == b"PLAIN" and len(parts) < 3:
+            self._reply(b"334 ")
+            self.rfile.readline()
+        elif mechanism == b"LOGIN":
+            if len(parts) < 3:
+                self._reply(b"334 VXNlcm5hbWU6")
+                self.rfile.readline()
+            self._reply(b"334 UGFzc3dvcmQ6")
+            self.rfile.readline()
+        self._reply(b"235 Authentication successful")
+
+    def _read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                return b"".join(lines)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """
+    In-process SMTP server that accepts every message and keeps counts (and optionally the data).
+
+    Speaks plain ESMTP with AUTH PLAIN/LOGIN and no STARTTLS, so the app
+    must run with SMTP_STARTTLS disabled against it.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, keep_data: bool = False):
+        self.keep_data = keep_data
+        self.received: list[ReceivedMessage] = []
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def deliver(self, mail_from: str, recipients: list[str], data: bytes):
+        message = ReceivedMessage(mail_from, list(recipients), len(data), data if self.keep_data else None)
+        with self._lock:
+            self.received.append(message)
+
+    def start(self) -> "SmtpSink":
+        threading.Thread(target=self.serve_forever, name="bench-smtp", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,21 @@
+# tests/conftest.py
+
+import os
+import tempfile
+
+# app.config reads its required settings on import: point everything at local
+# stand-ins and a throwaway database before any app module is imported.
+_workdir = tempfile.mkdtemp(prefix="email-processor-tests-")
+os.environ.update({
+    "IMAP_SERVER": "127.0.0.1",
+    "IMAP_USER": "inbox@test.example",
+    "IMAP_PASSWORD": "test",
+    "SMTP_SERVER": "127.0.0.1",
+    "SMTP_PORT": "2525",
+    "SENDER_EMAIL": "forwarder@test.example",
+    "SENDER_PASSWORD": "test",
+    "GROQ_API_KEY": "test",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.sqlite3')}",
+    "EXTRACTION_CACHE_PATH": os.path.join(_workdir, "extraction_cache.sqlite3"),
+})
@@ -0,0 +1,86 @@
+# tests/test_attachments.py
+
+import os
+import threading
+import time
+
+import pytest
+
+from app.services.attachments import IMAGE, PDF, AttachmentBudget, AttachmentExtractor, ExtractedAttachment
+from app.services.extraction_cache import PDF_OCR
+from app.services.mime_stream import FetchedPart, PartInfo
+from app.services.ocr_engine import OcrEngine
+
+
+def slow_page(seconds: float) -> str:
+    """Stands in for a page's OCR in the engine's worker processes."""
+    time.sleep(seconds)
+    return "page text"
+
+
+class LateOcr:
+    """Stands in for the OCR engine: ignores the deadline and answers after `seconds`."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.finished = threading.Event()
+
+    def ocr_image_file(self, path: str, key: str, deadline: float = None) -> str:
+        time.sleep(self.seconds)
+        assert os.path.exists(path), "the file was removed while still being read"
+        self.finished.set()
+        return "late text"
+
+
+def _image_attachment(tmp_path) -> ExtractedAttachment:
+    path = tmp_path / "scan.png"
+    path.write_bytes(b"not really a png")
+    part = FetchedPart(PartInfo(section="2", content_type="image/png", filename="scan.png"), payload=None)
+    return ExtractedAttachment(part=part, kind=IMAGE, path=str(path), key="scan")
+
+
+def test_oversized_attachment_is_not_extracted_but_noted():
+    parts = [
+        FetchedPart(PartInfo(section="2", content_type="application/pdf", filename="scan.pdf", size=30_000), payload=None),
+        FetchedPart(PartInfo(section="3", content_type="application/pdf", filename="form.pdf", size=2_000), payload=None),
+    ]
+    extractor = AttachmentExtractor(LateOcr(0), budget=AttachmentBudget(max_attachment_bytes=10_000))
+
+    selected, notes = extractor.select(parts)
+
+    assert [(attachment.filename, attachment.kind) for attachment in selected] == [("form.pdf", PDF)]
+    assert notes == ["'scan.pdf' not extracted: larger than 10000 bytes"]
+    extractor.shutdown()
+
+
+def test_late_ocr_is_dropped_and_its_file_removed_when_it_finishes(tmp_path):
+    ocr = LateOcr(seconds=0.5)
+    extractor = AttachmentExtractor(ocr, budget=AttachmentBudget(timeout_seconds=0.1))
+    attachment = _image_attachment(tmp_path)
+    path = attachment.path
+
+    notes = extractor.ocr([attachment], extractor.deadline())
+    assert notes == ["'scan.png' OCR timed out"]
+    extractor.release([attachment])  # the job is done with it, the OCR is not
+    assert os.path.exists(path)
+
+    assert ocr.finished.wait(5)
+    attachment.task.result(timeout=5)
+    assert attachment.ocr_text == ""  # the late result never reaches the attachment
+    assert not os.path.exists(path)
+    extractor.shutdown()
+
+
+def test_ocr_deadline_cancels_queued_pages():
+    engine = OcrEngine(max_workers=1)
+    engine._submit("warm-up", slow_page, 0.0).result(timeout=30)
+
+    futures = [(index, engine._submit(f"page:{index}", slow_page, 0.5)) for index in range(6)]
+    with pytest.raises(TimeoutError):
+        engine._collect(PDF_OCR, "doc", futures, deadline=time.monotonic() + 0.2)
+
+    # Only the page being OCR'd (and the one the pool had already queued) still runs;
+    # without the cancel the next document would wait behind all six.
+    started = time.monotonic()
+    assert engine._submit("next", slow_page, 0.0).result(timeout=10) == "page text"
+    assert time.monotonic() - started < 1.5
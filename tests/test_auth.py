@@ -0,0 +1,50 @@
+# tests/test_auth.py
+
+import uuid
+
+import pytest
+
+from app.auth import user_cache
+from app.database import Base, SessionLocal, engine
+from app.models.users import User, UserRole
+from app.schemas.user_schemas import UserResponse
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def cached_user(db):
+    user = User(email=f"{uuid.uuid4().hex}@test.example", hashed_password="x", role=UserRole.USER)
+    db.add(user)
+    db.commit()
+    user_cache.put(user.id, UserResponse.from_orm(user))
+    return user
+
+
+def test_update_invalidates_the_cached_user_on_commit(db, cached_user):
+    cached_user.role = UserRole.ADMIN
+    db.flush()
+    assert user_cache.get(cached_user.id) is not None  # not committed yet: others still see the old row
+    db.commit()
+    assert user_cache.get(cached_user.id) is None
+
+
+def test_rolled_back_change_keeps_the_cached_user(db, cached_user):
+    cached_user.role = UserRole.ADMIN
+    db.flush()
+    db.rollback()
+    assert user_cache.get(cached_user.id) is not None
+    db.commit()  # nothing left over from the rolled back flush
+    assert user_cache.get(cached_user.id) is not None
+
+
+def test_delete_invalidates_the_cached_user(db, cached_user):
+    db.delete(cached_user)
+    db.commit()
+    assert user_cache.get(cached_user.id) is None
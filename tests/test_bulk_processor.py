@@ -0,0 +1,22 @@
+# tests/test_bulk_processor.py
+
+import json
+
+from app.services.bulk_processor import read_progress
+
+
+def test_resume_retries_failed_messages(tmp_path):
+    output = tmp_path / "results.jsonl"
+    lines = [
+        {"source": "a.mbox", "offset": 0, "end_offset": 100, "status": "Email sent successfully to x@dest.example.", "outcome": "sent"},
+        {"source": "a.mbox", "offset": 100, "end_offset": 250, "status": "Failed to process email.", "outcome": "failed"},
+        {"source": "a.mbox", "offset": 250, "end_offset": 400, "status": "Recipient email not found by AI.", "outcome": "no_recipient"},
+        {"source": "b.eml", "offset": 0, "end_offset": 80, "status": "Failed to process email."},  # written before outcomes
+        {"source": "c.eml", "offset": 0, "end_offset": 90, "status": "Email sent successfully to y@dest.example."},
+    ]
+    output.write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+    progress = read_progress(str(output))
+
+    assert progress.done == {("a.mbox", 0), ("a.mbox", 250), ("c.eml", 0)}
+    assert progress.resume_offsets == {"a.mbox": 100, "c.eml": 90}  # scanning picks the failed message up again
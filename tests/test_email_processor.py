@@ -0,0 +1,25 @@
+# tests/test_email_processor.py
+
+import base64
+import email
+
+from app.config import settings
+from app.services.email_processor import EmailJob, ParsedEmail, compose_forward, forward_chunks
+from app.services.mime_stream import FetchedPart, PartInfo, SpooledPayload
+
+
+def test_forward_keeps_awkward_attachment_filenames_intact():
+    filename = 'Rechnung "März" für Müller.pdf'
+    encoded = base64.encodebytes(b"%PDF-1.4 fake")
+    part = FetchedPart(
+        PartInfo(section="2", content_type="application/pdf", encoding="base64", disposition="attachment", filename=filename),
+        SpooledPayload.from_bytes(encoded, threshold=1024),
+    )
+    job = EmailJob(index=0, uid=b"1", parsed=ParsedEmail(subject="Invoice", body="See attached."), attachments=[part])
+    job.recipient_address = "jane@dest.example"
+
+    message = email.message_from_bytes(b"".join(forward_chunks(compose_forward(settings, job), job.attachments)))
+
+    [attachment] = [item for item in message.walk() if item.get_content_disposition() == "attachment"]
+    assert attachment.get_filename() == filename
+    assert attachment.get_payload(decode=True) == b"%PDF-1.4 fake"
@@ -0,0 +1,37 @@
+# tests/test_extraction_cache.py
+
+import sqlite3
+
+from app.services.extraction_cache import PAGE_OCR, ExtractionCache
+
+
+def test_size_cap_holds_across_processes_sharing_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = ExtractionCache(path, max_bytes=100), ExtractionCache(path, max_bytes=100)
+
+    for index in range(4):
+        (first if index % 2 else second).put(PAGE_OCR, f"page:{index}", "x" * 40)
+
+    assert first.stats()["size_bytes"] <= 100
+    assert second.get(PAGE_OCR, "page:0") is None  # least recently used, evicted
+    assert second.get(PAGE_OCR, "page:3") == "x" * 40
+    first.close()
+    second.close()
+
+
+def test_locked_cache_is_skipped_instead_of_raising(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ExtractionCache(path, max_bytes=1000, busy_timeout=0.1)
+    cache.put(PAGE_OCR, "page:0", "text")
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    cache.put(PAGE_OCR, "page:1", "text")  # logged, not raised
+    assert cache.get(PAGE_OCR, "page:0") == "text"
+    writer.execute("ROLLBACK")
+    writer.close()
+
+    assert cache.get(PAGE_OCR, "page:1") is None
+    cache.put(PAGE_OCR, "page:1", "text")
+    assert cache.get(PAGE_OCR, "page:1") == "text"
+    cache.close()
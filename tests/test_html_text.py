@@ -0,0 +1,21 @@
+# tests/test_html_text.py
+
+import pytest
+
+from app.services.html_text import html_to_text
+
+SOURCE = "<p>Müller</p><p>Hauptstraße 5</p>".encode()
+
+
+@pytest.mark.parametrize("max_bytes", range(SOURCE.index("ß".encode()), len(SOURCE)))
+def test_cut_never_splits_a_utf8_character(max_bytes):
+    # A cut inside "ß" used to make the body fail UTF-8 decoding and come out as latin-1 mojibake.
+    text = html_to_text(SOURCE, max_bytes=max_bytes)
+    assert text.startswith("Müller\nHauptstra")
+    assert "Ã" not in text
+
+
+def test_address_lines_keep_their_shape():
+    source = b"<html><head><title>x</title></head><body><table><tr><td>Jane Doe</td></tr>" \
+             b"<tr><td>12 Main <b>Street</b></td></tr></table>Springfield<br>IL 62704<script>x()</script></body></html>"
+    assert html_to_text(source) == "Jane Doe\n12 Main Street\nSpringfield\nIL 62704"
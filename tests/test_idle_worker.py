@@ -0,0 +1,136 @@
+# tests/test_idle_worker.py
+
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.database import Base, engine
+from app.services import idle_worker
+from app.services.idle_worker import IdleWorker, idle_until_exists, load_checkpoint, save_checkpoint
+from app.services.imap_fetcher import close_imap, connect_imap
+from benchmarks.imap_server import ImapServer
+
+USER, PASSWORD = "idle@test.example", "secret"
+
+
+def raw_message(index: int) -> bytes:
+    return (
+        f"From: sender{index}@example.com\r\nTo: {USER}\r\nSubject: Message {index}\r\n"
+        f"Message-ID: <m{index}@example.com>\r\n\r\nBody {index}\r\n"
+    ).encode()
+
+
+@pytest.fixture
+def server():
+    imap_server = ImapServer({"INBOX": [raw_message(1), raw_message(2), raw_message(3)]}, user=USER, password=PASSWORD)
+    imap_server.start()
+    yield imap_server
+    imap_server.stop()
+
+
+@pytest.fixture
+def imap_settings(server):
+    return settings.model_copy(update={
+        "IMAP_SERVER": "127.0.0.1", "IMAP_PORT": server.port, "IMAP_SSL": False,
+        "IMAP_USER": USER, "IMAP_PASSWORD": PASSWORD,
+    })
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Replaces the pipeline with a recorder of the UIDs the worker hands it."""
+    Base.metadata.create_all(bind=engine)
+    batches: list[list[int]] = []
+
+    def fake_process_uids(settings, groq_client, imap, uids, mailbox="INBOX", **kwargs):
+        batches.append([int(uid) for uid in uids])
+        return []
+
+    monkeypatch.setattr(idle_worker, "process_uids", fake_process_uids)
+    return batches
+
+
+def test_exists_sent_with_the_continuation_is_seen_at_once(server, imap_settings):
+    imap = connect_imap(imap_settings)
+    try:
+        server.deliver(raw_message(4))  # announced in the same packet as "+ idling"
+        started = time.monotonic()
+        announced = idle_until_exists(imap, timeout=10.0, stop=threading.Event())
+        assert announced
+        assert time.monotonic() - started < 2.0
+        # The connection is still usable by imaplib afterwards.
+        status, data = imap.uid("SEARCH", None, "ALL")
+        assert (status, data[0].split()) == ("OK", [b"1", b"2", b"3", b"4"])
+    finally:
+        close_imap(imap)
+
+
+def test_idle_returns_on_timeout_and_stop(server, imap_settings):
+    imap = connect_imap(imap_settings)
+    try:
+        assert idle_until_exists(imap, timeout=0.2, stop=threading.Event()) is False
+        stop = threading.Event()
+        stop.set()
+        assert idle_until_exists(imap, timeout=10.0, stop=stop) is False
+        assert imap.noop()[0] == "OK"
+    finally:
+        close_imap(imap)
+
+
+def test_worker_resumes_from_checkpoint_and_processes_announced_mail(server, imap_settings, processed):
+    save_checkpoint("INBOX", 1, 2)
+    worker = IdleWorker(settings=imap_settings.model_copy(update={"IMAP_IDLE_TIMEOUT_SECONDS": 600.0}), groq_client=None)
+    worker.start()
+    try:
+        _wait_for(lambda: processed == [[3]])
+        server.deliver(raw_message(4))
+        _wait_for(lambda: processed == [[3], [4]])
+        _wait_for(lambda: load_checkpoint("INBOX") == (1, 4))
+    finally:
+        worker.stop()
+
+
+def test_uidvalidity_change_resets_the_checkpoint(server, imap_settings, processed):
+    save_checkpoint("INBOX", 7, 99)  # watermark from before the mailbox was rebuilt
+    server.mailboxes["INBOX"].messages[0].flags.add("\\Seen")
+    imap = connect_imap(imap_settings)
+    worker = IdleWorker(settings=imap_settings, groq_client=None)
+    worker._stop.set()  # run the start-up catch-up only, without idling
+    try:
+        worker._serve(imap)
+    finally:
+        close_imap(imap)
+
+    assert processed == [[2, 3]]  # the unseen messages, not "everything above UID 99"
+    assert load_checkpoint("INBOX") == (1, 3)
+
+
+def test_mail_announced_outside_idle_is_not_missed(server, imap_settings, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    save_checkpoint("INBOX", 1, 2)
+    batches: list[list[int]] = []
+
+    def process_and_flag(settings, groq_client, imap, uids, mailbox="INBOX", **kwargs):
+        batches.append([int(uid) for uid in uids])
+        if len(batches) == 1:
+            server.deliver(raw_message(4))  # announced with the STORE below, never in IDLE
+        imap.uid("STORE", ",".join(uid.decode() for uid in uids), "+FLAGS", "(\\Seen)")
+        return []
+
+    monkeypatch.setattr(idle_worker, "process_uids", process_and_flag)
+    worker = IdleWorker(settings=imap_settings.model_copy(update={"IMAP_IDLE_TIMEOUT_SECONDS": 600.0}), groq_client=None)
+    worker.start()
+    try:
+        _wait_for(lambda: batches == [[3], [4]])
+    finally:
+        worker.stop()
+
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.02)
@@ -0,0 +1,165 @@
+# tests/test_imap_fetcher.py
+
+import re
+
+import pytest
+
+from app.services.imap_fetcher import (
+    BatchedFetcher,
+    is_needed_part,
+    message_set,
+    parse_bodystructure,
+    parse_fetch_response,
+)
+
+HEADERS = b"From: Alice <alice@example.com>\r\nSubject: Invoice\r\nMessage-ID: <m1@example.com>\r\n\r\n"
+
+# multipart/mixed: an alternative (plain + html), a PDF attachment and an inline image without a disposition.
+NESTED_BODYSTRUCTURE = (
+    b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 300 10 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "invoice.pdf") NIL NIL "BASE64" 5000 NIL ("ATTACHMENT" ("FILENAME" "invoice.pdf")) NIL NIL)'
+    b'("IMAGE" "PNG" NIL "<logo@example.com>" NIL "BASE64" 800 NIL NIL NIL NIL) "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)'
+)
+
+
+def test_parse_fetch_response_with_literals():
+    # imaplib returns each literal as a (prefix ending in "{n}", literal) tuple, then the rest of the line.
+    data = [
+        (b'1 (UID 7 BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}' % len(HEADERS), HEADERS),
+        b' FLAGS (\\Seen))',
+        (b'2 (UID 8 BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {0}', b''),
+        b' FLAGS ())',
+    ]
+    messages = parse_fetch_response(data)
+    assert messages == [
+        {"UID": b"7", "BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]": HEADERS, "FLAGS": [b"\\Seen"]},
+        {"UID": b"8", "BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]": b"", "FLAGS": []},
+    ]
+
+
+def test_parse_fetch_response_quoted_strings_and_nil():
+    data = [b'3 (UID 12 ENVELOPE ("Mon, 1 Jan 2024" "say \\"hi\\"" NIL))']
+    assert parse_fetch_response(data) == [{"UID": b"12", "ENVELOPE": [b"Mon, 1 Jan 2024", b'say "hi"', None]}]
+
+
+def test_parse_nested_multipart_bodystructure():
+    item = parse_fetch_response([b"1 (UID 5 BODYSTRUCTURE " + NESTED_BODYSTRUCTURE + b")"])[0]
+    parts = parse_bodystructure(item["BODYSTRUCTURE"])
+
+    assert [(part.section, part.content_type) for part in parts] == [
+        ("1.1", "text/plain"), ("1.2", "text/html"), ("2", "application/pdf"), ("3", "image/png"),
+    ]
+    plain, html, pdf, image = parts
+    assert plain.params == {"charset": "utf-8"}
+    assert (plain.encoding, plain.size, plain.disposition) == ("quoted-printable", 120, None)
+    assert (pdf.encoding, pdf.size, pdf.disposition, pdf.filename) == ("base64", 5000, "attachment", "invoice.pdf")
+    # NIL parameters and a NIL disposition: an inline part without a name.
+    assert (image.params, image.disposition, image.filename) == ({}, None, None)
+    assert [is_needed_part(part) for part in parts] == [True, True, True, False]
+
+
+def test_parse_single_part_bodystructure_is_section_1():
+    item = parse_fetch_response([b'1 (UID 5 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 42 2 NIL NIL NIL NIL))'])[0]
+    [part] = parse_bodystructure(item["BODYSTRUCTURE"])
+    assert (part.section, part.content_type, part.encoding, part.size) == ("1", "text/plain", "7bit", 42)
+
+
+def test_parse_bodystructure_filename_literal_and_encoded_word():
+    # A filename with a quote is sent as a literal; a non-ASCII one as an RFC 2047 encoded word.
+    data = [
+        (b'1 (UID 9 BODYSTRUCTURE (("IMAGE" "PNG" NIL NIL NIL "BASE64" 10 NIL ("ATTACHMENT" ("FILENAME" {10}', b'we"ird.png'),
+        b')) NIL NIL)("APPLICATION" "OCTET-STREAM" ("NAME" "=?utf-8?q?Rechnung_f=C3=BCr_M=C3=BCller.pdf?=") NIL NIL'
+        b' "BASE64" 20 NIL NIL NIL NIL) "MIXED" ("BOUNDARY" "x") NIL NIL NIL))',
+    ]
+    parts = parse_bodystructure(parse_fetch_response(data)[0]["BODYSTRUCTURE"])
+    assert [part.filename for part in parts] == ['we"ird.png', "Rechnung für Müller.pdf"]
+    assert parts[1].disposition is None
+
+
+def test_parse_message_rfc822_part_reads_disposition_after_envelope():
+    data = [
+        b'1 (UID 4 BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 900 (NIL "Inner" NIL NIL NIL NIL NIL NIL NIL NIL)'
+        b' ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 10 1 NIL NIL NIL NIL) 20 NIL ("ATTACHMENT" ("FILENAME" "fwd.eml")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "y") NIL NIL NIL))'
+    ]
+    parts = parse_bodystructure(parse_fetch_response(data)[0]["BODYSTRUCTURE"])
+    assert [(part.section, part.content_type, part.filename) for part in parts] == [
+        ("1", "text/plain", None), ("2", "message/rfc822", "fwd.eml"),
+    ]
+
+
+@pytest.mark.parametrize("uids, expected", [
+    ([b"7"], "7"),
+    ([b"3", b"4", b"5", b"6", b"7", b"9", b"12", b"13"], "3:7,9,12:13"),
+    ([b"13", b"3", b"12", b"4"], "3:4,12:13"),
+    ([b"1", b"3", b"5"], "1,3,5"),
+])
+def test_message_set(uids, expected):
+    assert message_set(uids) == expected
+
+
+# --- Batched Fetching ---
+
+class RecordedImap:
+    """Answers UID FETCH commands like imaplib does, from a message's raw sections."""
+
+    def __init__(self, uid: bytes, bodystructure: bytes, sections: dict[str, bytes]):
+        self.uid_value = uid
+        self.bodystructure = bodystructure
+        self.sections = sections
+        self.commands: list[str] = []
+
+    def uid(self, command: str, message_set: str, items: str):
+        self.commands.append(items)
+        prefix = b"1 (UID " + self.uid_value
+        if "BODYSTRUCTURE" in items:
+            return "OK", [
+                (prefix + b" BODYSTRUCTURE " + self.bodystructure
+                 + b" BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)] {%d}" % len(HEADERS), HEADERS),
+                b")",
+            ]
+        data = []
+        for section, offset, length in re.findall(r"BODY\.PEEK\[([\d.]+)\](?:<(\d+)\.(\d+)>)?", items):
+            value = self.sections[section]
+            name = f"BODY[{section}]".encode()
+            if offset:
+                value = value[int(offset):int(offset) + int(length)]
+                name += f"<{offset}>".encode()
+            data.append((prefix + b" " + name + b" {%d}" % len(value), value))
+            prefix = b""
+        data.append(b")")
+        return "OK", data
+
+
+class _Connections:
+    def __init__(self, imap):
+        self.imap = imap
+
+    def get(self):
+        return self.imap
+
+
+def test_batched_fetcher_streams_large_parts_in_partial_chunks():
+    pdf_bytes = b"JVBERi0xLjQK" * 100  # 1200 bytes of base64, fetched in 500 byte pieces
+    bodystructure = (
+        b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 11 1 NIL NIL NIL NIL)'
+        b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" %d NIL ("ATTACHMENT" ("FILENAME" "big.pdf")) NIL NIL)'
+        b'("IMAGE" "GIF" NIL NIL NIL "BASE64" 4 NIL NIL NIL NIL) "MIXED" ("BOUNDARY" "z") NIL NIL NIL)'
+    ) % len(pdf_bytes)
+    imap = RecordedImap(b"42", bodystructure, {"1": b"Hello body\n", "2": pdf_bytes, "3": b"R0lG"})
+    fetcher = BatchedFetcher([b"42"], _Connections(imap), batch_size=10, chunk_bytes=500, spool_threshold=100)
+
+    message = fetcher.fetch(b"42")
+
+    assert message.headers == HEADERS
+    assert [part.info.section for part in message.parts] == ["1", "2"]  # the unnamed inline image is not fetched
+    assert message.parts[0].payload.getvalue() == b"Hello body\n"
+    assert message.parts[1].payload.getvalue() == pdf_bytes
+    partial = [items for items in imap.commands if "<" in items]
+    assert partial == [
+        "(UID BODY.PEEK[2]<0.500>)", "(UID BODY.PEEK[2]<500.500>)", "(UID BODY.PEEK[2]<1000.500>)",
+    ]
+    assert "(UID BODY.PEEK[1])" in imap.commands
+    message.close()
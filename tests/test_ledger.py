@@ -0,0 +1,82 @@
+# tests/test_ledger.py
+
+import smtplib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.config import MailSource, settings
+from app.database import Base, engine
+from app.models.ledger import LedgerOutcome
+from app.services.email_processor import EmailJob, _record_outcome, mailbox_key, record_failure
+from app.services.ledger import PROCESS, SKIP, ProcessingLedger, RetryPolicy, decide
+from app.services.smtp_pool import SmtpDeliveryUncertain
+from app.services.source_scheduler import source_settings
+
+
+@pytest.fixture
+def ledger():
+    Base.metadata.create_all(bind=engine)
+    return ProcessingLedger(f"ledger-test-{datetime.now().timestamp()}", uid_validity=1, policy=RetryPolicy())
+
+
+def _job(uid: bytes, sending: bool) -> EmailJob:
+    job = EmailJob(index=0, uid=uid, message_id=f"<{uid.decode()}@example.com>", recipient_address="to@dest.example")
+    job.sending = sending
+    return job
+
+
+def test_send_failure_after_sending_record_stays_uncertain(ledger):
+    job = _job(b"1", sending=True)
+    record_failure(job, "send", SmtpDeliveryUncertain("Connection lost after DATA"))
+    _record_outcome(ledger, job)
+
+    entry = ledger.load([b"1"], {b"1": job.message_id})[b"1"]
+    assert entry.outcome == LedgerOutcome.SENDING
+    assert "Connection lost after DATA" in entry.error
+    now = datetime.now(timezone.utc)
+    assert decide(entry, RetryPolicy(), now) == SKIP
+    assert decide(entry, RetryPolicy(retry_uncertain_sends=True), now) == PROCESS
+
+
+def test_failure_before_sending_is_retried_on_the_failed_schedule(ledger):
+    job = _job(b"2", sending=False)
+    record_failure(job, "analyze", RuntimeError("Groq unavailable"))
+    _record_outcome(ledger, job)
+
+    entry = ledger.load([b"2"], {b"2": job.message_id})[b"2"]
+    assert (entry.outcome, entry.attempts) == (LedgerOutcome.FAILED, 1)
+    now = datetime.now(timezone.utc)
+    assert decide(entry, RetryPolicy(), now) == SKIP
+    assert decide(entry, RetryPolicy(), now + timedelta(hours=1)) == PROCESS
+
+
+def test_sent_message_stays_sent_when_flagging_fails(ledger):
+    job = _job(b"3", sending=True)
+    job.sent = True
+    record_failure(job, "flag", smtplib.SMTPException("unused"))
+    assert job.outcome == LedgerOutcome.SENT
+    assert job.log_entry.status == "Email sent successfully to to@dest.example; marking it as Seen failed."
+
+
+def test_only_one_run_claims_a_message(ledger):
+    other_run = ProcessingLedger(ledger.mailbox, uid_validity=1, policy=RetryPolicy())
+    assert ledger.claim(b"4", message_id="<4@example.com>")
+    assert not other_run.claim(b"4", message_id="<4@example.com>")
+
+    ledger.record(b"4", LedgerOutcome.SENT)
+    later_run = ProcessingLedger(ledger.mailbox, uid_validity=1, policy=RetryPolicy())
+    assert not later_run.claim(b"4")
+
+
+def test_uncertain_send_from_an_earlier_run_can_be_claimed_again(ledger):
+    ledger.record(b"5", LedgerOutcome.SENDING)
+    retry_run = ProcessingLedger(ledger.mailbox, uid_validity=1, policy=RetryPolicy(retry_uncertain_sends=True))
+    assert retry_run.claim(b"5")
+
+
+def test_a_source_on_the_default_inbox_shares_its_ledger_rows():
+    source = MailSource(name="support", folder="INBOX")
+    assert mailbox_key(source_settings(settings, source), source.folder) == mailbox_key(settings, "INBOX")
+    other = MailSource(name="billing", folder="INBOX", imap_user="billing@test.example")
+    assert mailbox_key(source_settings(settings, other), other.folder) != mailbox_key(settings, "INBOX")
@@ -0,0 +1,182 @@
+# tests/test_llm_client.py
+
+import asyncio
+import time
+
+import groq
+import pytest
+
+from app.config import settings
+from app.services.llm_client import AdaptiveConcurrency, LlmClient, TokenBucket, parse_reset_duration
+from benchmarks.corpus import RECIPIENT_DOMAIN
+from benchmarks.fake_groq import FakeGroq
+
+RECIPIENT = f"jane.doe@{RECIPIENT_DOMAIN}"
+MESSAGES = [{"role": "user", "content": f"Please send to {RECIPIENT}."}]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("120ms", 0.12),
+    ("1h2m", 3720.0),
+    ("3", 3.0),
+    ("0.5", 0.5),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_reset_duration(value, expected):
+    assert parse_reset_duration(value) == (pytest.approx(expected) if expected is not None else None)
+
+
+# --- Rate Limiting ---
+
+def test_token_bucket_allows_a_burst_then_paces_at_the_rate():
+    async def run():
+        bucket = TokenBucket(rate=20.0, capacity=2)
+        started = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(4):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert total >= 4 / 20.0 - 0.02
+
+
+def test_token_bucket_pause_and_set_rate():
+    async def run():
+        bucket = TokenBucket(rate=100.0, capacity=5)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return bucket, time.monotonic() - started
+
+    bucket, waited = asyncio.run(run())
+    assert waited >= 0.19
+    bucket.set_rate(1000.0)
+    assert bucket.rate == 100.0  # never above the configured rate
+    bucket.set_rate(0.0)
+    assert bucket.rate == 1.0  # nor below 1% of it
+    bucket.set_rate(40.0)
+    assert bucket.rate == 40.0
+
+
+def test_adaptive_concurrency_halves_on_throttle_and_grows_per_window():
+    concurrency = AdaptiveConcurrency(maximum=8, minimum=2)
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    concurrency.on_throttle()
+    concurrency.on_throttle()
+    assert concurrency.limit == 2  # not below the minimum
+
+    concurrency.on_success()
+    assert concurrency.limit == 2
+    concurrency.on_success()
+    assert concurrency.limit == 3  # one more after a full window of `limit` successes
+    for _ in range(3):
+        concurrency.on_success()
+    assert concurrency.limit == 4
+
+    for _ in range(100):
+        concurrency.on_success()
+    assert concurrency.limit == 8  # never above the maximum
+
+
+def test_adaptive_concurrency_caps_requests_in_flight():
+    async def run():
+        concurrency = AdaptiveConcurrency(maximum=4)
+        concurrency.on_throttle()
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with concurrency:
+                peak = max(peak, concurrency.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call() for _ in range(10)))
+        return peak, concurrency.in_flight
+
+    assert asyncio.run(run()) == (2, 0)
+
+
+# --- Client against the fake Groq endpoint ---
+
+@pytest.fixture
+def fake_groq():
+    servers = []
+
+    def start(**kwargs) -> FakeGroq:
+        server = FakeGroq(**{"latency_seconds": 0.0, "jitter_seconds": 0.0, **kwargs}).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(server: FakeGroq, **overrides) -> LlmClient:
+        client = LlmClient(settings.model_copy(update={
+            "GROQ_BASE_URL": server.base_url,
+            "LLM_REQUESTS_PER_MINUTE": 6000.0,
+            "LLM_MAX_CONCURRENCY": 4,
+            "LLM_BACKOFF_BASE_SECONDS": 0.01,
+            **overrides,
+        }))
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_client_retries_throttled_calls_after_retry_after(fake_groq, make_client):
+    server = fake_groq(throttle_every=2)  # every second request gets a 429 with retry-after 0.2
+    client = make_client(server)
+
+    started = time.monotonic()
+    answers = [client.complete(model="bench", messages=MESSAGES) for _ in range(3)]
+    elapsed = time.monotonic() - started
+
+    assert all(RECIPIENT in answer.choices[0].message.content for answer in answers)
+    assert server.requests == 5
+    stats = client.stats()
+    assert (stats["requests"], stats["throttled"], stats["retries"]) == (5, 2, 2)
+    assert "failed" not in stats
+    assert elapsed >= 2 * 0.2  # each retry waited at least retry-after
+    assert stats["concurrency_limit"] < 4  # halved by the 429s, not yet grown back
+    assert stats["rate_per_second"] == 100.0
+
+
+def test_client_gives_up_after_max_retries(fake_groq, make_client):
+    server = fake_groq(throttle_every=1)
+    client = make_client(server, LLM_MAX_RETRIES=2)
+
+    with pytest.raises(groq.RateLimitError):
+        client.complete(model="bench", messages=MESSAGES)
+
+    stats = client.stats()
+    assert (stats["requests"], stats["throttled"], stats["retries"], stats["failed"]) == (3, 3, 2, 1)
+    assert stats["concurrency_limit"] == 1
+
+
+def test_client_times_out_slow_calls(fake_groq, make_client):
+    server = fake_groq(latency_seconds=1.0)
+    client = make_client(server, LLM_TIMEOUT_SECONDS=0.1, LLM_MAX_RETRIES=1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        client.complete(model="bench", messages=MESSAGES)
+
+    stats = client.stats()
+    assert (stats["timeouts"], stats["retries"], stats["failed"]) == (2, 1, 1)
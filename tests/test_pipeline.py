@@ -0,0 +1,35 @@
+# tests/test_pipeline.py
+
+import os
+from dataclasses import dataclass
+
+from app.services.pipeline import Pipeline, Stage
+
+
+def square_or_crash(value: int) -> int:
+    """Stands in for a parse that takes its worker process down on one input."""
+    if value == 1:
+        os._exit(1)
+    return value * value
+
+
+@dataclass
+class Item:
+    value: int
+    result: int = None
+    done: bool = False
+
+
+def test_process_stage_recovers_after_a_worker_dies():
+    def square(item, run):
+        item.result = run(square_or_crash, item.value)
+
+    errors = []
+    pipeline = Pipeline(
+        [Stage("crash-test", square, workers=1, kind="process")],
+        on_error=lambda item, stage, error: errors.append(item.value),
+    )
+    results = pipeline.run(Item(value) for value in range(6))
+
+    assert errors == [1]
+    assert {item.value: item.result for item in results if item.value != 1} == {0: 0, 2: 4, 3: 9, 4: 16, 5: 25}
@@ -0,0 +1,41 @@
+# tests/test_recipient_extractor.py
+
+from app.services.recipient_extractor import extract_recipient
+
+SENDER = "alice@sender.example"
+SIGNATURE = "Thanks,\nAlice Smith\nACME Corp\n12 Sender Road\nSpringfield, IL 62704"
+
+
+def test_address_next_to_the_recipient_is_taken():
+    text = f"Email Body:\nPlease forward to: bob@client.example\nBob Jones\n7 Client Lane\nAustin, TX 78701\n\n{SIGNATURE}"
+    result = extract_recipient(text, [SENDER])
+    assert result.recipient_email == "bob@client.example"
+    assert result.physical_address == "Bob Jones, 7 Client Lane, Austin, TX 78701"
+    assert result.confidence == 1.0
+
+
+def test_signature_address_does_not_count_for_a_recipient_in_an_attachment():
+    text = (
+        f"Email Body:\nSee the attached letter.\n\n{SIGNATURE}\n\n"
+        f"--- Text from PDF 'letter.pdf' ---\nContact bob@client.example about the invoice.\n"
+    )
+    result = extract_recipient(text, [SENDER])
+    assert result.recipient_email == "bob@client.example"
+    assert result.physical_address is None
+    assert result.confidence < 0.8  # left to the LLM
+
+
+def test_quoted_reply_is_ignored():
+    text = (
+        "Email Body:\nSee below.\n\n"
+        "On Mon, 1 Jan 2024 at 10:00, Carol <carol@client.example> wrote:\n"
+        "> please call me\n>\n" + "\n".join(f"> {line}" for line in SIGNATURE.splitlines())
+    )
+    result = extract_recipient(text, [SENDER])
+    assert result.recipient_email is None
+    assert result.physical_address is None
+
+
+def test_wrapped_reply_header_is_ignored():
+    text = "Email Body:\nSee below.\n\nOn Mon, 1 Jan 2024 at 10:00, Carol\n<carol@client.example>\nwrote:\n> hi"
+    assert extract_recipient(text, [SENDER]).recipient_email is None
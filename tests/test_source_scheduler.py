@@ -0,0 +1,56 @@
+# tests/test_source_scheduler.py
+
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.config import MailSource, settings
+from app.database import Base, engine
+from app.metrics import EMAILS_PROCESSED
+from app.services.pipeline import shared_process_pool
+from app.services.source_scheduler import SourceScheduler, _init_worker
+from benchmarks.imap_server import ImapServer
+from benchmarks.smtp_sink import SmtpSink
+
+USER, PASSWORD = "sources@test.example", "secret"
+
+
+def raw_message(index: int) -> bytes:
+    return (
+        f"From: sender{index}@example.com\r\nTo: {USER}\r\nSubject: Message {index}\r\n"
+        f"Message-ID: <source-{index}@example.com>\r\n\r\n"
+        f"Please forward to: recipient{index}@dest.example\r\n12 Main Street\r\nSpringfield, IL 62704\r\n"
+    ).encode()
+
+
+@pytest.fixture
+def scheduler_settings():
+    Base.metadata.create_all(bind=engine)
+    imap = ImapServer({"INBOX": [raw_message(index) for index in range(3)]}, user=USER, password=PASSWORD).start()
+    smtp = SmtpSink().start()
+    yield settings.model_copy(update={
+        "IMAP_SERVER": "127.0.0.1", "IMAP_PORT": imap.port, "IMAP_SSL": False,
+        "IMAP_USER": USER, "IMAP_PASSWORD": PASSWORD,
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": smtp.port, "SMTP_STARTTLS": False,
+    })
+    imap.stop()
+    smtp.stop()
+
+
+def test_run_recovers_from_a_broken_pool_and_merges_worker_metrics(scheduler_settings):
+    # A pool whose worker died in an earlier run is still registered until someone notices.
+    broken = shared_process_pool("sources", 1, initializer=_init_worker, initargs=(scheduler_settings, 1))
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result(timeout=60)
+    sent_before = EMAILS_PROCESSED.snapshot().get(("sent",), 0)
+
+    results = []
+    scheduler = SourceScheduler(scheduler_settings, [MailSource(name="support")], processes=1, shard_size=2)
+    scheduler.run(results.append)
+
+    assert [result.status for result in results] == [
+        f"Email sent successfully to recipient{index}@dest.example." for index in range(3)
+    ]
+    assert all(result.source == "support" for result in results)
+    assert EMAILS_PROCESSED.snapshot()[("sent",)] - sent_before == 3  # recorded in the worker process